@@ -43,7 +43,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so latency covers the whole stack (see observability/metrics.py)
+    'observability.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Sampled per-request SQL profiling (see observability/profiling.py)
+    'observability.profiling.SQLProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,6 +56,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# SQL profiling: fraction of requests profiled (0 turns it off), and how many
+# repeats of one query shape in a request are reported as a likely N+1
+SQL_PROFILING_SAMPLE_RATE = 0
+SQL_PROFILING_N_PLUS_ONE_THRESHOLD = 5
+SQL_PROFILING_LOGGER = 'django_blog.sql'
+
+# Clients allowed to scrape /metrics/ (None allows everyone)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 ROOT_URLCONF = 'django_blog.urls'
 
 TEMPLATES = [
@@ -17,8 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from observability.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Prometheus scrape target
+    path('metrics/', metrics_view, name='metrics'),
     # Map all blog URLs (including auth) under the root path
     path('', include('blog.urls')),
 ]
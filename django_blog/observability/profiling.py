@@ -0,0 +1,216 @@
+# observability/profiling.py
+
+"""
+Per-request SQL profiling for the Django projects of this repository (see
+metrics.py about the per-project copies).
+
+SQLProfilingMiddleware samples SQL_PROFILING_SAMPLE_RATE of the requests.
+For a sampled request every query is timed through a database execute
+wrapper (no DEBUG needed) and fingerprinted, i.e. its literals and IN (...)
+lists are collapsed so `WHERE id = 1` and `WHERE id = 2` count as the same
+shape. The response then carries
+
+    Server-Timing: db;dur=12.4;desc="9 queries", app;dur=30.1
+
+and one structured log record (logger SQL_PROFILING_LOGGER) with the
+count, total DB time, the rendered template if any and the duplicated
+shapes. A shape repeated at least SQL_PROFILING_N_PLUS_ONE_THRESHOLD times
+is logged as a likely N+1, with the project frames (view, serializer,
+template tag, ...) that issued its first instance.
+
+Unsampled requests cost one random() call (none when the rate is 0) plus a
+context-variable lookup per query. Under ASGI the profile follows the
+request into the worker threads sync views and sync_to_async run in; rows
+read while a streaming response is being sent are not counted.
+"""
+
+import logging
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Frames of the code that issued a query, innermost last
+STACK_DEPTH = 6
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+
+
+def get_sample_rate():
+    return getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', 0.0)
+
+
+def get_threshold():
+    return getattr(settings, 'SQL_PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+
+
+def get_logger():
+    return logging.getLogger(getattr(settings, 'SQL_PROFILING_LOGGER', 'observability.sql'))
+
+
+def fingerprint(sql):
+    """The shape of a query: literals become ?, IN lists of any length become IN (...)."""
+    return _in_lists.sub('IN (...)', _literals.sub('?', sql))
+
+
+def project_stack():
+    """'module.py:function:line' for the innermost project frames (under BASE_DIR, outside site-packages)."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+    ]
+    return [
+        f'{frame.filename[len(base_dir) + 1:]}:{frame.name}:{frame.lineno}'
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+class QueryProfile:
+    """Queries recorded for one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.stacks = {}
+
+    def record(self, sql, duration):
+        shape = fingerprint(sql)
+        self.count += 1
+        self.duration += duration
+        self.shapes[shape] += 1
+        if shape not in self.stacks:
+            self.stacks[shape] = project_stack()
+
+    def duplicates(self):
+        return {shape: count for shape, count in self.shapes.most_common() if count > 1}
+
+    def n_plus_one(self, threshold):
+        return {shape: count for shape, count in self.shapes.most_common() if count >= threshold}
+
+
+# Profile of the request being handled. A context variable rather than a
+# thread-local so it follows sync views that ASGI runs in a worker thread.
+_current_profile = ContextVar('sql_profile', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; a no-op unless a request is sampled."""
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_all():
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+connection_created.connect(install)
+
+
+class SQLProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_all()
+
+    def sampled(self):
+        rate = get_sample_rate()
+        return rate and random.random() < rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        install_all()
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    def finish(self, request, response, profile, elapsed):
+        db_ms, app_ms = profile.duration * 1000, elapsed * 1000
+        timing = f'db;dur={db_ms:.1f};desc="{profile.count} queries", app;dur={app_ms:.1f}'
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+        self.report(request, response, profile, db_ms, app_ms)
+        return response
+
+    def report(self, request, response, profile, db_ms, app_ms):
+        match = request.resolver_match
+        view = match.view_name if match else None
+        template = getattr(response, 'template_name', None)
+        suspects = profile.n_plus_one(get_threshold())
+        logger = get_logger()
+
+        logger.info(
+            '%s %s -> %s: %d queries in %.1fms',
+            request.method, request.path, response.status_code, profile.count, db_ms,
+            extra={'sql_profile': {
+                'view': view,
+                'template': template,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': profile.count,
+                'db_ms': round(db_ms, 2),
+                'app_ms': round(app_ms, 2),
+                'duplicates': profile.duplicates(),
+            }},
+        )
+        for shape, count in suspects.items():
+            logger.warning(
+                'Possible N+1 in %s: query shape repeated %d times: %s',
+                view, count, shape,
+                extra={'sql_n_plus_one': {
+                    'view': view,
+                    'template': template,
+                    'count': count,
+                    'query': shape,
+                    'stack': profile.stacks.get(shape, []),
+                }},
+            )
@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.core.signals import request_finished, request_started
+        from django.db.models.signals import post_delete, post_save
+        from rest_framework.authtoken.models import Token
+
+        from .authentication import token_changed, user_saved
+        from .backends import begin_request, run_deferred
+
+        # Cached token snapshots go stale on deactivation, rotation and logout
+        post_save.connect(user_saved, sender=get_user_model(), dispatch_uid='accounts.auth.user_saved')
+        post_save.connect(token_changed, sender=Token, dispatch_uid='accounts.auth.token_saved')
+        post_delete.connect(token_changed, sender=Token, dispatch_uid='accounts.auth.token_deleted')
+
+        # Outdated password hashes are upgraded once the login's response is sent
+        request_started.connect(begin_request, dispatch_uid='accounts.rehash.begin_request')
+        request_finished.connect(run_deferred, dispatch_uid='accounts.rehash.run_deferred')
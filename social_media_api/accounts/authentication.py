@@ -0,0 +1,234 @@
+# accounts/authentication.py
+
+"""
+Token authentication without the per-request Token + user join.
+
+CachedTokenAuthentication resolves a token key to a snapshot of the user's
+fields in two tiers:
+
+    1. a per-process LRU (AUTH_TOKEN_CACHE_SIZE keys, each kept at most
+       AUTH_TOKEN_CACHE_TTL seconds)
+    2. the shared cache (AUTH_TOKEN_CACHE_ALIAS), so other processes skip the
+       database as well
+
+and only falls back to the database on a miss in both. Keys are hashed
+before they are used as cache keys. The counter columns and the password
+hash are left out of the snapshot; reading them on request.user loads
+them from the database.
+
+Invalidation is versioned like the follow graph cache: every user has a
+version under accounts:auth:<id> and entries of either tier are only used
+while the version they were stored with is current, which costs one cache
+read per request. The version is bumped when the user is saved (deactivated,
+password changed, profile edited) and when one of their tokens is created
+or deleted (rotation, logout). Changes made with QuerySet.update() bypass
+this; call invalidate_user() after them.
+
+A miss in both tiers costs one query (the token joined to its user), and a
+login primes both tiers with the token it returns (prime_token).
+
+Both tiers need the version keys to be seen by every worker, so they are
+only used when AUTH_TOKEN_CACHE_ALIAS is a shared backend
+(social_media_api.caching.is_shared); otherwise every request is
+authenticated like TokenAuthentication does.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from social_media_api.caching import is_shared
+
+# Not cached: they change outside save() or are only needed to log in
+UNCACHED_FIELDS = {'password', 'followers_count', 'following_count'}
+
+
+def get_alias():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_alias()]
+
+
+def is_enabled():
+    return is_shared(get_alias())
+
+
+def get_timeout():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+
+
+def version_key(user_id):
+    return f'accounts:auth:{user_id}'
+
+
+def token_cache_key(digest):
+    return f'accounts:token:{digest}'
+
+
+def digest_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def snapshot_fields():
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname not in UNCACHED_FIELDS
+    ]
+
+
+def get_version(user_id):
+    cache = get_cache()
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+class TokenSnapshotCache:
+    """
+    Per-process LRU of token digest -> (expires_at, user_id, version, values).
+    Hits don't extend an entry's lifetime.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[1:]
+
+    def set(self, digest, user_id, version, values):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + get_timeout(), user_id, version, values)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_tokens = TokenSnapshotCache()
+
+
+def invalidate_user(user_id):
+    """Make every cached token of `user_id` stale, in every process."""
+    cache = get_cache()
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        # No version yet: nothing can have been cached under one
+        pass
+
+
+def invalidate_user_on_commit(user_id):
+    # Only once the change is visible, so a reader can't re-cache the old row
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+def build_user(values):
+    model = get_user_model()
+    fields = snapshot_fields()
+    return model.from_db(router.db_for_read(model), fields, [values[name] for name in fields])
+
+
+def store_token(key, user, version=None):
+    """Cache `key` -> a snapshot of `user` in both tiers."""
+    if version is None:
+        version = get_version(user.pk)
+    digest = digest_key(key)
+    values = {name: getattr(user, name) for name in snapshot_fields()}
+    get_cache().set(token_cache_key(digest), (user.pk, version, values), timeout=get_timeout())
+    local_tokens.set(digest, user.pk, version, values)
+
+
+def prime_token(key, user):
+    """Cache a token just handed out (login), once the transaction creating it has committed."""
+    if is_enabled():
+        transaction.on_commit(lambda: store_token(key, user))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication. request.auth is an unsaved
+    Token carrying the key and user.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_enabled():
+            return super().authenticate_credentials(key)
+
+        digest = digest_key(key)
+        local = local_tokens.get(digest)
+        cached = local or get_cache().get(token_cache_key(digest))
+        version = None
+        if cached is not None:
+            user_id, cached_version, values = cached
+            # A token never changes owner, so a stale entry still names the user.
+            # Read the version before the row: a write that commits after this
+            # read bumps it, which makes the entry stored below stale rather than wrong
+            version = get_version(user_id)
+            if version == cached_version:
+                if local is None:
+                    local_tokens.set(digest, user_id, version, values)
+                return self.credentials(key, values)
+
+        return self.load_credentials(key, version)
+
+    def load_credentials(self, key, version=None):
+        # One query: the token joined to the snapshot fields of its user
+        fields = snapshot_fields()
+        try:
+            token = (
+                Token.objects.select_related('user')
+                .only('key', 'user', *(f'user__{name}' for name in fields))
+                .get(key=key)
+            )
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        # With nothing cached the owner is only known now, so the version is read
+        # after the row; the entry then stays at most AUTH_TOKEN_CACHE_TTL seconds
+        store_token(key, token.user, version)
+        return token.user, token
+
+    def credentials(self, key, values):
+        user = build_user(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, Token(key=key, user=user)
+
+
+# --- Invalidation hooks (connected in AccountsConfig.ready) ---
+
+def user_saved(sender, instance, **kwargs):
+    invalidate_user_on_commit(instance.pk)
+
+
+def token_changed(sender, instance, **kwargs):
+    invalidate_user_on_commit(instance.user_id)
@@ -0,0 +1,100 @@
+# accounts/backends.py
+
+"""
+Authentication backend that upgrades outdated password hashes off the
+login path.
+
+Django's ModelBackend re-hashes a password that was stored with another
+algorithm or cost inside the login request: a second full-cost hash plus an
+UPDATE, paid by whoever logs in right after a policy change (i.e. everyone,
+at once). RehashingModelBackend verifies without that and hands the upgrade
+to PASSWORD_REHASH:
+
+    'deferred' - re-hashed by the request's own thread once the response has
+                 been sent (request_finished); several logins of one user
+                 in a request are re-hashed once (default)
+    'sync'     - inline, like ModelBackend (tests, debugging)
+    'off'      - never
+
+The plaintext password only lives in the request's own context until then,
+never in a queue other threads read. Outside a request (shell, management
+commands) a deferred upgrade runs right away.
+
+The upgrade only replaces the hash it was computed from, so it never
+overwrites a password changed in the meantime.
+"""
+
+import logging
+
+from asgiref.local import Local
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+
+from .hashers import needs_rehash
+
+logger = logging.getLogger(__name__)
+
+# Per request (and per async task): {user_id: (encoded, password)} to upgrade
+_deferred = Local()
+
+
+def get_rehash_mode():
+    return getattr(settings, 'PASSWORD_REHASH', 'deferred')
+
+
+class RehashingModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            make_password(password)
+            return None
+
+        if not (check_password(password, user.password) and self.user_can_authenticate(user)):
+            return None
+        if needs_rehash(user.password):
+            schedule_rehash(user.pk, user.password, password)
+        return user
+
+
+def rehash(user_id, encoded, password):
+    """Store `password` with the current policy unless the hash changed. Returns True if updated."""
+    return get_user_model()._default_manager.filter(pk=user_id, password=encoded).update(
+        password=make_password(password)
+    ) > 0
+
+
+def schedule_rehash(user_id, encoded, password):
+    mode = get_rehash_mode()
+    if mode == 'off':
+        return
+    jobs = getattr(_deferred, 'jobs', None)
+    if mode == 'sync' or jobs is None:
+        rehash(user_id, encoded, password)
+        return
+    jobs.setdefault(user_id, (encoded, password))
+
+
+# --- Request hooks (connected in AccountsConfig.ready) ---
+
+def begin_request(**kwargs):
+    _deferred.jobs = {}
+
+
+def run_deferred(**kwargs):
+    """Run the upgrades deferred by this request, now that its response was sent."""
+    jobs = getattr(_deferred, 'jobs', None)
+    _deferred.jobs = None
+    for user_id, (encoded, password) in (jobs or {}).items():
+        try:
+            rehash(user_id, encoded, password)
+        except Exception:
+            logger.exception('Password rehash failed for user %s', user_id)
@@ -0,0 +1,166 @@
+# accounts/cache.py
+
+"""
+Per-process cache of the follow graph.
+
+Each user's followee ids are kept as a sorted array('q') (8 bytes per edge,
+no per-int object overhead), so membership is a binary search and
+intersections never touch the database.
+
+Invalidation is versioned like the post payload cache: every user has a
+version number under accounts:following:<id> in FOLLOW_GRAPH_CACHE_ALIAS,
+and the follow write path bumps it after commit. A process reuses its local
+array only while the version it was loaded under is still current, so one
+cheap cache read replaces the Follow query on the hot paths. Local entries
+are bounded with LRU eviction (FOLLOW_GRAPH_CACHE_SIZE users) and expire
+FOLLOW_GRAPH_CACHE_TTL seconds after they were loaded, whatever the version
+says.
+
+The versions only reach other workers when the alias is shared between
+processes (social_media_api.caching.is_shared). With a process-local alias
+nothing is kept and every lookup reads the Follow rows.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from observability.metrics import observe_cache
+from social_media_api.caching import is_shared
+
+
+def get_alias():
+    return getattr(settings, 'FOLLOW_GRAPH_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_alias()]
+
+
+def get_timeout():
+    return getattr(settings, 'FOLLOW_GRAPH_CACHE_TTL', 300)
+
+
+def get_max_users():
+    return getattr(settings, 'FOLLOW_GRAPH_CACHE_SIZE', 10000)
+
+
+def version_key(user_id):
+    return f'accounts:following:{user_id}'
+
+
+class FollowingSet:
+    """Read-only view of a user's followee ids over a sorted array('q')."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __contains__(self, user_id):
+        i = bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def intersection(self, other):
+        """
+        Sorted list of ids in both this set and `other` (a FollowingSet or any
+        iterable of ids). Probes the larger side with binary search, so the
+        cost is O(m log n) for m the smaller side.
+        """
+        if not isinstance(other, FollowingSet):
+            other = FollowingSet(array('q', sorted(set(other))))
+        small, large = sorted((self, other), key=len)
+        return [user_id for user_id in small if user_id in large]
+
+
+class FollowGraphCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> (expires_at, version, array('q')), most recently used last
+        self._entries = OrderedDict()
+
+    def get_version(self, user_id):
+        cache = get_cache()
+        key = version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            version = time.time_ns()
+            # add() keeps whichever process initialised the version first
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        return version
+
+    def get_following(self, user_id):
+        if not is_shared(get_alias()):
+            observe_cache('follow_graph', 0, 1)
+            return FollowingSet(array('q', load_following_ids(user_id)))
+
+        version = self.get_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == version and entry[0] >= time.monotonic():
+                self._entries.move_to_end(user_id)
+                observe_cache('follow_graph', 1, 0)
+                return FollowingSet(entry[2])
+
+        observe_cache('follow_graph', 0, 1)
+        ids = array('q', load_following_ids(user_id))
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + get_timeout(), version, ids)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > get_max_users():
+                self._entries.popitem(last=False)
+        return FollowingSet(ids)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        cache = get_cache()
+        key = version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No version yet (or it was evicted): start a fresh one
+            cache.set(key, time.time_ns(), timeout=None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def load_following_ids(user_id):
+    from .models import Follow
+
+    # Range scan on the (follower, followee) unique index, already sorted
+    return (
+        Follow.objects.filter(follower_id=user_id)
+        .order_by('followee_id')
+        .values_list('followee_id', flat=True)
+    )
+
+
+follow_graph = FollowGraphCache()
+
+
+def get_following(user_id):
+    """FollowingSet of the ids `user_id` follows."""
+    return follow_graph.get_following(user_id)
+
+
+def invalidate_following(user_id):
+    follow_graph.invalidate(user_id)
@@ -0,0 +1,95 @@
+# accounts/graph.py
+
+"""
+Writes to the follow graph.
+
+Every follow/unfollow goes through follow_users() / unfollow_users(), which
+take a list of target ids so the single and bulk endpoints share one path:
+one query to find the existing edges, one bulk write for the edges, and one
+UPDATE per counter column, however many users are (un)followed. After
+commit the follower's cached followee array (accounts/cache.py) is
+invalidated.
+
+The edge check reads the database, not the cache, with the follower's row
+locked (SELECT ... FOR UPDATE) for the transaction: two requests following
+or unfollowing for the same user run one after the other, so the second
+sees the first one's edges and the counters only move by the edges that
+were really added or removed.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from notifications.pipeline import Event, notify, retract_events
+from posts.timeline import backfill_timeline, prune_timeline
+from .cache import invalidate_following
+from .models import CustomUser, Follow
+
+
+def lock_follower(user):
+    # Serializes this user's follow writes until the transaction ends
+    list(CustomUser.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+
+def follow_users(user, followee_ids):
+    """
+    Make `user` follow every user in `followee_ids` that exists, isn't
+    `user` and isn't already followed. Returns the newly followed users.
+    """
+    candidates = set(followee_ids) - {user.pk}
+    with transaction.atomic():
+        lock_follower(user)
+        already = set(
+            Follow.objects.filter(follower=user, followee_id__in=candidates).values_list('followee_id', flat=True)
+        )
+        followees = list(CustomUser.objects.filter(pk__in=candidates - already).only('pk', 'username'))
+        if not followees:
+            return []
+
+        Follow.objects.bulk_create(
+            [Follow(follower=user, followee=followee) for followee in followees],
+            ignore_conflicts=True
+        )
+        # Keep the denormalized follow counters in step with the edges
+        new_ids = [followee.pk for followee in followees]
+        CustomUser.objects.filter(pk=user.pk).update(following_count=F('following_count') + len(new_ids))
+        CustomUser.objects.filter(pk__in=new_ids).update(followers_count=F('followers_count') + 1)
+        for followee in followees:
+            notify(followee, user, "followed", followee)
+        transaction.on_commit(lambda: invalidate_following(user.pk))
+
+    # Seed the follower's home timeline with the new followees' recent posts
+    backfill_timeline(user, new_ids)
+    return followees
+
+
+def unfollow_users(user, followee_ids):
+    """
+    Remove `user`'s follow edges to `followee_ids`, and their follow
+    notifications. Returns the ids that were actually unfollowed.
+    """
+    with transaction.atomic():
+        lock_follower(user)
+        edges = Follow.objects.filter(follower=user, followee_id__in=set(followee_ids))
+        removed_ids = list(edges.values_list('followee_id', flat=True))
+        if not removed_ids:
+            return []
+
+        edges.delete()
+        CustomUser.objects.filter(pk=user.pk).update(
+            # Clamp at zero in case the counter had drifted below the real edge count
+            following_count=Case(
+                When(following_count__gte=len(removed_ids), then=F('following_count') - len(removed_ids)),
+                default=Value(0)
+            )
+        )
+        CustomUser.objects.filter(pk__in=removed_ids, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+        content_type_id = ContentType.objects.get_for_model(CustomUser).pk
+        retract_events([
+            Event(followee_id, user.pk, "followed", content_type_id, followee_id) for followee_id in removed_ids
+        ])
+        transaction.on_commit(lambda: invalidate_following(user.pk))
+
+    prune_timeline(user, removed_ids)
+    return removed_ids
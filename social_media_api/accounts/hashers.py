@@ -0,0 +1,128 @@
+# accounts/hashers.py
+
+"""
+Password hashing policy.
+
+PASSWORD_HASH_ALGORITHM picks the hasher new passwords are stored with
+('argon2', 'bcrypt' or 'pbkdf2'; argon2 when argon2-cffi is installed,
+otherwise pbkdf2). The other hashers stay enabled so existing hashes keep
+verifying, and are upgraded at the next login (see accounts/backends.py).
+
+The cost of each algorithm comes from PASSWORD_HASH_COSTS instead of the
+Django defaults, e.g.
+
+    PASSWORD_HASH_COSTS = {
+        'argon2': {'time_cost': 3, 'memory_cost': 65536, 'parallelism': 1},
+        'bcrypt': {'rounds': 12},
+        'pbkdf2': {'iterations': 1_000_000},
+    }
+
+Pick the values with `python manage.py calibrate_password_hashers
+--target-ms 100` on production hardware: the highest cost that stays within
+the login latency budget. Hashes made with another cost count as outdated
+and are upgraded the same way.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+ALGORITHMS = ('argon2', 'bcrypt', 'pbkdf2')
+
+
+def get_cost(algorithm, name, default):
+    return getattr(settings, 'PASSWORD_HASH_COSTS', {}).get(algorithm, {}).get(name, default)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return get_cost('argon2', 'time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return get_cost('argon2', 'memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return get_cost('argon2', 'parallelism', hashers.Argon2PasswordHasher.parallelism)
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return get_cost('bcrypt', 'rounds', hashers.BCryptSHA256PasswordHasher.rounds)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return get_cost('pbkdf2', 'iterations', hashers.PBKDF2PasswordHasher.iterations)
+
+
+def needs_rehash(encoded):
+    """True if `encoded` wasn't made by the preferred hasher with its current cost."""
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+# --- Calibration ---
+
+class Costed:
+    """A hasher instance with the cost parameters overridden."""
+
+    def __init__(self, hasher_class, **params):
+        self.hasher = type(hasher_class.__name__, (hasher_class,), params)()
+
+    def time_ms(self, repeat=3):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.hasher.encode('calibration-password', self.hasher.salt())
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+
+def calibrate(algorithm, target_ms):
+    """
+    The highest cost for `algorithm` whose hash takes at most `target_ms` here.
+    Returns (params, measured_ms).
+    """
+    if algorithm == 'pbkdf2':
+        # Linear in the iteration count: measure once, then scale
+        probe = 100_000
+        ms = Costed(hashers.PBKDF2PasswordHasher, iterations=probe).time_ms()
+        iterations = max(int(probe * target_ms / ms) // 10_000 * 10_000, 10_000)
+        return {'iterations': iterations}, Costed(hashers.PBKDF2PasswordHasher, iterations=iterations).time_ms()
+
+    if algorithm == 'bcrypt':
+        # Every extra round doubles the work
+        rounds, ms = 4, Costed(hashers.BCryptSHA256PasswordHasher, rounds=4).time_ms()
+        while rounds < 31:
+            next_ms = Costed(hashers.BCryptSHA256PasswordHasher, rounds=rounds + 1).time_ms()
+            if next_ms > target_ms:
+                break
+            rounds, ms = rounds + 1, next_ms
+        return {'rounds': rounds}, ms
+
+    if algorithm == 'argon2':
+        # Keep the configured memory and lanes; spend the budget on passes
+        memory_cost = get_cost('argon2', 'memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+        parallelism = get_cost('argon2', 'parallelism', hashers.Argon2PasswordHasher.parallelism)
+        params = {'time_cost': 1, 'memory_cost': memory_cost, 'parallelism': parallelism}
+        ms = Costed(hashers.Argon2PasswordHasher, **params).time_ms()
+        while True:
+            candidate = dict(params, time_cost=params['time_cost'] + 1)
+            next_ms = Costed(hashers.Argon2PasswordHasher, **candidate).time_ms()
+            if next_ms > target_ms:
+                break
+            params, ms = candidate, next_ms
+        return params, ms
+
+    raise ValueError(f"Unknown algorithm {algorithm!r}; expected one of {', '.join(ALGORITHMS)}.")
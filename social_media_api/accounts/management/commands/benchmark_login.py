@@ -0,0 +1,83 @@
+# accounts/management/commands/benchmark_login.py
+
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.hashers import Costed
+from accounts.models import CustomUser
+
+PASSWORD = 'benchmark-Pa55word'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login latency and throughput through the login endpoint with the "
+        "current password hashing policy. Users are created and removed again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50,
+                            help='Measured logins (default: 50).')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Distinct accounts the logins rotate over (default: 10).')
+        parser.add_argument('--outdated', action='store_true',
+                            help='Store the passwords with 10k-iteration PBKDF2, as after a policy change, '
+                                 'so every login finds an outdated hash to upgrade.')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['users'] < 1:
+            raise CommandError('--logins and --users must be at least 1.')
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                with transaction.atomic():
+                    timings = self.run(options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+        timings.sort()
+        total = sum(timings)
+        hasher = get_hasher('default')
+        self.stdout.write(f'{hasher.algorithm}: {options["logins"]} logins, {len(timings) / total:.1f} logins/s')
+        self.stdout.write(
+            f'p50 {self.percentile(timings, 50):.1f}ms   p95 {self.percentile(timings, 95):.1f}ms   '
+            f'p99 {self.percentile(timings, 99):.1f}ms   mean {statistics.mean(timings) * 1000:.1f}ms'
+        )
+
+    def run(self, options):
+        if options['outdated']:
+            outdated = Costed(PBKDF2PasswordHasher, iterations=10_000).hasher
+            password = outdated.encode(PASSWORD, outdated.salt())
+        else:
+            password = make_password(PASSWORD)
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f'login_benchmark_{i}', password=password) for i in range(options['users'])
+        )
+
+        client = APIClient()
+        url = reverse('login')
+        timings = []
+        for i in range(options['logins']):
+            started = time.perf_counter()
+            response = client.post(url, {'username': users[i % len(users)].username, 'password': PASSWORD}, secure=True)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'Login failed with {response.status_code}: {response.content[:200]!r}')
+        return timings
+
+    def percentile(self, timings, percent):
+        index = min(len(timings) - 1, int(len(timings) * percent / 100))
+        return timings[index] * 1000
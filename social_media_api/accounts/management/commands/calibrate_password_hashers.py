@@ -0,0 +1,42 @@
+# accounts/management/commands/calibrate_password_hashers.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import hashers
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the password hashers on this machine and print the highest "
+        "cost per algorithm that hashes within --target-ms, as PASSWORD_HASH_COSTS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100.0,
+                            help='Time budget for one hash in milliseconds (default: 100).')
+        parser.add_argument('--algorithm', action='append', dest='algorithms', choices=hashers.ALGORITHMS,
+                            help='Only calibrate this algorithm (repeatable; default: all).')
+
+    def handle(self, *args, **options):
+        if options['target_ms'] <= 0:
+            raise CommandError('--target-ms must be positive.')
+
+        costs = {}
+        for algorithm in options['algorithms'] or hashers.ALGORITHMS:
+            try:
+                params, ms = hashers.calibrate(algorithm, options['target_ms'])
+            except ValueError as exc:
+                # Optional libraries (argon2-cffi, bcrypt) may be missing
+                self.stderr.write(f'{algorithm}: skipped ({exc})')
+                continue
+            current = settings.PASSWORD_HASH_COSTS.get(algorithm, {})
+            self.stdout.write(f'{algorithm:<7} {ms:>8.1f}ms  {params}  (configured: {current or "Django default"})')
+            costs[algorithm] = params
+
+        if not costs:
+            raise CommandError('No hasher could be measured.')
+        self.stdout.write('\nPASSWORD_HASH_COSTS = {')
+        for algorithm, params in costs.items():
+            self.stdout.write(f'    {algorithm!r}: {params!r},')
+        self.stdout.write('}')
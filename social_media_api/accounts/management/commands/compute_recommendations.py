@@ -0,0 +1,38 @@
+# accounts/management/commands/compute_recommendations.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the precomputed \"who to follow\" candidates for every user "
+        "from common neighbours in the follow graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Candidates stored per user (default: RECOMMENDATION_TOP_K).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Users written per transaction (default: 1000).')
+        parser.add_argument('--no-numpy', action='store_true',
+                            help='Use the pure-Python walk even if NumPy is installed.')
+
+    def handle(self, *args, **options):
+        use_numpy = False if options['no_numpy'] else None
+        if options['top_k'] is not None and options['top_k'] < 1:
+            raise CommandError('--top-k must be at least 1.')
+
+        started = time.monotonic()
+        users, rows = recommendations.compute_recommendations(
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+            use_numpy=use_numpy,
+        )
+        engine = 'numpy' if use_numpy is not False and recommendations.np is not None else 'python'
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} recommendation(s) for {users} user(s) in {time.monotonic() - started:.2f}s ({engine}).'
+        ))
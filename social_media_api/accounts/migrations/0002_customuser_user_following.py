@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='user_following',
+            field=models.ManyToManyField(blank=True, related_name='users_following_me', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
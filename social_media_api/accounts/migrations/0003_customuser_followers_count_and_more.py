@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_customuser_user_following'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
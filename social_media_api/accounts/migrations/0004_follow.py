@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def copy_edges_to_follow(apps, schema_editor):
+    """
+    Fold both old self-M2Ms into Follow. An edge stored in both tables is
+    written once; self-follows are dropped.
+    """
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Follow = apps.get_model('accounts', 'Follow')
+
+    def edges():
+        # user.followers.add(x) stored (from=user, to=x), meaning x follows user
+        rows = CustomUser.followers.through.objects.values_list('to_customuser_id', 'from_customuser_id')
+        yield from rows.iterator(chunk_size=BATCH_SIZE)
+        # user.user_following.add(x) stored (from=user, to=x), meaning user follows x
+        rows = CustomUser.user_following.through.objects.values_list('from_customuser_id', 'to_customuser_id')
+        yield from rows.iterator(chunk_size=BATCH_SIZE)
+
+    batch = []
+    for follower_id, followee_id in edges():
+        if follower_id == followee_id:
+            continue
+        batch.append(Follow(follower_id=follower_id, followee_id=followee_id))
+        if len(batch) >= BATCH_SIZE:
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Follow.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def copy_edges_to_m2m(apps, schema_editor):
+    """Reverse: put every Follow edge back into user_following."""
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Follow = apps.get_model('accounts', 'Follow')
+    Through = CustomUser.user_following.through
+
+    batch = []
+    for follower_id, followee_id in Follow.objects.values_list('follower_id', 'followee_id').iterator(chunk_size=BATCH_SIZE):
+        batch.append(Through(from_customuser_id=follower_id, to_customuser_id=followee_id))
+        if len(batch) >= BATCH_SIZE:
+            Through.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Through.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_followers_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('followee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follower_edges', to=settings.AUTH_USER_MODEL)),
+                ('follower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='following_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'followee'), name='follow_unique_edge'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(condition=models.Q(('follower', models.F('followee')), _negated=True), name='follow_not_self'),
+        ),
+        migrations.RunPython(copy_edges_to_follow, copy_edges_to_m2m),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='followers',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='user_following',
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following',
+            field=models.ManyToManyField(blank=True, related_name='followers', through='accounts.Follow', through_fields=('follower', 'followee'), to=settings.AUTH_USER_MODEL),
+        ),
+    ]
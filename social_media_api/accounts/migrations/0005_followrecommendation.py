@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'rank'], name='recommendation_user_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'candidate'), name='recommendation_unique_candidate')],
+            },
+        ),
+    ]
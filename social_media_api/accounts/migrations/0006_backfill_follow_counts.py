@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 10000
+
+
+def backfill_follow_counts(apps, schema_editor):
+    """
+    Set followers_count/following_count from the Follow edges. 0003 added the
+    columns at 0 and 0004 copied the edges without counting them.
+    """
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Follow = apps.get_model('accounts', 'Follow')
+
+    followers = Follow.objects.filter(followee=OuterRef('pk')).order_by().values('followee').annotate(total=Count('pk')).values('total')
+    following = Follow.objects.filter(follower=OuterRef('pk')).order_by().values('follower').annotate(total=Count('pk')).values('total')
+
+    # One UPDATE per range of ids, so no single statement locks the whole table
+    last_pk = CustomUser.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last_pk + 1, BATCH_SIZE):
+        CustomUser.objects.filter(pk__gte=start, pk__lt=start + BATCH_SIZE).update(
+            followers_count=Coalesce(Subquery(followers), 0),
+            following_count=Coalesce(Subquery(following), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_followrecommendation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -1,28 +1,109 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 
+from .cache import get_following
+
 # Create your models here.
 class CustomUser(AbstractUser):
     bio = models.TextField(max_length=500, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
 
-    # ManyToMany field referencing itself, symmetrical=False for unidirectional following
-    followers = models.ManyToManyField(
+    # The follow graph: one Follow row per edge, symmetrical=False for unidirectional following
+    following = models.ManyToManyField(
         'self',
+        through='Follow',
+        through_fields=('follower', 'followee'),
         symmetrical=False,
-        related_name='following', # Reverse relationship: user.following lists who the user follows
+        related_name='followers', # Reverse relationship: user.followers lists who follows the user
         blank=True
     )
 
-    user_following = models.ManyToManyField(
-        'self', 
-        symmetrical=False, 
-        related_name='users_following_me', # The reverse relationship (who follows this user)
-        blank=True
-    )
+    # Denormalized follow counters, updated with F() expressions by the follow
+    # views and repaired by the reconcile_counters management command
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def is_following(self, user):
-        return self.following.filter(pk=user.pk).exists()
+        # Binary search in the cached followee array (see accounts/cache.py)
+        return user.pk in get_following(self.pk)
+
+    def get_following(self):
+        """Cached, sorted followee ids supporting `in` and intersection()."""
+        return get_following(self.pk)
+
+    def get_following_ids(self):
+        """Return the set of user IDs this user follows."""
+        return set(get_following(self.pk))
+
+    def get_follower_ids(self):
+        """Return the set of user IDs following this user."""
+        return set(Follow.objects.filter(followee=self).values_list('follower_id', flat=True))
+
+    def __str__(self):
+        return self.username
+
+
+class Follow(models.Model):
+    """
+    A follow edge: `follower` follows `followee`.
+    Indexed in both directions so "who do I follow" (feeds) and
+    "who follows me" (fan-out, follower lists) are both index range scans.
+    """
+    follower = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='following_edges'
+    )
+    followee = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='follower_edges'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also serves as the (follower, followee) index
+            models.UniqueConstraint(fields=['follower', 'followee'], name='follow_unique_edge'),
+            models.CheckConstraint(condition=~models.Q(follower=models.F('followee')), name='follow_not_self'),
+        ]
+        indexes = [
+            models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} follows {self.followee_id}"
+
+
+class FollowRecommendation(models.Model):
+    """
+    Precomputed "who to follow" candidate for a user, written by the
+    compute_recommendations command (see accounts/recommendations.py).
+    `score` is the number of the user's followees who follow the candidate.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='follow_recommendations'
+    )
+    candidate = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'candidate'], name='recommendation_unique_candidate'),
+        ]
+        indexes = [
+            # Serving reads one user's list in rank order
+            models.Index(fields=['user', 'rank'], name='recommendation_user_rank_idx'),
+        ]
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return f"{self.candidate_id} for {self.user_id} ({self.score})"
@@ -0,0 +1,164 @@
+# accounts/recommendations.py
+
+"""
+"Who to follow" recommendations from common neighbours.
+
+For a user U, every account followed by someone U follows is a candidate,
+scored by how many of U's followees follow it (friends of friends). Accounts
+U already follows, and U itself, are excluded. The top RECOMMENDATION_TOP_K
+candidates per user are stored in FollowRecommendation by
+
+    python manage.py compute_recommendations
+
+so the endpoint only reads a handful of precomputed rows.
+
+The whole edge list is loaded once as two parallel int64 arrays sorted by
+(follower, followee), i.e. a CSR adjacency: the followees of any user are one
+contiguous, sorted slice found with a binary search. With NumPy installed the
+two-hop walk, the exclusion (sorted-array membership) and the counting are
+vectorized per user; without it the same walk runs over the arrays in pure
+Python.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Follow, FollowRecommendation
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+
+def get_top_k():
+    return getattr(settings, 'RECOMMENDATION_TOP_K', 20)
+
+
+def load_edges(chunk_size=10000):
+    """(followers, followees) as parallel array('q'), sorted by follower then followee."""
+    followers, followees = array('q'), array('q')
+    edges = Follow.objects.order_by('follower_id', 'followee_id').values_list('follower_id', 'followee_id')
+    for follower_id, followee_id in edges.iterator(chunk_size=chunk_size):
+        followers.append(follower_id)
+        followees.append(followee_id)
+    return followers, followees
+
+
+def top_candidates(ids, counts, k):
+    """The k (id, count) pairs with the highest count, ties broken by lower id."""
+    return heapq.nsmallest(k, zip(ids, counts), key=lambda item: (-item[1], item[0]))
+
+
+def iter_recommendations_python(followers, followees, k):
+    """Yield (user_id, [(candidate_id, score), ...]) using only the standard library."""
+    start = 0
+    while start < len(followers):
+        user_id = followers[start]
+        end = bisect_right(followers, user_id, lo=start)
+        following = followees[start:end]
+
+        counts = Counter()
+        for followee_id in following:
+            lo = bisect_left(followers, followee_id)
+            hi = bisect_right(followers, followee_id, lo=lo)
+            counts.update(followees[lo:hi])
+
+        for excluded in following:
+            counts.pop(excluded, None)
+        counts.pop(user_id, None)
+        if counts:
+            yield user_id, top_candidates(counts.keys(), counts.values(), k)
+        start = end
+
+
+def iter_recommendations_numpy(followers, followees, k):
+    """Yield (user_id, [(candidate_id, score), ...]) with vectorized set operations."""
+    followers = np.frombuffer(followers, dtype=np.int64)
+    followees = np.frombuffer(followees, dtype=np.int64)
+    user_ids, starts = np.unique(followers, return_index=True)
+    ends = np.append(starts[1:], len(followers))
+
+    for user_id, start, end in zip(user_ids.tolist(), starts.tolist(), ends.tolist()):
+        following = followees[start:end]
+
+        # Slices of every followee's own followees, gathered in one fancy index
+        lo = np.searchsorted(followers, following, side='left')
+        lengths = np.searchsorted(followers, following, side='right') - lo
+        total = int(lengths.sum())
+        if not total:
+            continue
+        offsets = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+        second_hop = followees[offsets + np.arange(total)]
+
+        # Drop the user and accounts they already follow
+        keep = second_hop != user_id
+        keep &= ~np.isin(second_hop, following)
+        candidates, counts = np.unique(second_hop[keep], return_counts=True)
+        if not len(candidates):
+            continue
+
+        if len(candidates) > k:
+            # Keep everything scoring at least the k-th best count (O(n) partition,
+            # ties at the cut included), then rank that short list exactly
+            cut = np.partition(counts, len(counts) - k)[len(counts) - k]
+            selected = counts >= cut
+            candidates, counts = candidates[selected], counts[selected]
+        yield user_id, top_candidates(candidates.tolist(), counts.tolist(), k)
+
+
+def iter_recommendations(followers, followees, k, use_numpy=None):
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return iter_recommendations_numpy(followers, followees, k)
+    return iter_recommendations_python(followers, followees, k)
+
+
+def compute_recommendations(top_k=None, batch_size=1000, use_numpy=None):
+    """
+    Recompute every user's recommendations. Users are written in batches, each
+    in its own transaction, so readers see either the old or the new list;
+    rows from earlier runs that weren't rewritten are removed at the end.
+    Returns (users, rows) written.
+    """
+    k = top_k or get_top_k()
+    computed_at = timezone.now()
+    followers, followees = load_edges()
+
+    users = rows = 0
+    batch = {}
+
+    def flush():
+        with transaction.atomic():
+            FollowRecommendation.objects.filter(user_id__in=batch.keys()).delete()
+            FollowRecommendation.objects.bulk_create(
+                [
+                    FollowRecommendation(
+                        user_id=user_id, candidate_id=candidate_id, score=score,
+                        rank=rank, computed_at=computed_at
+                    )
+                    for user_id, candidates in batch.items()
+                    for rank, (candidate_id, score) in enumerate(candidates, start=1)
+                ],
+                batch_size=batch_size
+            )
+        batch.clear()
+
+    for user_id, candidates in iter_recommendations(followers, followees, k, use_numpy):
+        batch[user_id] = candidates
+        users += 1
+        rows += len(candidates)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    FollowRecommendation.objects.filter(computed_at__lt=computed_at).delete()
+    return users, rows
@@ -2,7 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework.authtoken.models import Token
 
-from accounts.models import CustomUser
+from accounts.authentication import prime_token
+from accounts.models import CustomUser, FollowRecommendation
+from social_media_api.fieldsets import SparseFieldsetSerializerMixin
 
 
 # Serializer for User Registration
@@ -41,17 +43,15 @@ class LoginSerializer(serializers.Serializer):
         if not user:
             raise serializers.ValidationError('Invalid credentials')
         data['user'] = user
-        try:
-            token = Token.objects.get(user=user)
-        except Token.DoesNotExist:
-            token = Token.objects.create(user=user)
+        token, _ = Token.objects.get_or_create(user=user)
+        # The client authenticates with this token next; skip that first lookup
+        prime_token(token.key, user)
         data['token'] = token.key
         return data
 
 # Serializer for viewing and updating user profile
-class CustomUserProfileSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+class CustomUserProfileSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    # followers_count / following_count are counter columns on CustomUser
 
     class Meta:
         model = CustomUser
@@ -61,12 +61,6 @@ class CustomUserProfileSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('username', 'email', 'date_joined', 'followers_count', 'following_count')
 
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-
-    def get_following_count(self, obj):
-        return obj.following.count()
-
 
 class UserFollowSerializer(serializers.ModelSerializer):
     class Meta:
@@ -74,6 +68,26 @@ class UserFollowSerializer(serializers.ModelSerializer):
         fields = ['id', 'username']
 
 
+class FollowRecommendationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='candidate.id', read_only=True)
+    username = serializers.CharField(source='candidate.username', read_only=True)
+    # Number of the user's followees who follow the candidate
+    mutual_count = serializers.IntegerField(source='score', read_only=True)
+
+    class Meta:
+        model = FollowRecommendation
+        fields = ['id', 'username', 'mutual_count']
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    # Capped so one request stays a handful of queries
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 
 # class CustomUserRegistrationSerializer(serializers.ModelSerializer):
 #     # This line MUST be present.
@@ -1,3 +1,423 @@
-from django.test import TestCase
+import random
+from array import array
+from collections import Counter
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from posts.models import Post, TimelineEntry
+from . import recommendations
+from . import backends
+from .authentication import digest_key, local_tokens
+from .hashers import Costed, needs_rehash
+from .cache import FollowingSet, follow_graph
+from .models import CustomUser, Follow, FollowRecommendation
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATION_PIPELINE='outbox')
+class FollowGraphTests(APITestCase):
+    """
+    Single and bulk follow/unfollow over the Follow edge table.
+    """
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        self.user = CustomUser.objects.create_user(username='reader', password='pass12345')
+        self.others = [CustomUser.objects.create_user(username=f'writer{i}', password='pass12345') for i in range(5)]
+        self.client.force_authenticate(user=self.user)
+
+    def bulk_follow(self, user_ids):
+        response = self.client.post(reverse('follow-bulk'), {'user_ids': user_ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_follow_and_unfollow_one_user(self):
+        target = self.others[0]
+        response = self.client.post(reverse('follow-user', args=[target.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self.user.is_following(target))
+
+        response = self.client.post(reverse('follow-user', args=[target.id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.delete(reverse('unfollow-user', args=[target.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_follow_skips_self_existing_and_unknown(self):
+        Follow.objects.create(follower=self.user, followee=self.others[0])
+        ids = [user.id for user in self.others] + [self.user.id, 999999]
+
+        response = self.bulk_follow(ids)
+        self.assertEqual(sorted(response.data['followed']), [user.id for user in self.others[1:]])
+        self.assertEqual(sorted(response.data['skipped']), sorted([self.others[0].id, self.user.id, 999999]))
+
+        self.assertEqual(self.user.get_following_ids(), {user.id for user in self.others})
+        self.assertEqual(self.others[1].get_follower_ids(), {self.user.id})
+        self.user.refresh_from_db()
+        self.others[1].refresh_from_db()
+        self.assertEqual(self.user.following_count, 4)
+        self.assertEqual(self.others[1].followers_count, 1)
+
+    def test_follow_writes_lock_the_follower_row(self):
+        target = self.others[0]
+        with mock.patch('accounts.graph.lock_follower') as lock:
+            self.client.post(reverse('follow-user', args=[target.id]))
+            self.client.delete(reverse('unfollow-user', args=[target.id]))
+        self.assertEqual([call.args[0].pk for call in lock.call_args_list], [self.user.pk, self.user.pk])
+
+    def test_follow_counts_only_edges_it_added(self):
+        # An edge committed by a concurrent request before the lock was taken
+        Follow.objects.create(follower=self.user, followee=self.others[0])
+        self.bulk_follow([self.others[0].id, self.others[1].id])
+
+        self.user.refresh_from_db()
+        self.others[0].refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+        self.assertEqual(self.others[0].followers_count, 0)
+
+    def test_bulk_follow_query_count_does_not_grow(self):
+        with CaptureQueriesContext(connection) as few:
+            self.bulk_follow([self.others[0].id])
+        Follow.objects.all().delete()
+        with CaptureQueriesContext(connection) as many:
+            self.bulk_follow([user.id for user in self.others])
+
+        # Only the per-user notification events scale with the batch
+        self.assertEqual(len(many.captured_queries) - len(few.captured_queries), len(self.others) - 1)
+
+    def test_bulk_follow_backfills_and_bulk_unfollow_prunes(self):
+        for writer in self.others[:2]:
+            Post.objects.create(author=writer, title='Old', content='Body', is_fanned_out=True)
+        self.bulk_follow([writer.id for writer in self.others[:2]])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.user).count(), 2)
+
+        response = self.client.post(
+            reverse('unfollow-bulk'),
+            {'user_ids': [self.others[0].id, self.others[3].id]},
+            format='json'
+        )
+        self.assertEqual(response.data['unfollowed'], [self.others[0].id])
+        self.assertEqual(response.data['skipped'], [self.others[3].id])
+        self.assertEqual(list(TimelineEntry.objects.values_list('author_id', flat=True)), [self.others[1].id])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+
+    def test_bulk_follow_rejects_oversized_batches(self):
+        response = self.client.post(reverse('follow-bulk'), {'user_ids': list(range(1, 102))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES_SINGLE_PROCESS=True)
+class FollowGraphCacheTests(APITestCase):
+    """
+    Cached followee arrays: membership, intersection and versioned invalidation.
+    """
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        self.user = CustomUser.objects.create_user(username='reader', password='pass12345')
+        self.others = [CustomUser.objects.create_user(username=f'writer{i}', password='pass12345') for i in range(4)]
+        for other in self.others[:3]:
+            Follow.objects.create(follower=self.user, followee=other)
+
+    def test_following_set_operations(self):
+        following = FollowingSet(array('q', [2, 5, 9, 14]))
+        self.assertIn(9, following)
+        self.assertNotIn(10, following)
+        self.assertEqual(following.intersection([14, 3, 2, 2]), [2, 14])
+        self.assertEqual(following.intersection(FollowingSet(array('q', [5, 6]))), [5])
+
+    def test_membership_is_served_from_memory(self):
+        self.assertTrue(self.user.is_following(self.others[0]))
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(self.user.is_following(self.others[1]))
+            self.assertFalse(self.user.is_following(self.others[3]))
+        self.assertEqual(len(context.captured_queries), 0)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_follow_and_unfollow_invalidate_after_commit(self):
+        self.assertFalse(self.user.is_following(self.others[3]))
+        self.client.force_authenticate(user=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('follow-user', args=[self.others[3].id]))
+        self.assertTrue(self.user.is_following(self.others[3]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('unfollow-user', args=[self.others[0].id]))
+        self.assertEqual(self.user.get_following_ids(), {other.id for other in self.others[1:]})
+
+    def test_local_entries_are_bounded(self):
+        with self.settings(FOLLOW_GRAPH_CACHE_SIZE=2):
+            for user in [self.user] + self.others:
+                user.get_following()
+            self.assertEqual(len(follow_graph), 2)
+
+    def test_local_entries_expire(self):
+        with mock.patch('accounts.cache.time.monotonic', return_value=1000.0):
+            self.user.get_following()
+        with mock.patch('accounts.cache.time.monotonic', return_value=1301.0):
+            with CaptureQueriesContext(connection) as context:
+                self.user.get_following()
+        self.assertEqual(len(context.captured_queries), 1)
+
+    @override_settings(CACHES_SINGLE_PROCESS=False)
+    def test_process_local_alias_is_not_trusted(self):
+        # Another worker's follow would bump a version this process never sees
+        self.user.get_following()
+        Follow.objects.create(follower=self.user, followee=self.others[3])
+        self.assertTrue(self.user.is_following(self.others[3]))
+        self.assertEqual(len(follow_graph), 0)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FollowRecommendationTests(APITestCase):
+    """
+    Friends-of-friends candidates computed in batch and served from the table.
+    """
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        self.users = {name: CustomUser.objects.create_user(username=name, password='pass12345')
+                      for name in ['me', 'a', 'b', 'c', 'd', 'e']}
+        # me -> a, b; a -> c, d, me; b -> c, e
+        for follower, followee in [('me', 'a'), ('me', 'b'), ('a', 'c'), ('a', 'd'),
+                                   ('a', 'me'), ('b', 'c'), ('b', 'e')]:
+            Follow.objects.create(follower=self.users[follower], followee=self.users[followee])
+
+    def ids(self, *names):
+        return [self.users[name].id for name in names]
+
+    def test_candidates_are_ranked_by_common_neighbours(self):
+        call_command('compute_recommendations', '--no-numpy', stdout=StringIO())
+        mine = FollowRecommendation.objects.filter(user=self.users['me']).order_by('rank')
+        self.assertEqual([r.candidate_id for r in mine], self.ids('c', 'd', 'e'))
+        self.assertEqual([r.score for r in mine], [2, 1, 1])
+        # a already follows me, so only b (via me) is suggested to a
+        self.assertFalse(FollowRecommendation.objects.filter(user=self.users['a'], candidate=self.users['me']).exists())
+
+    def test_rerun_replaces_stale_rows(self):
+        recommendations.compute_recommendations(use_numpy=False)
+        Follow.objects.filter(follower=self.users['me']).delete()
+        recommendations.compute_recommendations(use_numpy=False)
+        self.assertFalse(FollowRecommendation.objects.filter(user=self.users['me']).exists())
+
+    def test_top_k_limits_rows(self):
+        recommendations.compute_recommendations(top_k=1, use_numpy=False)
+        self.assertEqual(FollowRecommendation.objects.filter(user=self.users['me']).count(), 1)
+
+    def random_graph(self, users=60, edges=900, seed=5):
+        """(followers, followees) arrays of a random follow graph, in load_edges() order."""
+        rng = random.Random(seed)
+        pairs = sorted({
+            (follower, followee)
+            for follower, followee in ((rng.randrange(users), rng.randrange(users)) for _ in range(edges))
+            if follower != followee
+        })
+        return array('q', [pair[0] for pair in pairs]), array('q', [pair[1] for pair in pairs])
+
+    def test_python_walk_matches_a_brute_force_count(self):
+        followers, followees = self.random_graph()
+        following = {}
+        for follower, followee in zip(followers, followees):
+            following.setdefault(follower, set()).add(followee)
+
+        for user_id, candidates in recommendations.iter_recommendations(followers, followees, 5, use_numpy=False):
+            counts = Counter(
+                candidate for followee in following[user_id] for candidate in following.get(followee, ())
+                if candidate != user_id and candidate not in following[user_id]
+            )
+            expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:5]
+            self.assertEqual(candidates, expected)
+
+    @skipIf(recommendations.np is None, 'NumPy is not installed')
+    def test_numpy_and_python_walks_agree(self):
+        followers, followees = recommendations.load_edges()
+        self.assertEqual(
+            list(recommendations.iter_recommendations(followers, followees, 2, use_numpy=True)),
+            list(recommendations.iter_recommendations(followers, followees, 2, use_numpy=False)),
+        )
+        # Dense enough for ties at the top-k cut (the partition path) and users with no candidates
+        followers, followees = self.random_graph()
+        for k in (1, 3, 100):
+            self.assertEqual(
+                list(recommendations.iter_recommendations(followers, followees, k, use_numpy=True)),
+                list(recommendations.iter_recommendations(followers, followees, k, use_numpy=False)),
+            )
+
+    def test_endpoint_serves_precomputed_rows_minus_new_follows(self):
+        recommendations.compute_recommendations(use_numpy=False)
+        Follow.objects.create(follower=self.users['me'], followee=self.users['d'])
+        follow_graph.invalidate(self.users['me'].id)
+
+        self.client.force_authenticate(user=self.users['me'])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('follow-recommendations'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], self.ids('c', 'e'))
+        self.assertEqual(response.data[0], {'id': self.users['c'].id, 'username': 'c', 'mutual_count': 2})
+        self.assertLessEqual(len(context.captured_queries), 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CACHES_SINGLE_PROCESS=True)
+class CachedTokenAuthenticationTests(APITestCase):
+    """
+    Token lookups are cached per process and in the shared cache, and dropped
+    on deactivation, rotation and logout.
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = CustomUser.objects.create_user(username='tokened', password='pass12345', bio='Hi')
+        self.token = Token.objects.create(user=self.user)
+
+    def get_profile(self, key=None):
+        return self.client.get(reverse('profile'), headers={'authorization': f'Token {key or self.token.key}'})
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_profile()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query for query in context.captured_queries if 'authtoken_token' in query['sql']]
+
+    def test_repeat_requests_skip_the_token_lookup(self):
+        # A miss is one query: the token joined to its user
+        self.assertEqual(len(self.token_queries()), 1)
+        self.assertEqual(self.token_queries(), [])
+        # Another process only has the shared tier
+        local_tokens.clear()
+        self.assertEqual(self.token_queries(), [])
+        self.assertEqual(self.get_profile().data['bio'], 'Hi')
+
+    def test_local_hits_do_not_extend_the_entry(self):
+        with mock.patch('accounts.authentication.time.monotonic', return_value=1000.0):
+            self.get_profile()
+        with mock.patch('accounts.authentication.time.monotonic', return_value=1200.0):
+            self.assertEqual(self.token_queries(), [])
+        # Expired AUTH_TOKEN_CACHE_TTL seconds after it was stored, despite the hit
+        with mock.patch('accounts.authentication.time.monotonic', return_value=1301.0):
+            self.assertIsNone(local_tokens.get(digest_key(self.token.key)))
+
+    @override_settings(CACHES_SINGLE_PROCESS=False)
+    def test_process_local_alias_falls_back_to_the_database(self):
+        # The version keys would only reach this worker, so nothing is cached
+        self.assertEqual(len(self.token_queries()), 1)
+        self.assertEqual(len(self.token_queries()), 1)
+        self.assertIsNone(local_tokens.get(digest_key(self.token.key)))
+
+    def test_deactivation_and_profile_changes_invalidate(self):
+        self.get_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.bio = 'Updated'
+            self.user.save()
+        self.assertEqual(self.get_profile().data['bio'], 'Updated')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get_profile().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotation_and_logout_revoke_the_cached_token(self):
+        self.get_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('token'), headers={'authorization': f'Token {self.token.key}'})
+        new_key = response.data['token']
+        self.assertEqual(self.get_profile().status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_profile(new_key).status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('logout'), headers={'authorization': f'Token {new_key}'})
+        self.assertEqual(self.get_profile(new_key).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_primes_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('login'), {'username': 'tokened', 'password': 'pass12345'})
+        self.assertEqual(response.data['token'], self.token.key)
+        self.assertEqual(self.token_queries(), [])
+
+    def test_token_endpoint_reuses_the_authenticating_token(self):
+        self.get_profile()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('token'), headers={'authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.data['token'], self.token.key)
+        self.assertEqual(context.captured_queries, [])
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False, PASSWORD_REHASH='deferred',
+    PASSWORD_HASH_COSTS={'pbkdf2': {'iterations': 2000}},
+)
+class PasswordHashingPolicyTests(APITestCase):
+    """
+    Hashing cost comes from settings; outdated hashes are upgraded once the login response is sent.
+    """
+
+    def setUp(self):
+        old = Costed(PBKDF2PasswordHasher, iterations=1000).hasher
+        self.old_hash = old.encode('pass12345', old.salt())
+        self.user = CustomUser.objects.create_user(username='returning', password='unused')
+        CustomUser.objects.filter(pk=self.user.pk).update(password=self.old_hash)
+
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'returning', 'password': 'pass12345'})
+
+    def stored_hash(self):
+        return CustomUser.objects.values_list('password', flat=True).get(pk=self.user.pk)
+
+    def test_new_hashes_use_the_configured_cost(self):
+        self.user.set_password('pass12345')
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertFalse(needs_rehash(self.user.password))
+        self.assertTrue(needs_rehash(self.old_hash))
+
+    def test_outdated_hash_is_upgraded_after_the_response(self):
+        # What the request/response cycle does, without the test client around it
+        backends.begin_request()
+        with mock.patch('accounts.backends.rehash', wraps=backends.rehash) as rehash:
+            for _ in range(2):
+                self.assertEqual(authenticate(username='returning', password='pass12345'), self.user)
+            # Verified against the old hash; nothing was re-hashed inside the request
+            self.assertEqual(self.stored_hash(), self.old_hash)
+            backends.run_deferred()
+        # Two logins, one upgrade
+        self.assertEqual(rehash.call_count, 1)
+        self.assertTrue(check_password('pass12345', self.stored_hash()))
+
+        # The test client closes the response, which sends request_finished
+        CustomUser.objects.filter(pk=self.user.pk).update(password=self.old_hash)
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        upgraded = self.stored_hash()
+        self.assertTrue(upgraded.startswith('pbkdf2_sha256$2000$'))
+        self.assertTrue(check_password('pass12345', upgraded))
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_upgrade_does_not_overwrite_a_password_change(self):
+        self.user.set_password('changed123')
+        self.user.save()
+        self.assertFalse(backends.rehash(self.user.pk, self.old_hash, 'pass12345'))
+        self.assertTrue(check_password('changed123', self.stored_hash()))
+
+    def test_wrong_password_is_rejected(self):
+        response = self.client.post(reverse('login'), {'username': 'returning', 'password': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_calibrate_command(self):
+        out = StringIO()
+        call_command('calibrate_password_hashers', '--algorithm', 'pbkdf2', '--target-ms', '5', stdout=out)
+        self.assertIn("'pbkdf2': {'iterations': ", out.getvalue())
@@ -1,18 +1,28 @@
 # accounts/urls.py
 
 from django.urls import path
-from .views import RegisterUserView, LoginUserView, UserProfileView, TokenRetrievalView
-from .views import FollowAPIView
+from .views import RegisterUserView, LoginUserView, LogoutView, UserProfileView, TokenRetrievalView
+from .views import FollowAPIView, UnfollowAPIView, BulkFollowAPIView, BulkUnfollowAPIView
+from .views import FollowRecommendationListView
 
 urlpatterns = [
     path('register/', RegisterUserView.as_view(), name='register'),
     path('login/', LoginUserView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('profile/', UserProfileView.as_view(), name='profile'),
+    # GET returns the current token, POST rotates it
     path('token/', TokenRetrievalView.as_view(), name='token'),
     #path('follow/<int:user_id>/', FollowAPIView.as_view(), name='follow-toggle'),
     # FOLLOW Endpoint (Use POST to create the relationship)
     path('follow/<int:user_id>/', FollowAPIView.as_view(), name='follow-user'),
 
     # UNFOLLOW Endpoint (Use DELETE to destroy the relationship)
-    path('unfollow/<int:user_id>/', FollowAPIView.as_view(), name='unfollow-user'),
+    path('unfollow/<int:user_id>/', UnfollowAPIView.as_view(), name='unfollow-user'),
+
+    # Bulk variants (POST {"user_ids": [...]})
+    path('follow/bulk/', BulkFollowAPIView.as_view(), name='follow-bulk'),
+    path('unfollow/bulk/', BulkUnfollowAPIView.as_view(), name='unfollow-bulk'),
+
+    # "Who to follow" (precomputed by `python manage.py compute_recommendations`)
+    path('recommendations/', FollowRecommendationListView.as_view(), name='follow-recommendations'),
 ]
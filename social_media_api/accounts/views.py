@@ -4,10 +4,13 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 
-from .serializers import CustomUserRegistrationSerializer, CustomUserProfileSerializer, LoginSerializer, UserFollowSerializer
-from .models import CustomUser
+from .serializers import CustomUserRegistrationSerializer, CustomUserProfileSerializer, LoginSerializer, UserFollowSerializer, BulkFollowSerializer
+from .serializers import FollowRecommendationSerializer
+from .models import CustomUser, FollowRecommendation
+from .graph import follow_users, unfollow_users
 from django.shortcuts import get_object_or_404
 from rest_framework import views, permissions, status
+from social_media_api.fieldsets import SparseFieldsetViewMixin
 
 # Create your views here.
 
@@ -44,21 +47,43 @@ class LoginUserView(generics.GenericAPIView):
             'user': user_serializer.data,
         })
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class UserProfileView(SparseFieldsetViewMixin, generics.RetrieveUpdateAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         # Enforce that users can only view/edit their own profile
-        return self.request.user
+        user = self.request.user
+        # Cached auth leaves the counters deferred; load them in one query
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
 
 class TokenRetrievalView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        token = Token.objects.get(user=request.user)
+        # Token-authenticated requests already carry it; no need to re-query
+        if isinstance(request.auth, Token):
+            return Response({'token': request.auth.key})
+        token, created = Token.objects.get_or_create(user=request.user)
         return Response({'token': token.key})
+
+    def post(self, request, *args, **kwargs):
+        """Rotate: the old token stops working (and is dropped from the auth cache)."""
+        Token.objects.filter(user=request.user).delete()
+        token = Token.objects.create(user=request.user)
+        return Response({'token': token.key}, status=status.HTTP_201_CREATED)
+
+
+class LogoutView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 
 class FollowAPIView(views.APIView):
@@ -77,13 +102,11 @@ class FollowAPIView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if current_user.user_following.filter(pk=target_user.pk).exists():
+        if not follow_users(current_user, [target_user.pk]):
             return Response(
                 {"detail": "You are already following this user."},
                 status=status.HTTP_409_CONFLICT # Conflict status for already followed
             )
-
-        current_user.user_following.add(target_user)
         
         return Response(
             {"detail": f"Successfully followed user {target_user.username}"},
@@ -106,16 +129,67 @@ class UnfollowAPIView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if following before attempting to remove
-        if not current_user.user_following.filter(pk=target_user.pk).exists():
+        if not unfollow_users(current_user, [target_user.pk]):
             return Response(
                 {"detail": "You are not following this user."},
                 status=status.HTTP_404_NOT_FOUND # Not found, as the relationship doesn't exist
             )
-
-        current_user.user_following.remove(target_user)
         
         return Response(
             {"detail": f"Successfully unfollowed user {target_user.username}"},
             status=status.HTTP_204_NO_CONTENT # Standard status for successful deletion
-        )
\ No newline at end of file
+        )
+
+
+class BulkFollowAPIView(views.APIView):
+    """
+    Endpoint to FOLLOW several users at once. (POST {"user_ids": [...]})
+    Ids that don't exist, are already followed or are the caller are skipped.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+
+        followed = [user.pk for user in follow_users(request.user, user_ids)]
+        skipped = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in followed]
+        return Response({"followed": followed, "skipped": skipped}, status=status.HTTP_200_OK)
+
+
+class BulkUnfollowAPIView(views.APIView):
+    """
+    Endpoint to UNFOLLOW several users at once. (POST {"user_ids": [...]})
+    Ids the caller doesn't follow are skipped.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+
+        unfollowed = unfollow_users(request.user, user_ids)
+        skipped = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in unfollowed]
+        return Response({"unfollowed": unfollowed, "skipped": skipped}, status=status.HTTP_200_OK)
+
+
+class FollowRecommendationListView(generics.ListAPIView):
+    """
+    "Who to follow" for the current user, read from the precomputed table.
+    Candidates followed since the last compute_recommendations run are dropped.
+    """
+    serializer_class = FollowRecommendationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    # The list is already capped at RECOMMENDATION_TOP_K rows
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            FollowRecommendation.objects.filter(user=self.request.user)
+            .exclude(candidate_id__in=list(self.request.user.get_following()))
+            .select_related('candidate')
+            .only('score', 'rank', 'candidate__id', 'candidate__username')
+            .order_by('rank')
+        )
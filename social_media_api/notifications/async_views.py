@@ -0,0 +1,30 @@
+# notifications/async_views.py
+
+"""
+Async variant of NotificationListView for ASGI deployments:
+GET /notifications/async/ takes the same ?since=, ?unread=, ?cursor= and
+?page_size= parameters and returns the same page, read through the async
+ORM (see social_media_api/async_views.py).
+"""
+
+from asgiref.sync import sync_to_async
+
+from social_media_api.async_views import AsyncAPIView
+from social_media_api.pagination import NotificationKeysetPagination
+
+from .serializers import NotificationSerializer
+from .views import notification_queryset
+
+
+class AsyncNotificationListView(AsyncAPIView):
+    pagination_class = NotificationKeysetPagination
+
+    async def get(self, request, *args, **kwargs):
+        paginator = self.pagination_class()
+        # The actor, content type and targets are loaded with the page
+        page = await paginator.apaginate_queryset(notification_queryset(self.request), self.request, view=self)
+        data = await sync_to_async(self.serialize)(page)
+        return self.render(paginator.get_paginated_response(data).data)
+
+    def serialize(self, page):
+        return NotificationSerializer(page, many=True, context=self.get_serializer_context()).data
@@ -0,0 +1,76 @@
+# notifications/bus.py
+
+"""
+In-process pub/sub used to wake streaming and long-poll connections.
+
+The bus only carries "recipient X has something new"; the connection then
+reads the actual rows from the database. Notifications processed in another
+process (the outbox worker) never reach this bus, so waiting connections also
+re-check the database every NOTIFICATION_STREAM_POLL_INTERVAL seconds.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    def __init__(self, bus, recipient_id):
+        self.bus = bus
+        self.recipient_id = recipient_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self):
+        # May be called from any thread; hand the wake-up to our event loop
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout):
+        """Wait until published to or `timeout` seconds pass. Returns True if woken."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class NotificationBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, recipient_id):
+        """Must be called from inside the event loop that will wait on it."""
+        subscription = Subscription(self, recipient_id)
+        with self._lock:
+            self._subscriptions[recipient_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.recipient_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.recipient_id]
+
+    def publish(self, recipient_ids):
+        with self._lock:
+            subscriptions = [
+                subscription
+                for recipient_id in set(recipient_ids)
+                for subscription in self._subscriptions.get(recipient_id, ())
+            ]
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+bus = NotificationBus()
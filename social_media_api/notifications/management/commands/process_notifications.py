@@ -0,0 +1,38 @@
+# notifications/management/commands/process_notifications.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.pipeline import get_batch_size, process_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Turn queued NotificationEvent rows into coalesced notifications. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the outbox until it is empty, then exit.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events per batch (default: NOTIFICATION_BATCH_SIZE).')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty (default: 1).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or get_batch_size()
+        total = 0
+
+        while True:
+            processed = process_outbox(batch_size)
+            total += processed
+            if processed:
+                self.stdout.write(f'Processed {processed} event(s).')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{total} event(s) processed.'))
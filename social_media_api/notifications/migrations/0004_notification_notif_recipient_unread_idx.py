@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0003_notification_actor_count_notificationevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', '-timestamp'], name='notif_recipient_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_actors(apps, schema_editor):
+    """
+    Record each existing notification's current actor. The other actors of
+    a coalesced one weren't stored, so those can't be retracted individually.
+    """
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationActor = apps.get_model('notifications', 'NotificationActor')
+    rows = Notification.objects.order_by('pk').values_list('pk', 'actor_id')
+    batch = []
+    for notification_id, actor_id in rows.iterator(chunk_size=2000):
+        batch.append(NotificationActor(notification_id=notification_id, actor_id=actor_id))
+        if len(batch) == 2000:
+            NotificationActor.objects.bulk_create(batch)
+            batch = []
+    NotificationActor.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_notif_recipient_unread_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actor_links', to='notifications.notification')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['actor', 'notification'], name='notif_actor_idx')],
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
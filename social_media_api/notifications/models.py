@@ -32,12 +32,78 @@ class Notification(models.Model):
     object_id = models.PositiveIntegerField()
     target = GenericForeignKey('content_type', 'object_id')
 
+    # Number of distinct actors coalesced into this notification
+    # ("alice and 12 others liked your post"); actor is the most recent one
+    actor_count = models.PositiveIntegerField(default=1)
+
     # Status and Time
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination of a recipient's notifications on (timestamp, id)
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notif_recipient_ts_idx'),
+            # Unread counts and ?unread=true listings
+            models.Index(fields=['recipient', 'is_read', '-timestamp'], name='notif_recipient_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor.username} {self.verb} {self.target} for {self.recipient.username}"
+
+
+class NotificationActor(models.Model):
+    """
+    One row per actor counted in a (coalesced) notification, so a retraction
+    only uncounts an actor that was counted, and the same actor acting again
+    isn't counted twice. actor_count is the number of these rows.
+    """
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        related_name='actor_links'
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    class Meta:
+        unique_together = ('notification', 'actor')
+        indexes = [
+            # Retractions look up an actor's memberships
+            models.Index(fields=['actor', 'notification'], name='notif_actor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} in notification {self.notification_id}"
+
+
+class NotificationEvent(models.Model):
+    """
+    Outbox row written by the like/comment/follow views. The
+    process_notifications worker turns batches of these into (coalesced)
+    Notification rows and deletes them, so the request only pays for one insert.
+    """
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    verb = models.CharField(max_length=255)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
 
     def __str__(self):
-        return f"{self.actor.username} {self.verb} {self.target} for {self.recipient.username}"
\ No newline at end of file
+        return f"{self.actor_id} {self.verb} {self.content_type_id}:{self.object_id} for {self.recipient_id}"
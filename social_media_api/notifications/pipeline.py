@@ -0,0 +1,341 @@
+# notifications/pipeline.py
+
+"""
+Notification fan-out pipeline.
+
+Views call notify() / retract() and return immediately; creating the
+Notification rows happens later, in batches, with duplicate events for the
+same recipient and target coalesced into one row ("alice and 12 others
+liked your post").
+
+NOTIFICATION_PIPELINE selects where events wait:
+    'outbox' - a NotificationEvent row written in the request's transaction,
+               processed by `python manage.py process_notifications` (durable)
+    'memory' - an in-process queue drained by a background thread (no extra
+               insert, but pending events are lost if the process dies);
+               retractions go through the same queue, so they apply in order
+    'sync'   - processed immediately inside the request (tests, debugging)
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .bus import bus
+from .models import Notification, NotificationActor, NotificationEvent
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', ['recipient_id', 'actor_id', 'verb', 'content_type_id', 'object_id'])
+# Queued in 'memory' mode behind the event it undoes
+Retraction = namedtuple('Retraction', ['event'])
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_pipeline():
+    return getattr(settings, 'NOTIFICATION_PIPELINE', 'outbox')
+
+
+def get_batch_size():
+    return getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500)
+
+
+def build_event(recipient, actor, verb, target):
+    content_type = ContentType.objects.get_for_model(target)
+    return Event(recipient.pk, actor.pk, verb, content_type.pk, target.pk)
+
+
+def notify(recipient, actor, verb, target):
+    """Queue a notification for `recipient`. Users are never notified of their own actions."""
+    if recipient.pk == actor.pk:
+        return
+
+    event = build_event(recipient, actor, verb, target)
+    pipeline = get_pipeline()
+    if pipeline == 'outbox':
+        NotificationEvent.objects.create(**event._asdict())
+    elif pipeline == 'memory':
+        # Only hand the event over once the action itself has committed
+        transaction.on_commit(lambda: enqueue(event))
+    else:
+        process_events([event])
+
+
+def retract(recipient, actor, verb, target):
+    """
+    Undo a notify() (e.g. after an unlike): drop the pending event if it hasn't
+    been processed yet, otherwise remove the actor from the stored notification.
+    """
+    retract_events([build_event(recipient, actor, verb, target)])
+
+
+def retract_events(events):
+    """
+    Retract a batch of events. In 'memory' mode the retractions are queued
+    after the events (once the action has committed), since an event still
+    waiting in the queue can't be found in the database; otherwise they are
+    applied right away (apply_retractions).
+    """
+    if not events:
+        return
+    if get_pipeline() == 'memory':
+        retractions = [Retraction(event) for event in events]
+        transaction.on_commit(lambda: enqueue(*retractions))
+    else:
+        apply_retractions(events)
+
+
+def apply_retractions(events):
+    """
+    Drop pending outbox rows for `events` and take their actors out of the
+    stored notifications. Only unread notifications the actor is counted in
+    (a NotificationActor row) are touched: each loses one from actor_count
+    per retracted actor, is deleted once no actor is left, and points at its
+    latest remaining actor if it pointed at a retracted one.
+    """
+    if not events:
+        return
+
+    pending = Q()
+    links = Q()
+    for event in events:
+        pending |= Q(**event._asdict())
+        links |= Q(
+            actor_id=event.actor_id,
+            notification__recipient_id=event.recipient_id,
+            notification__verb=event.verb,
+            notification__content_type_id=event.content_type_id,
+            notification__object_id=event.object_id,
+        )
+
+    with transaction.atomic():
+        NotificationEvent.objects.filter(pending).delete()
+        removed = list(
+            NotificationActor.objects.filter(links, notification__is_read=False)
+            .values_list('pk', 'notification_id')
+        )
+        if not removed:
+            return
+        NotificationActor.objects.filter(pk__in=[pk for pk, _ in removed]).delete()
+
+        counts = Counter(notification_id for _, notification_id in removed)
+        remaining = NotificationActor.objects.filter(notification_id=OuterRef('pk'))
+        Notification.objects.filter(pk__in=counts).filter(~Exists(remaining)).delete()
+        by_count = defaultdict(list)
+        for notification_id, count in counts.items():
+            by_count[count].append(notification_id)
+        for count, notification_ids in by_count.items():
+            Notification.objects.filter(pk__in=notification_ids).update(actor_count=F('actor_count') - count)
+        Notification.objects.filter(pk__in=counts).filter(
+            ~Exists(remaining.filter(actor_id=OuterRef('actor_id')))
+        ).update(actor_id=Subquery(remaining.order_by('-id').values('actor_id')[:1]))
+
+
+# --- Batch processing ---
+
+def process_events(events):
+    """
+    Turn a batch of events into notifications: group them by
+    (recipient, verb, target), fold each group into the recipient's existing
+    unread notification for that target when there is one, and write
+    everything with one bulk_create and one bulk_update.
+    Returns the number of notifications created or updated.
+    """
+    groups = OrderedDict()
+    for event in events:
+        key = (event.recipient_id, event.verb, event.content_type_id, event.object_id)
+        actors = groups.setdefault(key, [])
+        # Keep each actor once, most recent last
+        if event.actor_id in actors:
+            actors.remove(event.actor_id)
+        actors.append(event.actor_id)
+
+    if not groups:
+        return 0
+
+    lookup = Q()
+    for recipient_id, verb, content_type_id, object_id in groups:
+        lookup |= Q(recipient_id=recipient_id, verb=verb, content_type_id=content_type_id, object_id=object_id)
+    existing = {}
+    for notification in Notification.objects.filter(lookup, is_read=False).order_by('timestamp', 'id'):
+        existing[notification_key(notification)] = notification  # the newest unread one wins
+
+    # Which of this batch's actors each existing notification already counts
+    counted = set(
+        NotificationActor.objects.filter(
+            notification_id__in=[notification.pk for notification in existing.values()],
+            actor_id__in={actor_id for actor_ids in groups.values() for actor_id in actor_ids},
+        ).values_list('notification_id', 'actor_id')
+    )
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    new_actors = {}
+    for key, actor_ids in groups.items():
+        recipient_id, verb, content_type_id, object_id = key
+        notification = existing.get(key)
+        if notification is None:
+            to_create.append(Notification(
+                recipient_id=recipient_id,
+                actor_id=actor_ids[-1],
+                verb=verb,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                actor_count=len(actor_ids),
+            ))
+            new_actors[key] = actor_ids
+        else:
+            added = [actor_id for actor_id in actor_ids if (notification.pk, actor_id) not in counted]
+            notification.actor_count += len(added)
+            notification.actor_id = actor_ids[-1]
+            notification.timestamp = now
+            to_update.append(notification)
+            new_actors[key] = added
+
+    batch_size = get_batch_size()
+    with transaction.atomic():
+        Notification.objects.bulk_create(to_create, batch_size=batch_size)
+        if to_create and to_create[0].pk is None:
+            assign_ids(to_create)
+        Notification.objects.bulk_update(to_update, ['actor', 'actor_count', 'timestamp'], batch_size=batch_size)
+        NotificationActor.objects.bulk_create(
+            [
+                NotificationActor(notification_id=notification.pk, actor_id=actor_id)
+                for notification in to_create + to_update
+                for actor_id in new_actors[notification_key(notification)]
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        # Wake any stream/long-poll connections of these recipients in this process
+        recipient_ids = [recipient_id for recipient_id, _, _, _ in groups]
+        transaction.on_commit(lambda: bus.publish(recipient_ids))
+    return len(to_create) + len(to_update)
+
+
+def notification_key(notification):
+    return (notification.recipient_id, notification.verb, notification.content_type_id, notification.object_id)
+
+
+def assign_ids(notifications):
+    """
+    Read back the ids bulk_create couldn't return (MySQL): each new
+    notification is its key's newest unread one.
+    """
+    lookup = Q()
+    for recipient_id, verb, content_type_id, object_id in map(notification_key, notifications):
+        lookup |= Q(recipient_id=recipient_id, verb=verb, content_type_id=content_type_id, object_id=object_id)
+    ids = {}
+    for pk, *key in Notification.objects.filter(lookup, is_read=False).order_by('timestamp', 'id').values_list(
+            'pk', 'recipient_id', 'verb', 'content_type_id', 'object_id'):
+        ids[tuple(key)] = pk
+    for notification in notifications:
+        notification.pk = ids[notification_key(notification)]
+
+
+def process_outbox(batch_size=None):
+    """
+    Process one batch of NotificationEvent rows and delete them.
+    Rows are locked with SKIP LOCKED (where supported) so several workers can run.
+    Returns the number of events consumed.
+    """
+    batch_size = batch_size or get_batch_size()
+    with transaction.atomic():
+        rows = list(
+            NotificationEvent.objects.select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        process_events([
+            Event(row.recipient_id, row.actor_id, row.verb, row.content_type_id, row.object_id)
+            for row in rows
+        ])
+        NotificationEvent.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    return len(rows)
+
+
+# --- In-process queue ---
+
+def enqueue(*items):
+    for item in items:
+        _queue.put(item)
+    start_worker()
+
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='notification-pipeline', daemon=True)
+            _worker.start()
+
+
+def process_batch(items):
+    """
+    Process events and retractions taken from the in-process queue. A
+    retraction cancels the latest matching event earlier in the batch; one
+    whose event was processed in an earlier batch is applied to the stored
+    notifications before this batch's events are.
+    """
+    events = []
+    retracted = []
+    for item in items:
+        if not isinstance(item, Retraction):
+            events.append(item)
+        elif item.event in events:
+            del events[len(events) - 1 - events[::-1].index(item.event)]
+        else:
+            retracted.append(item.event)
+    apply_retractions(retracted)
+    return process_events(events)
+
+
+def take_batch(batch_size, batch=None):
+    batch = batch or []
+    while len(batch) < batch_size:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def drain_queue(batch_size=None):
+    """Process everything currently in the in-process queue, in batches."""
+    batch_size = batch_size or get_batch_size()
+    processed = 0
+    while True:
+        batch = take_batch(batch_size)
+        if not batch:
+            return processed
+        process_batch(batch)
+        processed += len(batch)
+
+
+def _run_worker():
+    interval = getattr(settings, 'NOTIFICATION_FLUSH_INTERVAL', 1.0)
+    while True:
+        # Block until there is work, then give the batch a moment to fill up
+        first = _queue.get()
+        time.sleep(interval)
+        try:
+            close_old_connections()
+            process_batch(take_batch(get_batch_size(), [first]))
+            drain_queue()
+        except Exception:
+            logger.exception('Notification pipeline batch failed')
+        finally:
+            close_old_connections()
@@ -2,18 +2,50 @@
 
 from rest_framework import serializers
 from .models import Notification
-from django.contrib.contenttypes.models import ContentType
+from .targets import summarize_target
 
 class NotificationSerializer(serializers.ModelSerializer):
     actor_username = serializers.CharField(source='actor.username', read_only=True)
     # Display the target type and primary key for client-side routing
     target_type = serializers.SerializerMethodField()
     target_id = serializers.IntegerField(source='object_id', read_only=True)
+    # Compact target summary, resolved in bulk by NotificationListView (see targets.py)
+    target = serializers.SerializerMethodField()
+    # Human readable line for coalesced notifications, e.g. "alice and 12 others liked your post"
+    summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
-        fields = ['id', 'recipient', 'actor_username', 'verb', 'target_type', 'target_id', 'timestamp', 'is_read']
+        fields = [
+            'id', 'recipient', 'actor_username', 'actor_count', 'verb', 'summary',
+            'target_type', 'target_id', 'target', 'timestamp', 'is_read'
+        ]
         read_only_fields = fields
 
     def get_target_type(self, obj):
-        return obj.content_type.model
\ No newline at end of file
+        # content_type comes from select_related (or ContentType's own cache)
+        return obj.content_type.model
+
+    def get_target(self, obj):
+        return summarize_target(obj)
+
+    def get_summary(self, obj):
+        actors = obj.actor.username
+        others = obj.actor_count - 1
+        if others == 1:
+            actors += ' and 1 other'
+        elif others > 1:
+            actors += f' and {others} others'
+
+        if obj.verb == 'followed':
+            return f'{actors} followed you'
+        return f'{actors} {obj.verb} your {self.get_target_type(obj)}'
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    # Ids the client displayed; capped so one request can't rewrite a whole history
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
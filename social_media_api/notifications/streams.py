@@ -0,0 +1,229 @@
+# notifications/streams.py
+
+"""
+Push channels for notifications, served by async views under ASGI
+(e.g. `uvicorn social_media_api.asgi:application`).
+
+    GET /notifications/stream/  Server-Sent Events; one `notification` event per
+                                new or updated notification, resumable through
+                                the Last-Event-ID header
+    GET /notifications/poll/    Long-poll fallback; answers as soon as something
+                                newer than ?since= exists, or after ?timeout=
+
+Both wait on the in-process bus (bus.py) instead of querying in a loop, and
+re-check the database every NOTIFICATION_STREAM_POLL_INTERVAL seconds to pick
+up notifications written by other processes.
+
+Positions are "<ISO timestamp>_<id>" (the SSE event id, and the `since` a
+long-poll answer returns): the pipeline gives a whole run of coalesced
+notifications the same timestamp, so reads continue on (timestamp, id) and
+a batch that ends inside such a run doesn't skip the rest of it. A bare ISO
+timestamp is accepted too and means "strictly newer".
+
+Requests authenticate with the Authorization header. EventSource clients,
+which cannot set headers, first get a short-lived stream ticket from
+POST /notifications/stream/ticket/ and pass it as ?ticket=, so no API token
+ends up in URLs and access logs.
+"""
+
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from social_media_api.pagination import keyset_filter
+from .bus import bus
+from .models import Notification
+from .serializers import NotificationSerializer
+from .targets import target_prefetch
+
+# Notifications read from the database per wake-up
+STREAM_BATCH_SIZE = 50
+MAX_LONG_POLL_TIMEOUT = 60
+STREAM_TICKET_SALT = 'notifications.stream'
+
+
+def get_poll_interval():
+    return getattr(settings, 'NOTIFICATION_STREAM_POLL_INTERVAL', 15)
+
+
+def get_stream_lifetime():
+    return getattr(settings, 'NOTIFICATION_STREAM_MAX_SECONDS', 300)
+
+
+def get_ticket_max_age():
+    return getattr(settings, 'NOTIFICATION_STREAM_TICKET_MAX_AGE', 60)
+
+
+def issue_stream_ticket(user):
+    """A signed ticket that authenticates `user` on the push channels for a short while."""
+    return signing.dumps({'user': user.pk}, salt=STREAM_TICKET_SALT)
+
+
+def authenticate(request):
+    """
+    The configured API authentication (Authorization header), or a stream
+    ticket in ?ticket= for EventSource clients.
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            user_id = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=get_ticket_max_age())['user']
+        except (signing.BadSignature, KeyError, TypeError):
+            raise AuthenticationFailed('Invalid or expired stream ticket.')
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user
+
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    raise NotAuthenticated()
+
+
+def fetch_notifications(user, position):
+    """
+    Serialized notifications after `position` (see parse_position), oldest
+    first, and the position to continue from.
+    """
+    timestamp, last_id = position
+    newer = Q(timestamp__gt=timestamp) if last_id is None else keyset_filter(('timestamp', 'id'), position)
+    notifications = list(
+        Notification.objects.filter(newer, recipient=user)
+        .select_related('actor', 'content_type')
+        .prefetch_related(target_prefetch())
+        .order_by('timestamp', 'id')[:STREAM_BATCH_SIZE]
+    )
+    if notifications:
+        position = (notifications[-1].timestamp, notifications[-1].pk)
+    return NotificationSerializer(notifications, many=True).data, position
+
+
+def parse_position(value):
+    """
+    (timestamp, id or None) from "<ISO timestamp>_<id>" or a bare ISO
+    timestamp; now if `value` is empty. Raises ValueError if it's invalid.
+    """
+    if not value:
+        return timezone.now(), None
+    timestamp, _, last_id = value.partition('_')
+    # parse_datetime() returns None for malformed input and raises ValueError
+    # for well-formed but impossible dates (2024-02-30)
+    parsed = parse_datetime(timestamp)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, int(last_id) if last_id else None
+
+
+def format_position(position):
+    timestamp, last_id = position
+    return timestamp.isoformat() if last_id is None else f'{timestamp.isoformat()}_{last_id}'
+
+
+def parse_timeout(value):
+    """Seconds to wait, clamped to [0, MAX_LONG_POLL_TIMEOUT]. Raises ValueError."""
+    timeout = float(value)
+    if not math.isfinite(timeout):
+        raise ValueError(value)
+    return min(max(timeout, 0), MAX_LONG_POLL_TIMEOUT)
+
+
+def error_response(exc):
+    return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+
+def invalid_since():
+    return JsonResponse({'since': ['Enter a valid ISO 8601 date/time.']}, status=400)
+
+
+def format_event(item):
+    # The position doubles as the SSE id so reconnecting clients resume from it
+    data = JSONRenderer().render(item).decode('utf-8')
+    return f"id: {item['timestamp']}_{item['id']}\nevent: notification\ndata: {data}\n\n"
+
+
+async def event_stream(user, position):
+    subscription = bus.subscribe(user.pk)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_stream_lifetime()
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            data, position = await sync_to_async(fetch_notifications)(user, position)
+            for item in data:
+                yield format_event(item)
+            if len(data) == STREAM_BATCH_SIZE:
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # End the response; EventSource reconnects with Last-Event-ID
+                break
+            woken = await subscription.wait(min(get_poll_interval(), remaining))
+            if not woken:
+                yield ': keep-alive\n\n'
+    finally:
+        subscription.close()
+
+
+async def notification_stream(request):
+    try:
+        user = await sync_to_async(authenticate)(request)
+    except APIException as exc:
+        return error_response(exc)
+
+    try:
+        position = parse_position(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    except ValueError:
+        return invalid_since()
+
+    response = StreamingHttpResponse(event_stream(user, position), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def notification_long_poll(request):
+    try:
+        user = await sync_to_async(authenticate)(request)
+    except APIException as exc:
+        return error_response(exc)
+
+    try:
+        position = parse_position(request.GET.get('since'))
+    except ValueError:
+        return invalid_since()
+    try:
+        timeout = parse_timeout(request.GET.get('timeout', 25))
+    except ValueError:
+        return JsonResponse({'timeout': ['A finite number of seconds is required.']}, status=400)
+
+    subscription = bus.subscribe(user.pk)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            data, position = await sync_to_async(fetch_notifications)(user, position)
+            remaining = deadline - loop.time()
+            if data or remaining <= 0:
+                break
+            await subscription.wait(min(get_poll_interval(), remaining))
+    finally:
+        subscription.close()
+
+    return JsonResponse({'results': data, 'since': format_position(position)})
@@ -0,0 +1,42 @@
+# notifications/targets.py
+
+"""
+Bulk resolution of notification targets.
+
+Notification.target is a GenericForeignKey, so reading it row by row costs a
+query per notification. target_prefetch() resolves a whole page with one
+query per content type (loading only the columns the summary needs), and
+summarize_target() turns the resolved object into the compact dict embedded
+in the API response.
+"""
+
+from django.apps import apps
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+
+# Fields embedded for each target type, keyed by "app_label.model_name"
+TARGET_SUMMARY_FIELDS = {
+    'posts.post': ('id', 'title'),
+    'posts.comment': ('id', 'post_id'),
+    'accounts.customuser': ('id', 'username'),
+}
+
+
+def target_prefetch():
+    querysets = [
+        apps.get_model(label).objects.only(*fields)
+        for label, fields in TARGET_SUMMARY_FIELDS.items()
+    ]
+    return GenericPrefetch('target', querysets)
+
+
+def summarize_target(notification):
+    """Compact {'type': ..., 'id': ..., ...} for the target, or None if it was deleted."""
+    target = notification.target
+    if target is None:
+        return None
+
+    label = f'{target._meta.app_label}.{target._meta.model_name}'
+    summary = {'type': target._meta.model_name}
+    for name in TARGET_SUMMARY_FIELDS.get(label, ('id',)):
+        summary[name] = getattr(target, name)
+    return summary
@@ -1,3 +1,390 @@
-from django.test import TestCase
+import asyncio
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from rest_framework.authtoken.models import Token
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from posts.models import Post
+from .models import Notification, NotificationEvent
+from .bus import bus
+from .pipeline import drain_queue, notify
+from .streams import STREAM_BATCH_SIZE, fetch_notifications, format_position, parse_position
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATION_PIPELINE='outbox')
+class NotificationPipelineTests(APITestCase):
+    """
+    Likes, comments and follows go through the outbox and are coalesced.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='pass12345')
+        self.fans = [CustomUser.objects.create_user(username=f'fan{i}', password='pass12345') for i in range(3)]
+        self.post = Post.objects.create(author=self.author, title='Popular', content='Body')
+
+    def like_as(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.post(reverse('post-like', args=[self.post.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def process_outbox(self):
+        call_command('process_notifications', '--once', stdout=StringIO())
+
+    def test_like_writes_an_event_not_a_notification(self):
+        self.like_as(self.fans[0])
+        self.assertEqual(NotificationEvent.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.process_outbox()
+        self.assertFalse(NotificationEvent.objects.exists())
+        self.assertEqual(Notification.objects.get().actor, self.fans[0])
+
+    def test_likes_are_coalesced(self):
+        for fan in self.fans:
+            self.like_as(fan)
+        self.process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor, self.fans[2])
+        self.assertEqual(notification.actor_count, 3)
+
+        self.client.force_authenticate(user=self.author)
+        response = self.client.get(reverse('notification-list'))
+        self.assertEqual(response.data['results'][0]['summary'], 'fan2 and 2 others liked your post')
+
+    def test_later_events_fold_into_the_unread_notification(self):
+        self.like_as(self.fans[0])
+        self.process_outbox()
+        self.like_as(self.fans[1])
+        self.process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.actor, self.fans[1])
+
+    def test_unlike_before_processing_drops_the_event(self):
+        self.like_as(self.fans[0])
+        self.client.delete(reverse('post-unlike', args=[self.post.id]))
+        self.process_outbox()
+        self.assertFalse(Notification.objects.exists())
+
+    def test_comment_and_follow_notify(self):
+        self.client.force_authenticate(user=self.fans[0])
+        self.client.post(reverse('post-comments-list', kwargs={'post_pk': self.post.id}), {'content': 'Hi'}, format='json')
+        self.client.post(reverse('follow-user', args=[self.author.id]))
+        self.process_outbox()
+
+        self.assertEqual(
+            set(Notification.objects.values_list('verb', flat=True)),
+            {'commented', 'followed'}
+        )
+
+    def unlike_as(self, user):
+        self.client.force_authenticate(user=user)
+        self.client.delete(reverse('post-unlike', args=[self.post.id]))
+
+    def test_unlike_by_an_uncounted_actor_changes_nothing(self):
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        self.process_outbox()
+        # fans[2]'s like is still pending: retracting it must not touch the notification
+        self.like_as(self.fans[2])
+        self.unlike_as(self.fans[2])
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor, notification.actor_count), (self.fans[1], 2))
+
+    def test_unlike_leaves_read_notifications_alone(self):
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        self.process_outbox()
+        Notification.objects.update(is_read=True)
+        self.unlike_as(self.fans[0])
+
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+
+    def test_unlike_by_the_latest_actor_repoints_the_notification(self):
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        self.process_outbox()
+        self.unlike_as(self.fans[1])
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor, notification.actor_count), (self.fans[0], 1))
+        self.assertEqual(list(notification.actor_links.values_list('actor_id', flat=True)), [self.fans[0].pk])
+
+        self.unlike_as(self.fans[0])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_liking_again_is_counted_once(self):
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        self.process_outbox()
+        for _ in range(2):
+            # fans[0] isn't the notification's latest actor
+            self.unlike_as(self.fans[0])
+            self.like_as(self.fans[0])
+            self.process_outbox()
+        self.like_as(self.fans[2])
+        notify(self.author, self.fans[1], 'liked', self.post)
+        self.process_outbox()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.actor_links.count(), 3)
+
+    def test_unfollow_retracts_the_follow_notification(self):
+        self.client.force_authenticate(user=self.fans[0])
+        self.client.post(reverse('follow-user', args=[self.author.id]))
+        self.process_outbox()
+        self.assertTrue(Notification.objects.filter(verb='followed').exists())
+
+        self.client.delete(reverse('unfollow-user', args=[self.author.id]))
+        self.assertFalse(Notification.objects.filter(verb='followed').exists())
+
+    @override_settings(NOTIFICATION_PIPELINE='memory', LIKE_COUNTER_FLUSH='sync')
+    def test_memory_pipeline_queues_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.like_as(self.fans[0])
+        self.assertFalse(NotificationEvent.objects.exists())
+
+        # Run the on-commit hand-over, then drain in this thread instead of the worker
+        with mock.patch('notifications.pipeline.start_worker'):
+            for callback in callbacks:
+                callback()
+            drain_queue()
+        self.assertEqual(Notification.objects.get().actor, self.fans[0])
+
+    @override_settings(NOTIFICATION_PIPELINE='memory', LIKE_COUNTER_FLUSH='sync')
+    def test_memory_pipeline_unlike_cancels_the_queued_like(self):
+        with mock.patch('notifications.pipeline.start_worker'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.like_as(self.fans[0])
+                self.like_as(self.fans[1])
+            with self.captureOnCommitCallbacks(execute=True):
+                self.unlike_as(self.fans[0])
+            drain_queue()
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor, notification.actor_count), (self.fans[1], 1))
+
+        # Once processed, a queued retraction takes the actor out of the stored notification
+        with mock.patch('notifications.pipeline.start_worker'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.unlike_as(self.fans[1])
+            drain_queue()
+        self.assertFalse(Notification.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class NotificationReadTests(APITestCase):
+    """
+    Paginated listing, unread counts and explicit mark-as-read.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='reader', password='pass12345')
+        self.actor = CustomUser.objects.create_user(username='actor', password='pass12345')
+        self.post = Post.objects.create(author=self.user, title='Mine', content='Body')
+        self.notifications = [
+            Notification.objects.create(recipient=self.user, actor=self.actor, verb=f'verb{i}', target=self.post)
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def test_listing_does_not_mark_as_read(self):
+        response = self.client.get(reverse('notification-list') + '?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 3)
+
+    def test_since_returns_only_newer_notifications(self):
+        since = self.notifications[1].timestamp.isoformat()
+        response = self.client.get(reverse('notification-list'), {'since': since})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.notifications[2].id])
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get(reverse('notification-list'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_impossible_since_date_is_rejected(self):
+        for name in ('notification-list', 'notification-list-async'):
+            response = self.client.get(reverse(name), {'since': '2024-02-30T00:00:00'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_mark_read_only_touches_given_ids(self):
+        other = CustomUser.objects.create_user(username='other', password='pass12345')
+        foreign = Notification.objects.create(recipient=other, actor=self.actor, verb='liked', target=self.post)
+
+        response = self.client.post(
+            reverse('notification-mark-read'),
+            {'ids': [self.notifications[0].id, foreign.id]},
+            format='json'
+        )
+        self.assertEqual(response.data['marked_read'], 1)
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.is_read)
+
+        response = self.client.get(reverse('notification-unread-count'))
+        self.assertEqual(response.data['unread_count'], 2)
+        response = self.client.get(reverse('notification-list'), {'unread': 'true'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_async_list_matches(self):
+        for params in ({}, {'page_size': 2}, {'unread': 'true'}, {'since': 'not-a-date'}):
+            expected = self.client.get(reverse('notification-list'), params)
+            response = self.client.get(reverse('notification-list-async'), params)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(
+                response.content.decode().replace(reverse('notification-list-async'), reverse('notification-list')),
+                expected.content.decode(),
+            )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class NotificationTargetResolutionTests(APITestCase):
+    """
+    Notification pages resolve their generic targets with a fixed number of queries.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='owner', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+
+    def add_notifications(self, count):
+        for i in range(count):
+            actor = CustomUser.objects.create_user(username=f'actor{Notification.objects.count()}', password='pass12345')
+            post = Post.objects.create(author=self.user, title=f'Post {i}', content='Body')
+            Notification.objects.create(recipient=self.user, actor=actor, verb='liked', target=post)
+            Notification.objects.create(recipient=self.user, actor=actor, verb='followed', target=self.user)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('notification-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_notifications(1)
+        few, _ = self.count_list_queries()
+        self.add_notifications(4)
+        many, response = self.count_list_queries()
+
+        self.assertEqual(few, many)
+        targets = [item['target'] for item in response.data['results']]
+        self.assertIn({'type': 'customuser', 'id': self.user.id, 'username': 'owner'}, targets)
+        self.assertTrue(any(target['type'] == 'post' and 'title' in target for target in targets))
+
+    def test_deleted_target_is_null(self):
+        self.add_notifications(1)
+        Post.objects.all().delete()
+        _, response = self.count_list_queries()
+        liked = [item for item in response.data['results'] if item['verb'] == 'liked']
+        self.assertIsNone(liked[0]['target'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATION_PIPELINE='sync', NOTIFICATION_STREAM_POLL_INTERVAL=30)
+class NotificationPushTests(APITestCase):
+    """
+    Long-poll and SSE endpoints (async views).
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='listener', password='pass12345')
+        self.actor = CustomUser.objects.create_user(username='actor', password='pass12345')
+        self.post = Post.objects.create(author=self.user, title='Watched', content='Body')
+        self.headers = {'authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    async def test_long_poll_requires_a_token(self):
+        response = await self.async_client.get(reverse('notification-poll'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # API tokens aren't accepted in the query string, where access logs keep them
+        key = self.headers['authorization'].split()[1]
+        response = await self.async_client.get(reverse('notification-poll'), {'token': key, 'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_ticket_authenticates_the_push_channels(self):
+        response = await self.async_client.post(reverse('notification-stream-ticket'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ticket = response.json()['ticket']
+
+        response = await self.async_client.get(reverse('notification-poll'), {'ticket': ticket, 'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(reverse('notification-poll'), {'ticket': ticket + 'x', 'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_long_poll_rejects_bad_since_and_timeout(self):
+        for params in ({'since': '2024-02-30T00:00:00'}, {'timeout': 'nan'}, {'timeout': 'inf'}, {'timeout': 'soon'}):
+            response = await self.async_client.get(reverse('notification-poll'), params, headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_reads_continue_inside_a_run_of_equal_timestamps(self):
+        started = timezone.now() - timedelta(seconds=1)
+        Notification.objects.bulk_create(
+            Notification(recipient=self.user, actor=self.actor, verb=f'verb{i}', target=self.post)
+            for i in range(STREAM_BATCH_SIZE + 10)
+        )
+        # Coalesced rows are bulk-updated with one shared timestamp
+        Notification.objects.update(timestamp=timezone.now())
+
+        first, position = fetch_notifications(self.user, (started, None))
+        second, position = fetch_notifications(self.user, position)
+        third, _ = fetch_notifications(self.user, position)
+        self.assertEqual(len(first), STREAM_BATCH_SIZE)
+        self.assertEqual(len({item['id'] for item in first + second}), STREAM_BATCH_SIZE + 10)
+        self.assertEqual(third, [])
+        self.assertEqual(parse_position(format_position(position)), position)
+
+    async def test_long_poll_returns_existing_notifications_immediately(self):
+        since = timezone.now().isoformat()
+        await sync_to_async(notify)(self.user, self.actor, 'liked', self.post)
+
+        response = await self.async_client.get(reverse('notification-poll'), {'since': since}, headers=self.headers)
+        self.assertEqual([item['verb'] for item in response.json()['results']], ['liked'])
+
+    async def test_long_poll_is_woken_by_the_bus(self):
+        async def like_soon():
+            await asyncio.sleep(0.1)
+            # TestCase never commits, so run the pipeline's on-commit publish by hand
+            await sync_to_async(notify)(self.user, self.actor, 'liked', self.post)
+            bus.publish([self.user.pk])
+
+        started = time.monotonic()
+        task = asyncio.ensure_future(like_soon())
+        response = await self.async_client.get(reverse('notification-poll'), {'timeout': 5}, headers=self.headers)
+        await task
+
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertLess(time.monotonic() - started, 2)
+
+    async def test_long_poll_times_out_empty(self):
+        response = await self.async_client.get(reverse('notification-poll'), {'timeout': 0.05}, headers=self.headers)
+        self.assertEqual(response.json()['results'], [])
+
+    @override_settings(NOTIFICATION_STREAM_MAX_SECONDS=0)
+    async def test_stream_sends_events_after_last_event_id(self):
+        since = timezone.now().isoformat()
+        await sync_to_async(notify)(self.user, self.actor, 'liked', self.post)
+
+        response = await self.async_client.get(
+            reverse('notification-stream'),
+            headers=dict(self.headers, **{'last-event-id': since}),
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertIn('event: notification', body)
+        self.assertIn('"verb":"liked"', body)
@@ -1,9 +1,22 @@
 # notifications/urls.py
 
 from django.urls import path
-from .views import NotificationListView
+from .views import NotificationListView, NotificationUnreadCountView, NotificationMarkReadView
+from .views import NotificationStreamTicketView
+from .streams import notification_stream, notification_long_poll
+from .async_views import AsyncNotificationListView
 
 urlpatterns = [
-    # Endpoint to list and automatically mark notifications as read
+    # Endpoint to list notifications (paginated, supports ?since= and ?unread=true)
     path('', NotificationListView.as_view(), name='notification-list'),
+    path('unread-count/', NotificationUnreadCountView.as_view(), name='notification-unread-count'),
+    # Explicitly mark the listed ids as read
+    path('mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
+    # Push channels (async views, run under ASGI): Server-Sent Events and long-poll fallback
+    path('stream/', notification_stream, name='notification-stream'),
+    path('poll/', notification_long_poll, name='notification-poll'),
+    # Short-lived ?ticket= for EventSource clients, which cannot send the token header
+    path('stream/ticket/', NotificationStreamTicketView.as_view(), name='notification-stream-ticket'),
+    # Async variant of the list for ASGI deployments
+    path('async/', AsyncNotificationListView.as_view(), name='notification-list-async'),
 ]
\ No newline at end of file
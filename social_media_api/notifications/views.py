@@ -1,9 +1,14 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.utils.dateparse import parse_datetime
 from .models import Notification
-from .serializers import NotificationSerializer
+from .serializers import NotificationSerializer, NotificationMarkReadSerializer
+from .targets import target_prefetch
+from .streams import get_ticket_max_age, issue_stream_ticket
+from social_media_api.pagination import NotificationKeysetPagination
 
 # Create your views here.
 
@@ -13,20 +18,94 @@ from .serializers import NotificationSerializer
 
 class NotificationListView(generics.ListAPIView):
     """
-    Lists notifications for the authenticated user, ordered by timestamp.
+    Lists notifications for the authenticated user, newest first, one keyset page
+    at a time. Listing no longer marks anything as read; clients acknowledge the
+    ids they displayed through NotificationMarkReadView.
+
+    Query parameters:
+        since  - ISO 8601 timestamp; only notifications newer than it (polling)
+        unread - 'true' to only list unread notifications
     """
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationKeysetPagination
 
     def get_queryset(self):
-        # Only fetch notifications addressed to the current user
-        return Notification.objects.filter(recipient=self.request.user).order_by('-timestamp')
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        
-        # Automatically mark all fetched notifications as read
-        queryset.filter(is_read=False).update(is_read=True)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return notification_queryset(self.request)
+
+
+def notification_queryset(request):
+    """
+    The current user's notifications, newest first, filtered by ?since= and ?unread=.
+    Shared with the async variant (notifications/async_views.py).
+    """
+    # Only fetch notifications addressed to the current user, with the actor,
+    # content type and targets loaded in bulk (one query per target type)
+    queryset = (
+        Notification.objects.filter(recipient=request.user)
+        .select_related('actor', 'content_type')
+        .prefetch_related(target_prefetch())
+    )
+
+    since = request.query_params.get('since')
+    if since:
+        try:
+            # None if malformed; ValueError if well-formed but impossible (2024-02-30)
+            timestamp = parse_datetime(since)
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise ValidationError({'since': 'Enter a valid ISO 8601 date/time.'})
+        queryset = queryset.filter(timestamp__gt=timestamp)
+
+    if request.query_params.get('unread') in ('1', 'true', 'True'):
+        queryset = queryset.filter(is_read=False)
+
+    return queryset.order_by('-timestamp', '-id')
+
+
+class NotificationUnreadCountView(generics.GenericAPIView):
+    """
+    Returns the number of unread notifications, counted on the
+    (recipient, is_read, timestamp) index without reading any rows.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
+        return Response({'unread_count': count})
+
+
+class NotificationMarkReadView(generics.GenericAPIView):
+    """
+    Marks the given notification ids as read (POST {"ids": [...]}).
+    Only the listed, still-unread notifications of the current user are updated.
+    """
+    serializer_class = NotificationMarkReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        updated = Notification.objects.filter(
+            recipient=request.user,
+            pk__in=serializer.validated_data['ids'],
+            is_read=False,
+        ).update(is_read=True)
+
+        return Response({'marked_read': updated}, status=status.HTTP_200_OK)
+
+
+class NotificationStreamTicketView(generics.GenericAPIView):
+    """
+    Issues a short-lived ticket for the push channels (notifications/streams.py),
+    passed as ?ticket= by EventSource clients, which cannot send the token header.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return Response(
+            {'ticket': issue_stream_ticket(request.user), 'expires_in': get_ticket_max_age()},
+            status=status.HTTP_201_CREATED,
+        )
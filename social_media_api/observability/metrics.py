@@ -0,0 +1,298 @@
+# observability/metrics.py
+
+"""
+Per-process request metrics in the Prometheus text format. Each Django
+project of this repository (social_media_api, django_blog) carries an
+identical copy of this package next to its manage.py; change both.
+
+MetricsMiddleware records, per URL name (`user-feed`, `blog:post_list`, ...):
+
+    http_requests_total                 requests by method and status
+    http_request_duration_seconds       latency histogram
+    db_queries_per_request              histogram of SQL queries per request
+    cache_lookups_total                 hits/misses reported by the project's
+                                        caches (observe_cache)
+
+and GET /metrics/ (metrics_view) renders them for a Prometheus scrape
+(requests from METRICS_ALLOWED_IPS only; None allows everyone).
+
+Recording takes no lock: every thread writes to its own shard, and a scrape
+merges the shards. A finished thread's shard is folded into a base shard the
+next time a thread starts recording or a scrape runs, so the number of
+shards follows the live threads, not every thread ever started. Each worker
+process keeps its own numbers, so scrape every worker (or sum them in
+Prometheus). Latency of a streaming response covers producing the response,
+not streaming it.
+"""
+
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+UNMATCHED = '<unmatched>'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Shard:
+    """One thread's metrics; only that thread ever writes to it."""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.latency = {}
+        self.queries = {}
+        self.cache = Counter()
+
+    def histogram(self, table, view, buckets):
+        histogram = table.get(view)
+        if histogram is None:
+            histogram = table[view] = Histogram(buckets)
+        return histogram
+
+    def merge(self, other):
+        # dict.copy() is atomic under the GIL, so a concurrent insert can't break the loop
+        self.requests.update(other.requests.copy())
+        self.cache.update(other.cache.copy())
+        for table, target, buckets in ((other.latency, self.latency, LATENCY_BUCKETS),
+                                       (other.queries, self.queries, QUERY_BUCKETS)):
+            for view, histogram in table.copy().items():
+                self.histogram(target, view, buckets).merge(histogram)
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        # Numbers of the threads that have finished
+        self._base = Shard()
+        # (thread, shard) of the threads that may still be recording
+        self._shards = []
+        # Only taken the first time a thread records something, and by scrapes
+        self._shards_lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._shards_lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_finished(self):
+        # A finished thread can't write to its shard any more, so it can be merged away
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._base.merge(shard)
+        self._shards = live
+
+    def snapshot(self):
+        """Merge every thread's shard into one."""
+        merged = Shard()
+        with self._shards_lock:
+            self._fold_finished()
+            merged.merge(self._base)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            merged.merge(shard)
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            self._base = Shard()
+            self._shards = []
+        self._local = threading.local()
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('view', 'queries')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+
+
+# Stats of the request being handled; follows sync views into ASGI worker threads
+_current_request = ContextVar('metrics_request', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+    return execute(sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install)
+
+
+def observe_cache(cache_name, hits, misses):
+    """Record cache lookups, attributed to the current request's URL name."""
+    stats = _current_request.get()
+    view = stats.view if stats is not None and stats.view else UNMATCHED
+    shard = registry.shard()
+    if hits:
+        shard.cache[cache_name, view, 'hit'] += hits
+    if misses:
+        shard.cache[cache_name, view, 'miss'] += misses
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match and match.view_name else UNMATCHED
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # URL resolution happens after this middleware starts; name the request
+        # here so cache lookups made by the view are attributed to it
+        stats = _current_request.get()
+        if stats is not None:
+            stats.view = view_name(request)
+
+    def record(self, request, response, stats, elapsed):
+        view = view_name(request)
+        shard = registry.shard()
+        shard.requests[view, request.method, response.status_code] += 1
+        shard.histogram(shard.latency, view, LATENCY_BUCKETS).observe(elapsed)
+        shard.histogram(shard.queries, view, QUERY_BUCKETS).observe(stats.queries)
+
+
+# --- Exposition ---
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, table):
+    for view, histogram in sorted(table.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(view=view, le=bound)} {cumulative}'
+        yield f'{name}_bucket{_labels(view=view, le="+Inf")} {histogram.count}'
+        yield f'{name}_sum{_labels(view=view)} {histogram.sum}'
+        yield f'{name}_count{_labels(view=view)} {histogram.count}'
+
+
+def render_metrics():
+    snapshot = registry.snapshot()
+    lines = [
+        '# HELP http_requests_total Requests by URL name, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(snapshot.requests.items()):
+        lines.append(f'http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Time to produce the response, by URL name.',
+        '# TYPE http_request_duration_seconds histogram',
+        *_histogram_lines('http_request_duration_seconds', snapshot.latency),
+        '# HELP db_queries_per_request SQL queries run per request, by URL name.',
+        '# TYPE db_queries_per_request histogram',
+        *_histogram_lines('db_queries_per_request', snapshot.queries),
+        '# HELP cache_lookups_total Cache lookups by cache, URL name and result.',
+        '# TYPE cache_lookups_total counter',
+    ]
+    for (cache_name, view, result), count in sorted(snapshot.cache.items()):
+        lines.append(f'cache_lookups_total{_labels(cache=cache_name, view=view, result=result)} {count}')
+
+    lines += [
+        '# HELP cache_hit_ratio Share of lookups served from the cache since the process started.',
+        '# TYPE cache_hit_ratio gauge',
+    ]
+    totals = Counter()
+    for (cache_name, _, result), count in snapshot.cache.items():
+        totals[cache_name, result] += count
+    for cache_name in sorted({cache_name for cache_name, _ in totals}):
+        hits, misses = totals[cache_name, 'hit'], totals[cache_name, 'miss']
+        lines.append(f'cache_hit_ratio{_labels(cache=cache_name)} {hits / (hits + misses) if hits + misses else 0.0}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,78 @@
+# posts/async_views.py
+
+"""
+Async variants of the feed and post read endpoints, for ASGI deployments
+(`uvicorn social_media_api.asgi:application`).
+
+    GET /api/async/feed/         UserFeedAPIView (latest mode)
+    GET /api/async/posts/        PostViewSet.list
+    GET /api/async/posts/<id>/   PostViewSet.retrieve
+
+The default shape is served from the post payload cache exactly as the sync
+views do, with the page of ids read through the async ORM (the feed's
+merged page in a worker thread) and the payloads
+and has_liked flags fetched concurrently (asyncio.gather). ?fields=,
+?expand= and ?mode=ranked requests are delegated to the sync views.
+
+Django 5.2 still runs async ORM calls on the request's sync thread, so the
+gathered reads don't overlap on one connection yet; what the async views
+buy today is that a slow query no longer pins a worker for the request.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from social_media_api.async_views import AsyncAPIView
+from social_media_api.fieldsets import SparseFieldsetViewMixin
+from social_media_api.pagination import KeysetPagination
+
+from .models import Post
+from .views import PostPayloadCacheMixin, PostViewSet, UserFeedAPIView
+
+
+class AsyncPostReadView(PostPayloadCacheMixin, SparseFieldsetViewMixin, AsyncAPIView):
+    pagination_class = KeysetPagination
+
+    def is_delegated(self):
+        return not self.can_use_post_cache()
+
+    async def list_posts(self, queryset):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset.only('id', 'created_at'), self.request, view=self)
+        data = await self.arender_cached_posts([post.id for post in page])
+        return self.render(paginator.get_paginated_response(data).data)
+
+
+class AsyncUserFeedView(AsyncPostReadView):
+    sync_view = staticmethod(UserFeedAPIView.as_view())
+
+    def is_delegated(self):
+        return super().is_delegated() or self.request.query_params.get('mode', 'latest') != 'latest'
+
+    fetch_feed_page = UserFeedAPIView.fetch_feed_page
+
+    async def get(self, request, *args, **kwargs):
+        # The page merges two queries and reads the follow graph cache
+        paginator = self.pagination_class()
+        page = await sync_to_async(paginator.paginate_keyset)(self.fetch_feed_page, Post, self.request)
+        data = await self.arender_cached_posts([row.id for row in page])
+        return self.render(paginator.get_paginated_response(data).data)
+
+
+class AsyncPostListView(AsyncPostReadView):
+    authentication_required = False
+    sync_view = staticmethod(PostViewSet.as_view({'get': 'list'}))
+
+    async def get(self, request, *args, **kwargs):
+        return await self.list_posts(Post.objects.all())
+
+
+class AsyncPostDetailView(AsyncPostReadView):
+    authentication_required = False
+    sync_view = staticmethod(PostViewSet.as_view({'get': 'retrieve'}))
+
+    async def get(self, request, pk, *args, **kwargs):
+        data = await self.arender_cached_posts([int(pk)])
+        if not data:
+            raise Http404
+        return self.render(data[0])
@@ -0,0 +1,104 @@
+# posts/bulk.py
+
+"""
+Bulk post import (POST /api/posts/bulk/), for moving content over from
+other platforms without one request and serializer round trip per post.
+
+The body is a JSON array of posts or an NDJSON upload, one post per line
+(social_media_api/parsers.py), which is decoded as it is consumed. Items
+are validated in a single pass and inserted with bulk_create,
+POST_BULK_BATCH_SIZE at a time, all in one transaction: if any item is
+invalid nothing is saved and the errors of every invalid item are returned,
+keyed by its position in the upload. Each inserted batch is fanned out to
+the author's followers at once (timeline.fan_out_posts).
+
+At most POST_BULK_MAX_ITEMS posts are accepted per request.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Post
+from .serializers import PostImportSerializer
+from .timeline import fan_out_posts, get_fanout_limit
+
+
+def get_bulk_batch_size():
+    return getattr(settings, 'POST_BULK_BATCH_SIZE', 500)
+
+
+def get_bulk_max_items():
+    return getattr(settings, 'POST_BULK_MAX_ITEMS', 10000)
+
+
+def import_posts(author, items):
+    """
+    Create a post by `author` for each dict in `items` (title, content).
+    Returns the new ids in input order; raises ValidationError, having saved
+    nothing, if any item is invalid.
+    """
+    batch_size = get_bulk_batch_size()
+    max_items = get_bulk_max_items()
+    # Pushed authors' posts are saved already marked, so fan-out needs no UPDATE
+    fanned_out = author.followers_count <= get_fanout_limit()
+    errors = {}
+    ids = []
+    batch = []
+
+    with transaction.atomic():
+        for index, item in enumerate(items):
+            if index == max_items:
+                raise ValidationError({'non_field_errors': [f'At most {max_items} posts can be imported at once.']})
+            serializer = PostImportSerializer(data=item)
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+            elif not errors:
+                # After the first error the rest is only validated, for the report
+                batch.append(Post(author=author, is_fanned_out=fanned_out, **serializer.validated_data))
+                if len(batch) == batch_size:
+                    ids.extend(insert_batch(author, batch))
+                    batch = []
+
+        # Raised inside the transaction: rolls back the batches already inserted
+        if errors:
+            raise ValidationError(errors)
+        if batch:
+            ids.extend(insert_batch(author, batch))
+    return ids
+
+
+def insert_batch(author, posts):
+    Post.objects.bulk_create(posts)
+    if posts[0].pk is None:
+        assign_ids(author, posts)
+
+    fan_out_posts(author, posts)
+    return [post.pk for post in posts]
+
+
+def assign_ids(author, posts):
+    """
+    Read back the ids bulk_create couldn't return (MySQL).
+
+    The rows of one INSERT get increasing ids in row order, but not
+    necessarily consecutive ones (auto_increment_increment > 1,
+    innodb_autoinc_lock_mode=2), and the author may be posting from another
+    request meanwhile. So the author's rows since the batch's first
+    created_at are walked in id order and matched to the posts, in order,
+    by their values.
+    """
+    pending = iter(posts)
+    post = next(pending)
+    rows = (
+        Post.objects.filter(author=author, created_at__gte=min(item.created_at for item in posts))
+        .order_by('pk')
+        .values_list('pk', 'created_at', 'title', 'content')
+    )
+    for pk, created_at, title, content in rows.iterator(chunk_size=len(posts)):
+        if (created_at, title, content) == (post.created_at, post.title, post.content):
+            post.pk = pk
+            post = next(pending, None)
+            if post is None:
+                return
+    raise RuntimeError(f'Could not read back the ids of {len(posts)} imported posts.')
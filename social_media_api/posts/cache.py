@@ -0,0 +1,135 @@
+# posts/cache.py
+
+"""
+Cache of serialized post payloads.
+
+Each post has a version number in the cache; payloads are stored under
+posts:payload:<id>:<version>. Write paths (post update/delete, comments,
+likes) call invalidate_post(), which bumps the version so every process
+stops reading the old payload at once, and a reader that raced with the
+write can only store its result under the old, unreachable version.
+
+The backend is whatever CACHES['default'] (or POST_CACHE_ALIAS) points to:
+local memory in development, Redis when REDIS_URL is set.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from observability.metrics import observe_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached payload shape changes so old entries are ignored
+PAYLOAD_SCHEMA = 1
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'POST_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'POST_CACHE_TIMEOUT', 300)
+
+
+def version_key(post_id):
+    return f'posts:version:{post_id}'
+
+
+def payload_key(post_id, version):
+    return f'posts:payload:{PAYLOAD_SCHEMA}:{post_id}:{version}'
+
+
+def get_versions(post_ids):
+    """
+    Return {post_id: version}. Missing versions are initialised to the current
+    time in nanoseconds, so a version evicted from the cache never comes back
+    as a number an older payload was stored under.
+    """
+    cache = get_cache()
+    keys = {version_key(post_id): post_id for post_id in post_ids}
+    found = cache.get_many(keys.keys())
+
+    versions = {}
+    for key, post_id in keys.items():
+        if key in found:
+            versions[post_id] = found[key]
+        else:
+            version = time.time_ns()
+            # add() keeps whichever process initialised the version first
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+            versions[post_id] = version
+    return versions
+
+
+def get_post_payloads(post_ids, load):
+    """
+    Return {post_id: payload} for the given ids. Cached payloads are read in a
+    single get_many; the rest are built by load(missing_ids), which must return
+    {post_id: payload}, and stored for the next reader.
+    """
+    if not post_ids:
+        return {}
+
+    cache = get_cache()
+    versions = get_versions(post_ids)
+    keys = {payload_key(post_id, versions[post_id]): post_id for post_id in post_ids}
+    found = cache.get_many(keys.keys())
+    payloads = {keys[key]: payload for key, payload in found.items()}
+
+    missing = [post_id for post_id in post_ids if post_id not in payloads]
+    record_lookups(hits=len(payloads), misses=len(missing))
+
+    if missing:
+        loaded = load(missing)
+        cache.set_many(
+            {payload_key(post_id, versions[post_id]): payload for post_id, payload in loaded.items()},
+            timeout=get_timeout(),
+        )
+        payloads.update(loaded)
+    return payloads
+
+
+def invalidate_post(post_id):
+    """Make every cached payload of the post unreachable."""
+    cache = get_cache()
+    key = version_key(post_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No version yet (or it was evicted): start a fresh one
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def record_lookups(hits, misses):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+    observe_cache('post_payload', hits, misses)
+    logger.debug('post cache: %d hit(s), %d miss(es)', hits, misses)
+
+
+def get_cache_stats():
+    """Per-process hit/miss counters for the post payload cache."""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
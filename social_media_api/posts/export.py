@@ -0,0 +1,121 @@
+# posts/export.py
+
+"""
+Export of everything a user wrote: their posts, comments and likes, as
+NDJSON (one {"type": ..., ...} object per line) or CSV (one row per record,
+with the union of the columns).
+
+Served by GET /api/export/ (a StreamingHttpResponse) and written by
+`python manage.py export_user_data`. Nothing is held per account: rows are
+read EXPORT_CHUNK_SIZE at a time as value tuples, no model instances or
+serializers, and encoded as they are sent.
+
+Each chunk is its own short keyset query (pk > last pk seen) streamed with
+.iterator(): a cursor is never held open while a slow client downloads,
+and memory stays flat on MySQL too, whose driver buffers the whole result
+of a query rather than streaming it.
+"""
+
+import csv
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Like, Post
+
+# (record type, model, owner field, exported columns)
+EXPORTS = (
+    ('post', Post, 'author_id',
+     ('id', 'title', 'content', 'image', 'created_at', 'updated_at', 'like_count', 'comment_count')),
+    ('comment', Comment, 'author_id', ('id', 'post_id', 'content', 'created_at', 'updated_at')),
+    ('like', Like, 'user_id', ('id', 'post_id', 'created_at')),
+)
+
+CSV_COLUMNS = (
+    'type', 'id', 'post_id', 'title', 'content', 'image',
+    'created_at', 'updated_at', 'like_count', 'comment_count',
+)
+
+# Encoded lines are sent in pieces of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def iter_rows(queryset, columns, chunk_size):
+    """Yield value dicts for `queryset` in primary key order, one query per chunk."""
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        page = page.order_by('pk').values_list(*columns)[:chunk_size]
+        count = 0
+        for row in page.iterator(chunk_size=chunk_size):
+            count += 1
+            yield dict(zip(columns, row))
+        if count < chunk_size:
+            return
+        last_pk = row[0]
+
+
+def iter_records(user, chunk_size=None):
+    """Yield (record type, values) for every post, comment and like of `user`."""
+    chunk_size = chunk_size or get_chunk_size()
+    for record_type, model, owner_field, columns in EXPORTS:
+        queryset = model.objects.filter(**{owner_field: user.pk})
+        for values in iter_rows(queryset, columns, chunk_size):
+            yield record_type, values
+
+
+def iter_ndjson(records):
+    encoder = DjangoJSONEncoder()
+    for record_type, values in records:
+        yield encoder.encode({'type': record_type, **values}) + '\n'
+
+
+class Echo:
+    """File-like object for csv.writer that hands each row back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record_type, values in records:
+        values = dict(values, type=record_type)
+        yield writer.writerow([csv_value(values.get(column)) for column in CSV_COLUMNS])
+
+
+def csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """Join small lines into larger pieces, so a response isn't written row by row."""
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_user(user, output_format, chunk_size=None):
+    """The export of `user` in `output_format` ('ndjson' or 'csv'), as a generator of text."""
+    encode, _ = FORMATS[output_format]
+    return buffered(encode(iter_records(user, chunk_size)))
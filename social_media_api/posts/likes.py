@@ -0,0 +1,210 @@
+# posts/likes.py
+
+"""
+Like/unlike write path.
+
+A like is one INSERT in a savepoint: a concurrent double-tap hits the
+unique (user, post) constraint, which rolls back only the savepoint and
+tells this request the like already existed. An unlike is one DELETE.
+
+The displayed count lives in the shared cache under posts:likes:<id> and is
+bumped with incr/decr, which returns the new value: no COUNT query and no
+read-back. A missing (or expired, after LIKE_COUNTER_TIMEOUT) counter is
+seeded from the Like rows with cache.add(), never overwriting one another
+request seeded: Post.like_count would miss the deltas not yet written.
+
+Post.like_count itself is written behind. LIKE_COUNTER_FLUSH selects how:
+    'background' - deltas are summed per post in this process and a
+                   background thread applies them every
+                   LIKE_COUNTER_FLUSH_INTERVAL seconds, one UPDATE per
+                   distinct delta, so a burst on a viral post becomes a
+                   single row write
+    'sync'       - the delta is applied as soon as the like commits (tests,
+                   debugging)
+Deltas still buffered when a process dies are lost;
+`python manage.py reconcile_counters` repairs the column.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, F, When
+
+from .cache import invalidate_post
+from .models import Like, Post
+
+logger = logging.getLogger(__name__)
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'LIKE_COUNTER_ALIAS', 'default')]
+
+
+def get_flush_mode():
+    return getattr(settings, 'LIKE_COUNTER_FLUSH', 'background')
+
+
+def counter_key(post_id):
+    return f'posts:likes:{post_id}'
+
+
+# --- Rows ---
+
+def insert_like(user_id, post_id):
+    """
+    Insert the Like unless it exists. Returns True if this call created it;
+    raises Post.DoesNotExist if the post was deleted in the meantime.
+    """
+    try:
+        with transaction.atomic():
+            Like.objects.create(user_id=user_id, post_id=post_id)
+    except IntegrityError:
+        # The unique (user, post) constraint, or the post's foreign key when it
+        # was deleted concurrently: only the first means "already liked"
+        if not Post.objects.filter(pk=post_id).exists():
+            raise Post.DoesNotExist(f'Post {post_id} no longer exists.')
+        return False
+    return True
+
+
+def delete_like(user_id, post_id):
+    """Returns True if there was a Like to delete."""
+    deleted, _ = Like.objects.filter(user_id=user_id, post_id=post_id).delete()
+    return deleted > 0
+
+
+# --- Counts ---
+
+def bump_count(post, delta):
+    """Apply `delta` to the cached count of `post` and return the new count."""
+    cache = get_cache()
+    key = counter_key(post.pk)
+    timeout = getattr(settings, 'LIKE_COUNTER_TIMEOUT', 300)
+    try:
+        count = cache.incr(key, delta)
+    except ValueError:
+        # Not cached (or expired): seed with the count before this request's
+        # own (uncommitted) change, which the rows already include; add() lets
+        # a concurrent seeder win
+        cache.add(key, Like.objects.filter(post_id=post.pk).count() - delta, timeout=timeout)
+        count = cache.incr(key, delta)
+    return max(count, 0)
+
+
+class LikeCounterBuffer:
+    """Per-post like_count deltas waiting to be written."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = Counter()
+
+    def add(self, post_id, delta):
+        with self._lock:
+            self._deltas[post_id] += delta
+
+    def take(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+        # A like and an unlike in the same window cancel out
+        return {post_id: delta for post_id, delta in deltas.items() if delta}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._deltas)
+
+
+buffer = LikeCounterBuffer()
+
+
+def record_like(post, delta):
+    """
+    Account for a like (+1) or unlike (-1) of `post` that this request made.
+    Returns the new like count.
+    """
+    count = bump_count(post, delta)
+    if get_flush_mode() == 'sync':
+        transaction.on_commit(lambda: apply_deltas({post.pk: delta}))
+    else:
+        transaction.on_commit(lambda: defer(post.pk, delta))
+    return count
+
+
+def defer(post_id, delta):
+    buffer.add(post_id, delta)
+    start_flusher()
+
+
+def apply_deltas(deltas):
+    """Write {post_id: delta} to Post.like_count with one UPDATE per distinct delta."""
+    by_delta = defaultdict(list)
+    for post_id, delta in deltas.items():
+        by_delta[delta].append(post_id)
+
+    with transaction.atomic():
+        for delta, post_ids in by_delta.items():
+            if delta > 0:
+                value = F('like_count') + delta
+            else:
+                # Clamp at zero without going through a negative (unsigned on MySQL)
+                value = Case(When(like_count__gt=-delta, then=F('like_count') + delta), default=0)
+            Post.objects.filter(pk__in=post_ids).update(like_count=value)
+        for post_id in deltas:
+            transaction.on_commit(lambda post_id=post_id: invalidate_post(post_id))
+    return len(deltas)
+
+
+def flush_like_counts():
+    """Write every buffered delta. Returns the number of posts updated."""
+    deltas = buffer.take()
+    if not deltas:
+        return 0
+    try:
+        return apply_deltas(deltas)
+    except Exception:
+        # Put them back so the next flush retries
+        for post_id, delta in deltas.items():
+            buffer.add(post_id, delta)
+        raise
+
+
+# --- Background flusher ---
+
+def start_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run_flusher, name='like-counter-flush', daemon=True)
+            _flusher.start()
+
+
+def _run_flusher():
+    interval = getattr(settings, 'LIKE_COUNTER_FLUSH_INTERVAL', 1.0)
+    while True:
+        time.sleep(interval)
+        if not len(buffer):
+            continue
+        try:
+            close_old_connections()
+            flush_like_counts()
+        except Exception:
+            logger.exception('Like counter flush failed')
+        finally:
+            close_old_connections()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _flusher is not None and len(buffer):
+        try:
+            flush_like_counts()
+        except Exception:
+            logger.exception('Like counter flush at exit failed')
@@ -0,0 +1,77 @@
+# posts/management/commands/benchmark_endpoints.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from social_media_api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints against the current database and fail "
+        "if SQL query counts regressed from benchmark_queries.json, or, given "
+        "--baseline, if p95 latency regressed from that local baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Measured requests per scenario (default: 20).')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (repeatable).')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='Also compare p95 latency with this baseline, recorded on this '
+                                 'machine against the same dataset.')
+        parser.add_argument('--write-baseline', metavar='PATH',
+                            help='Store the results, latency included, as a baseline in PATH instead of checking.')
+        parser.add_argument('--write-query-counts', action='store_true',
+                            help='Store the query counts in social_media_api/benchmark_queries.json '
+                                 'instead of checking.')
+        parser.add_argument('--latency-tolerance', type=float, default=1.25,
+                            help='Allowed p95 growth factor over --baseline (default: 1.25).')
+
+    def handle(self, *args, **options):
+        # The test client talks to "testserver"; every scenario is rolled back,
+        # so benchmarking leaves the data as it was
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                results = benchmarks.run_benchmarks(options['iterations'], options['scenarios'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        dataset = benchmarks.describe_dataset()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20} {result['queries']:>3} queries   "
+                f"p50 {result['p50_ms']:>8.2f}ms   p95 {result['p95_ms']:>8.2f}ms   p99 {result['p99_ms']:>8.2f}ms"
+            )
+
+        if options['write_baseline'] or options['write_query_counts']:
+            if options['write_baseline']:
+                self.write(options['write_baseline'], dataset, results)
+            if options['write_query_counts']:
+                counts = {name: {'queries': result['queries']} for name, result in results.items()}
+                self.write(benchmarks.QUERY_COUNTS_PATH, dataset, counts)
+            return
+
+        _, expected_counts = benchmarks.load_baseline(benchmarks.QUERY_COUNTS_PATH)
+        regressions = benchmarks.find_regressions(results, expected_counts)
+        if options['baseline']:
+            baseline_dataset, baseline = benchmarks.load_baseline(options['baseline'])
+            if not baseline:
+                raise CommandError(f"No baseline in {options['baseline']}.")
+            if baseline_dataset != dataset:
+                raise CommandError(
+                    f"{options['baseline']} was recorded against a different dataset "
+                    f"({baseline_dataset}, now {dataset}); latencies aren't comparable."
+                )
+            regressions += benchmarks.find_regressions(results, baseline, options['latency_tolerance'])
+        if regressions:
+            raise CommandError('Regressions:\n  ' + '\n  '.join(sorted(set(regressions))))
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def write(self, path, dataset, results):
+        _, stored = benchmarks.load_baseline(path)
+        stored.update(results)
+        benchmarks.write_baseline(dataset, stored, path)
+        self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}."))
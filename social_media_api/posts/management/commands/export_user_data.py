@@ -0,0 +1,40 @@
+# posts/management/commands/export_user_data.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS, export_user, get_chunk_size
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a user's posts, comments and likes as NDJSON or CSV, reading "
+        "the rows in chunks so memory stays flat for any account size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose data is exported.')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson',
+                            help='Output format (default: ndjson).')
+        parser.add_argument('--output', default='-',
+                            help='File to write, or - for stdout (default: -).')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help=f'Rows read per query (default: EXPORT_CHUNK_SIZE, {get_chunk_size()}).')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+
+        pieces = export_user(user, options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+
+        # newline='': the csv module writes its own line endings
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for piece in pieces:
+                output.write(piece)
+        self.stderr.write(self.style.SUCCESS(f"Exported {user.username}'s data to {options['output']}."))
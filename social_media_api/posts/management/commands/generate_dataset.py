@@ -0,0 +1,351 @@
+# posts/management/commands/generate_dataset.py
+
+import random
+import time
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate, groupby
+from operator import itemgetter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser, Follow
+from notifications.models import Notification
+from posts.models import Comment, Like, Post, TimelineEntry
+from posts.timeline import get_fanout_limit
+
+
+@contextmanager
+def historical_timestamps(*fields):
+    """
+    Let bulk_create keep the generated created_at/timestamp values instead of
+    overwriting them with now() (auto_now_add is applied in pre_save).
+    """
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class PowerLaw:
+    """
+    Draws indexes 0..n-1 with probability proportional to 1 / (i + 1) ** exponent,
+    so a few items (users, posts) collect most of the follows, likes and comments.
+    """
+
+    def __init__(self, n, exponent, rng):
+        self.rng = rng
+        self.cum_weights = array('d', accumulate(1.0 / (i + 1) ** exponent for i in range(n)))
+        self.total = self.cum_weights[-1] if n else 0.0
+
+    def sample(self, k):
+        random_ = self.rng.random
+        cum_weights, total = self.cum_weights, self.total
+        return [bisect_right(cum_weights, random_() * total) for _ in range(k)]
+
+
+class GeneratedPosts:
+    """Generated posts as parallel arrays; posts[i] is (id, author_id, created_at, is_fanned_out)."""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.author_ids = array('q')
+        self.timestamps = array('d')
+        self.fanned_out = bytearray()
+
+    def append(self, post_id, author_id, created_at, is_fanned_out):
+        self.ids.append(post_id)
+        self.author_ids.append(author_id)
+        self.timestamps.append(created_at.timestamp())
+        self.fanned_out.append(is_fanned_out)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        created_at = datetime.fromtimestamp(self.timestamps[i], tz=dt_timezone.utc)
+        return self.ids[i], self.author_ids[i], created_at, bool(self.fanned_out[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic social graph (users, follows, posts, comments, likes, "
+        "notifications) with power-law popularity, for load and scaling tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows-per-user', type=float, default=20,
+                            help='Mean out-degree; individual degrees are Pareto distributed.')
+        parser.add_argument('--posts-per-user', type=float, default=5)
+        parser.add_argument('--comments-per-post', type=float, default=2)
+        parser.add_argument('--likes-per-post', type=float, default=10)
+        parser.add_argument('--notifications-per-user', type=float, default=5)
+        parser.add_argument('--exponent', type=float, default=1.0,
+                            help='Popularity skew: weight of the i-th item is 1/i**exponent (default: 1.0).')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Spread content timestamps over this many days (default: 30).')
+        parser.add_argument('--timelines', action='store_true',
+                            help='Also materialize TimelineEntry rows for fanned-out authors.')
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Username prefix of the generated users (default: synthetic).')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk_create (default: 2000).')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2.')
+        if CustomUser.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users prefixed '{options['prefix']}_' already exist; pick another --prefix.")
+
+        self.options = options
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.totals = {}
+        started = time.monotonic()
+
+        user_ids = self.create_users()
+        followers_count = self.create_follows(user_ids)
+        posts = self.create_posts(user_ids, followers_count)
+        self.create_comments(user_ids, posts)
+        likes = self.create_likes(user_ids, posts)
+        self.create_notifications(likes, posts)
+        if options['timelines']:
+            self.create_timelines(posts)
+
+        # Counter columns are derived data; set them at the end, one UPDATE per
+        # --batch-size range of ids
+        call_command('reconcile_counters', batch_size=self.batch_size, stdout=self.stdout)
+
+        rows = sum(self.totals.values())
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} row(s) in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s).'
+        ))
+
+    # --- helpers ---
+
+    def timed(self, label, write):
+        started = time.monotonic()
+        rows = write() or 0
+        elapsed = time.monotonic() - started
+        if rows:
+            self.totals[label] = rows
+            self.stdout.write(f'{label}: {rows} row(s) in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)')
+        return rows
+
+    def bulk_insert(self, model, rows, **kwargs):
+        """Insert an iterable of unsaved instances in batches, one transaction per batch."""
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                count += self.flush(model, batch, **kwargs)
+                batch = []
+                if self.verbosity > 1 and count % (self.batch_size * 50) == 0:
+                    self.stdout.write(f'  {model.__name__}: {count} row(s)...')
+        if batch:
+            count += self.flush(model, batch, **kwargs)
+        return count
+
+    def flush(self, model, batch, **kwargs):
+        with transaction.atomic():
+            model.objects.bulk_create(batch, batch_size=self.batch_size, **kwargs)
+        return len(batch)
+
+    def random_time(self, after=None):
+        """A timestamp within --days of now (and after `after`, if given)."""
+        start = after or self.now - timedelta(days=self.options['days'])
+        return start + (self.now - start) * self.rng.random()
+
+    def pareto_degree(self, mean, cap):
+        # Pareto(alpha=2) has mean 2, so halve it to hit the requested mean
+        return min(cap, int(mean * self.rng.paretovariate(2) / 2))
+
+    # --- tables, in dependency order ---
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        # Hashing is the slow part of create_user; every synthetic user shares one hash
+        password = make_password('password')
+        date_joined = self.now - timedelta(days=self.options['days'])
+
+        self.timed('users', lambda: self.bulk_insert(CustomUser, (
+            CustomUser(username=f'{prefix}_{i}', password=password, date_joined=date_joined)
+            for i in range(self.options['users'])
+        )))
+        # Read the ids back: not every backend returns them from bulk_create
+        return array('q', CustomUser.objects.filter(username__startswith=f'{prefix}_')
+                     .order_by('pk').values_list('pk', flat=True))
+
+    def create_follows(self, user_ids):
+        popularity = PowerLaw(len(user_ids), self.options['exponent'], self.rng)
+        followers_count = [0] * len(user_ids)
+
+        def edges():
+            # Generated follower by follower with sorted followees: inserts arrive in
+            # (follower, followee) index order
+            for i, follower_id in enumerate(user_ids):
+                degree = self.pareto_degree(self.options['follows_per_user'], len(user_ids) - 1)
+                followees = set(popularity.sample(degree))
+                followees.discard(i)
+                for j in sorted(followees):
+                    followers_count[j] += 1
+                    yield Follow(follower_id=follower_id, followee_id=user_ids[j], created_at=self.random_time())
+
+        with historical_timestamps(Follow._meta.get_field('created_at')):
+            self.timed('follows', lambda: self.bulk_insert(Follow, edges()))
+        return followers_count
+
+    def create_posts(self, user_ids, followers_count):
+        count = int(len(user_ids) * self.options['posts_per_user'])
+        # Popular authors post more too
+        popularity = PowerLaw(len(user_ids), self.options['exponent'], self.rng)
+        fanout_limit = get_fanout_limit()
+        start = self.now - timedelta(days=self.options['days'])
+        span = self.now - start
+
+        def new_posts():
+            # Oldest first, so (created_at, id) grows with the primary key, but only
+            # one batch in memory: the --days range is cut into one window per batch,
+            # and each batch's timestamps are drawn in its window and sorted there
+            for first in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - first)
+                window_start = start + span * first / count
+                window = span * size / count
+                timestamps = sorted(window_start + window * self.rng.random() for _ in range(size))
+                for n, author, created_at in zip(range(first, first + size), popularity.sample(size), timestamps):
+                    yield Post(
+                        author_id=user_ids[author],
+                        title=f'Synthetic post {n}',
+                        content='Lorem ipsum dolor sit amet. ' * self.rng.randint(1, 8),
+                        created_at=created_at,
+                        updated_at=created_at,
+                        is_fanned_out=self.options['timelines'] and followers_count[author] <= fanout_limit,
+                    )
+
+        fields = [Post._meta.get_field('created_at'), Post._meta.get_field('updated_at')]
+        with historical_timestamps(*fields):
+            self.timed('posts', lambda: self.bulk_insert(Post, new_posts()))
+
+        # Kept as compact columns: this is the largest in-memory structure
+        posts = GeneratedPosts()
+        rows = (
+            Post.objects.filter(author__username__startswith=f"{self.options['prefix']}_")
+            .order_by('pk')
+            .values_list('pk', 'author_id', 'created_at', 'is_fanned_out')
+        )
+        for row in rows.iterator(chunk_size=self.batch_size):
+            posts.append(*row)
+        return posts
+
+    def create_comments(self, user_ids, posts):
+        if not posts:
+            return
+        count = int(len(posts) * self.options['comments_per_post'])
+        popularity = PowerLaw(len(posts), self.options['exponent'], self.rng)
+
+        def comments():
+            # A batch of targets at a time, each batch in post order
+            for first in range(0, count, self.batch_size):
+                for index in sorted(popularity.sample(min(self.batch_size, count - first))):
+                    post_id, _, created_at, _ = posts[index]
+                    timestamp = self.random_time(after=created_at)
+                    yield Comment(
+                        post_id=post_id,
+                        author_id=user_ids[self.rng.randrange(len(user_ids))],
+                        content='Synthetic comment',
+                        created_at=timestamp,
+                        updated_at=timestamp,
+                    )
+
+        fields = [Comment._meta.get_field('created_at'), Comment._meta.get_field('updated_at')]
+        with historical_timestamps(*fields):
+            self.timed('comments', lambda: self.bulk_insert(Comment, comments()))
+
+    def create_likes(self, user_ids, posts):
+        """Returns a sample of (liker_id, post index) pairs for the notifications."""
+        if not posts:
+            return []
+        popularity = PowerLaw(len(posts), self.options['exponent'], self.rng)
+        count = int(len(posts) * self.options['likes_per_post'])
+        # Likes per post, tallied a batch of draws at a time
+        per_post = array('q', bytes(8 * len(posts)))
+        for first in range(0, count, self.batch_size):
+            for index in popularity.sample(min(self.batch_size, count - first)):
+                per_post[index] += 1
+
+        sample = []
+        keep = self.options['notifications_per_user'] * len(user_ids)
+
+        def likes():
+            for index, total in enumerate(per_post):
+                post_id, _, created_at, _ = posts[index]
+                for liker in self.rng.sample(range(len(user_ids)), min(total, len(user_ids))):
+                    if len(sample) < keep:
+                        sample.append((user_ids[liker], index))
+                    yield Like(user_id=user_ids[liker], post_id=post_id, created_at=self.random_time(after=created_at))
+
+        with historical_timestamps(Like._meta.get_field('created_at')):
+            self.timed('likes', lambda: self.bulk_insert(Like, likes()))
+        return sample
+
+    def create_notifications(self, likes, posts):
+        post_type = ContentType.objects.get_for_model(Post)
+
+        def notifications():
+            for actor_id, index in likes:
+                post_id, author_id, created_at, _ = posts[index]
+                if actor_id == author_id:
+                    continue
+                yield Notification(
+                    recipient_id=author_id, actor_id=actor_id, verb='liked',
+                    content_type=post_type, object_id=post_id,
+                    timestamp=self.random_time(after=created_at),
+                    is_read=self.rng.random() < 0.5,
+                )
+
+        with historical_timestamps(Notification._meta.get_field('timestamp')):
+            self.timed('notifications', lambda: self.bulk_insert(Notification, notifications()))
+
+    def create_timelines(self, posts):
+        # Fanned-out post indexes per author, oldest first (posts are in created_at order)
+        by_author = {}
+        for i in range(len(posts)):
+            if posts.fanned_out[i]:
+                by_author.setdefault(posts.author_ids[i], array('q')).append(i)
+
+        edges = (
+            Follow.objects.filter(follower__username__startswith=f"{self.options['prefix']}_")
+            .order_by('follower_id')
+            .values_list('follower_id', 'followee_id')
+        )
+
+        def entries():
+            # Owner by owner, each timeline in created_at order: inserts follow the
+            # (owner, created_at) index instead of scattering across every timeline
+            for owner_id, group in groupby(edges.iterator(chunk_size=self.batch_size), key=itemgetter(0)):
+                indexes = sorted(i for _, followee_id in group for i in by_author.get(followee_id, ()))
+                for i in indexes:
+                    post_id, author_id, created_at, _ = posts[i]
+                    yield TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+
+        self.timed('timeline entries', lambda: self.bulk_insert(TimelineEntry, entries()))
@@ -0,0 +1,91 @@
+# posts/management/commands/reconcile_counters.py
+
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import CustomUser, Follow
+from posts.cache import invalidate_post
+from posts.models import Comment, Like, Post
+
+
+def count_of(queryset, field):
+    """Coalesce(COUNT(*) of `queryset` rows whose `field` is the outer row, 0)."""
+    totals = (
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    )
+    return Coalesce(Subquery(totals), 0)
+
+
+def notify_fixed(on_fixed, pks):
+    for pk in pks:
+        on_fixed(pk)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized like/comment counters on Post and the "
+        "follower/following counters on CustomUser, fixing any rows that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Range of ids fixed per UPDATE (default: 1000).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted rows without writing them.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        post_rows = self.reconcile(
+            Post, {'like_count': count_of(Like.objects, 'post'), 'comment_count': count_of(Comment.objects, 'post')},
+            batch_size, dry_run, on_fixed=invalidate_post,
+        )
+        user_rows = self.reconcile(
+            CustomUser, {
+                'followers_count': count_of(Follow.objects, 'followee'),
+                'following_count': count_of(Follow.objects, 'follower'),
+            },
+            batch_size, dry_run,
+        )
+
+        action = 'would be fixed' if dry_run else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{post_rows} post(s) and {user_rows} user(s) {action}.'
+        ))
+
+    def reconcile(self, model, counters, batch_size, dry_run, on_fixed=None):
+        """
+        Set each column in `counters` ({column: expression}) to its expression
+        on the rows where they differ, one UPDATE per range of `batch_size` ids.
+
+        The database computes and writes the totals in the same statement, so
+        increments committed while this runs are never overwritten with a total
+        read earlier, and no range's rows are held in memory. `on_fixed(pk)` is
+        called for every fixed row once its range has committed.
+        """
+        drift = Q()
+        for column, actual in counters.items():
+            drift |= ~Q(**{column: actual})
+
+        fixed = 0
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        for start in range(0, last_pk + 1, batch_size):
+            drifted = model.objects.filter(drift, pk__gte=start, pk__lt=start + batch_size)
+            if dry_run:
+                fixed += drifted.count()
+                continue
+            with transaction.atomic():
+                if on_fixed is not None:
+                    pks = list(drifted.values_list('pk', flat=True))
+                    # The drift condition stays part of the UPDATE, so a row
+                    # fixed in the meantime is left alone
+                    drifted = drifted.filter(pk__in=pks)
+                    transaction.on_commit(partial(notify_fixed, on_fixed, pks))
+                fixed += drifted.update(**counters)
+        return fixed
@@ -0,0 +1,116 @@
+# posts/management/commands/refresh_feed_features.py
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from posts.models import AuthorAffinity, Comment, Like, Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the ranked-feed features: Post.engagement_velocity over the "
+        "last FEED_VELOCITY_WINDOW_HOURS and AuthorAffinity over the last "
+        "FEED_AFFINITY_WINDOW_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per bulk write (default: 1000).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+
+        posts = self.refresh_velocity(now, batch_size)
+        pairs = self.refresh_affinity(now, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{posts} post velocity value(s) and {pairs} affinity pair(s) written.'
+        ))
+
+    def refresh_velocity(self, now, batch_size):
+        window_hours = getattr(settings, 'FEED_VELOCITY_WINDOW_HOURS', 24)
+        since = now - timedelta(hours=window_hours)
+
+        likes = Like.objects.filter(post=OuterRef('pk'), created_at__gte=since).order_by().values('post').annotate(total=Count('pk')).values('total')
+        comments = Comment.objects.filter(post=OuterRef('pk'), created_at__gte=since).order_by().values('post').annotate(total=Count('pk')).values('total')
+
+        # Posts with recent activity, plus posts whose old velocity must decay to zero
+        active = Q(likes__created_at__gte=since) | Q(comments__created_at__gte=since) | Q(engagement_velocity__gt=0)
+        candidates = (
+            Post.objects.filter(pk__in=Post.objects.filter(active).values('pk'))
+            .annotate(
+                recent_likes=Coalesce(Subquery(likes), 0),
+                recent_comments=Coalesce(Subquery(comments), 0),
+            )
+            .only('pk', 'engagement_velocity')
+            .order_by('pk')
+        )
+
+        to_update = []
+        for post in candidates.iterator(chunk_size=batch_size):
+            velocity = (post.recent_likes + post.recent_comments) / window_hours
+            if velocity != post.engagement_velocity:
+                post.engagement_velocity = velocity
+                to_update.append(post)
+
+        with transaction.atomic():
+            Post.objects.bulk_update(to_update, ['engagement_velocity'], batch_size=batch_size)
+        return len(to_update)
+
+    def refresh_affinity(self, now, batch_size):
+        """
+        Recompute the pairs of batch_size users at a time, each chunk in its
+        own transaction: its pairs are upserted and the ones without recent
+        interactions deleted, so the table is never empty or rebuilt at once
+        and memory holds one chunk's pairs.
+        """
+        since = now - timedelta(days=getattr(settings, 'FEED_AFFINITY_WINDOW_DAYS', 30))
+        written = 0
+        last_pk = None
+        while True:
+            users = CustomUser.objects.order_by('pk')
+            if last_pk is not None:
+                users = users.filter(pk__gt=last_pk)
+            user_ids = list(users.values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                return written
+            written += self.refresh_affinity_chunk(user_ids[0], user_ids[-1], since, now, batch_size)
+            last_pk = user_ids[-1]
+
+    def refresh_affinity_chunk(self, first_id, last_id, since, now, batch_size):
+        interactions = Counter()
+        for model, user_field in ((Like, 'user_id'), (Comment, 'author_id')):
+            pairs = (
+                model.objects.filter(**{f'{user_field}__gte': first_id, f'{user_field}__lte': last_id}, created_at__gte=since)
+                .exclude(**{user_field: F('post__author_id')})
+                .order_by()
+                .values(user_field, 'post__author_id')
+                .annotate(total=Count('pk'))
+                .values_list(user_field, 'post__author_id', 'total')
+            )
+            for user_id, author_id, total in pairs.iterator(chunk_size=batch_size):
+                interactions[user_id, author_id] += total
+
+        with transaction.atomic():
+            AuthorAffinity.objects.bulk_create(
+                [
+                    AuthorAffinity(user_id=user_id, author_id=author_id, interactions=total, computed_at=now)
+                    for (user_id, author_id), total in interactions.items()
+                ],
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['user', 'author'],
+                update_fields=['interactions', 'computed_at'],
+            )
+            # Pairs not written above had no recent interactions
+            AuthorAffinity.objects.filter(user_id__gte=first_id, user_id__lte=last_id, computed_at__lt=now).delete()
+        return len(interactions)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_like_timelineentry_post_is_fanned_out_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 10000
+
+
+def backfill_counters(apps, schema_editor):
+    """Set like_count/comment_count, which 0004 added at 0, from the rows."""
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    Comment = apps.get_model('posts', 'Comment')
+
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('pk')).values('total')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('pk')).values('total')
+
+    # One UPDATE per range of ids, so no single statement locks the whole table
+    last_pk = Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last_pk + 1, BATCH_SIZE):
+        Post.objects.filter(pk__gte=start, pk__lt=start + BATCH_SIZE).update(
+            like_count=Coalesce(Subquery(likes), 0),
+            comment_count=Coalesce(Subquery(comments), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_ranking_features'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.conf import settings # Use settings.AUTH_USER_MODEL for ForeignKeys to User
 
 
@@ -7,6 +8,37 @@ from django.conf import settings # Use settings.AUTH_USER_MODEL for ForeignKeys
 
 
 
+class PostQuerySet(models.QuerySet):
+    def with_engagement(self, user=None):
+        """
+        Annotate has_liked for the requesting user as an EXISTS subquery, so
+        serializing a page of posts doesn't run a query per post. Like and
+        comment totals are read from the denormalized counter columns.
+        """
+        if user is not None and user.is_authenticated:
+            has_liked = Exists(Like.objects.filter(post=OuterRef('pk'), user=user))
+        else:
+            has_liked = Value(False, output_field=models.BooleanField())
+
+        return self.annotate(has_liked=has_liked)
+
+    def with_comment_preview(self, size=None):
+        """
+        Prefetch only the newest `size` comments of each post into
+        post.latest_comments (Django turns the sliced prefetch into a
+        ROW_NUMBER() window per post), so a post with 50k comments costs
+        the same as one with 3. The full list is served by CommentViewSet.
+        """
+        if size is None:
+            size = get_comment_preview_size()
+        latest = Comment.objects.select_related('author').order_by('-created_at', '-id')[:size]
+        return self.prefetch_related(Prefetch('comments', queryset=latest, to_attr='latest_comments'))
+
+
+def get_comment_preview_size():
+    return getattr(settings, 'POST_COMMENT_PREVIEW_SIZE', 3)
+
+
 class Post(models.Model):
     # ForeignKey to CustomUser (the author)
     author = models.ForeignKey(
@@ -16,19 +48,45 @@ class Post(models.Model):
     )
     title = models.CharField(max_length=255)
     content = models.TextField()
-    
+
     # Optional: For future image/media posts
     image = models.ImageField(upload_to='post_images/', blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # True once the post has been pushed into its followers' timelines.
+    # Posts by high-follower authors stay False and are pulled at read time.
+    is_fanned_out = models.BooleanField(default=False)
+
+    # Denormalized counters, updated with F() expressions by the like/comment
+    # views and repaired by the reconcile_counters management command
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # Ranking feature: likes + comments per hour over the recent window,
+    # refreshed by the refresh_feed_features management command
+    engagement_velocity = models.FloatField(default=0)
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the post list
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # Used by the fan-out-on-read branch of the feed
+            models.Index(fields=['author', 'is_fanned_out', '-created_at'], name='post_author_fanout_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} by {self.author.username}'
 
+    # New related field for likes count (optional, but useful for quick access)
+    @property
+    def total_likes(self):
+        return self.like_count
+
 class Comment(models.Model):
     # ForeignKey to Post
     post = models.ForeignKey(
@@ -52,32 +110,20 @@ class Comment(models.Model):
 
     def __str__(self):
         return f'Comment by {self.author.username} on Post ID {self.post.id}'
-    
 
-class Post(models.Model):
-    # ... (Existing fields)
-    
-    # New related field for likes count (optional, but useful for quick access)
-    @property
-    def total_likes(self):
-        return self.likes.count()
-
-class Comment(models.Model):
-    # ... (Existing model)
-    pass
 
 class Like(models.Model):
     """
     Tracks which users have liked which posts.
     """
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, 
-        on_delete=models.CASCADE, 
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
         related_name='likes'
     )
     post = models.ForeignKey(
-        Post, 
-        on_delete=models.CASCADE, 
+        Post,
+        on_delete=models.CASCADE,
         related_name='likes'
     )
     created_at = models.DateTimeField(auto_now_add=True)
@@ -88,4 +134,69 @@ class Like(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.user.username} likes {self.post.id}"
\ No newline at end of file
+        return f"{self.user.username} likes {self.post.id}"
+
+
+class TimelineEntry(models.Model):
+    """
+    One row per (follower, post) pair: the materialized home timeline.
+    Written when a post is created (fan-out-on-write) so that reading a feed
+    is a single range scan on (owner, created_at).
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Denormalized from the post so unfollowing can prune entries without a join
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Copy of post.created_at, kept here so the timeline index covers the ordering
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        ordering = ['-created_at', '-post']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
+
+
+class AuthorAffinity(models.Model):
+    """
+    How much `user` has recently interacted (likes + comments) with `author`'s
+    posts. Precomputed by refresh_feed_features and read by the ranked feed.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='author_affinities'
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    interactions = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Also serves the ranked feed's (user, author IN (...)) lookup
+            models.UniqueConstraint(fields=['user', 'author'], name='affinity_unique_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.author_id}: {self.interactions}"
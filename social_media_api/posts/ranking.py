@@ -0,0 +1,125 @@
+# posts/ranking.py
+
+"""
+Ranked home feed (GET /feed/?mode=ranked).
+
+Candidates are the newest FEED_RANKING_CANDIDATES posts of the regular feed
+(see timeline.py), read as one narrow row per post. Their features are
+precomputed, so ranking does no aggregation at request time:
+
+    recency     age of the post, decayed with FEED_RANKING_HALF_LIFE_HOURS
+    velocity    Post.engagement_velocity, likes + comments per hour
+    affinity    AuthorAffinity.interactions between the viewer and the author
+
+Velocity and affinity are refreshed by `python manage.py refresh_feed_features`.
+The whole candidate batch is handed to the scorer named by FEED_RANKING_SCORER
+as parallel columns, which returns one score per candidate.
+
+Scores change as posts age and collect likes, so the ranked ids are
+computed on the first page only and kept for FEED_RANKING_SNAPSHOT_TTL
+seconds; the following pages are read from that snapshot
+(SnapshotPagination), without duplicates or gaps.
+"""
+
+import math
+from array import array
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AuthorAffinity, Post
+from .timeline import get_feed_page
+
+DEFAULT_WEIGHTS = {'recency': 1.0, 'velocity': 0.5, 'affinity': 0.3}
+
+
+def get_candidate_limit():
+    return getattr(settings, 'FEED_RANKING_CANDIDATES', 500)
+
+
+def get_snapshot_timeout():
+    return getattr(settings, 'FEED_RANKING_SNAPSHOT_TTL', 600)
+
+
+class CandidateBatch:
+    """Feature columns of the candidate posts, one entry per post."""
+
+    __slots__ = ('post_ids', 'author_ids', 'age_hours', 'velocity', 'affinity')
+
+    def __init__(self, post_ids, author_ids, age_hours, velocity, affinity):
+        self.post_ids = post_ids
+        self.author_ids = author_ids
+        self.age_hours = age_hours
+        self.velocity = velocity
+        self.affinity = affinity
+
+    def __len__(self):
+        return len(self.post_ids)
+
+
+class DefaultScorer:
+    """
+    score = w_recency * 2^(-age / half_life)
+          + w_velocity * log(1 + velocity)
+          + w_affinity * log(1 + affinity)
+    """
+
+    def __init__(self):
+        self.half_life = getattr(settings, 'FEED_RANKING_HALF_LIFE_HOURS', 12)
+        weights = dict(DEFAULT_WEIGHTS, **getattr(settings, 'FEED_RANKING_WEIGHTS', {}))
+        self.w_recency = weights['recency']
+        self.w_velocity = weights['velocity']
+        self.w_affinity = weights['affinity']
+
+    def score(self, batch):
+        decay = -math.log(2) / self.half_life
+        exp, log1p = math.exp, math.log1p
+        return [
+            self.w_recency * exp(decay * age) + self.w_velocity * log1p(velocity) + self.w_affinity * log1p(affinity)
+            for age, velocity, affinity in zip(batch.age_hours, batch.velocity, batch.affinity)
+        ]
+
+
+def get_scorer():
+    return import_string(getattr(settings, 'FEED_RANKING_SCORER', 'posts.ranking.DefaultScorer'))()
+
+
+def load_candidates(user, limit=None):
+    """
+    Four queries: the feed page (timeline and pull-mode posts), the
+    candidates' feature columns, then the viewer's affinity to their authors.
+    """
+    if limit is None:
+        limit = get_candidate_limit()
+
+    post_ids = [row.id for row in get_feed_page(user, limit=limit)]
+    columns = {
+        row[0]: row for row in
+        Post.objects.filter(pk__in=post_ids).values_list('id', 'author_id', 'created_at', 'engagement_velocity')
+    }
+    rows = [columns[post_id] for post_id in post_ids if post_id in columns]
+    affinity = dict(
+        AuthorAffinity.objects.filter(user=user, author_id__in={row[1] for row in rows})
+        .values_list('author_id', 'interactions')
+    )
+
+    now = timezone.now()
+    return CandidateBatch(
+        post_ids=array('q', [row[0] for row in rows]),
+        author_ids=array('q', [row[1] for row in rows]),
+        age_hours=array('d', [max((now - row[2]).total_seconds() / 3600, 0) for row in rows]),
+        velocity=array('d', [row[3] for row in rows]),
+        affinity=array('d', [affinity.get(row[1], 0) for row in rows]),
+    )
+
+
+def rank_feed(user, limit=None):
+    """Candidate post ids for the user's feed, best first."""
+    batch = load_candidates(user, limit)
+    if not len(batch):
+        return []
+    scores = get_scorer().score(batch)
+    # Newer post first on equal scores, so the order is stable between requests
+    order = sorted(range(len(batch)), key=lambda i: (-scores[i], -batch.post_ids[i]))
+    return [batch.post_ids[i] for i in order]
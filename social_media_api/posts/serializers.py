@@ -1,12 +1,12 @@
 # posts/serializers.py
 
 from rest_framework import serializers
-from .models import Post, Comment
-from .models import Like, Post
-from accounts.serializers import CustomUserProfileSerializer # To serialize author data
+from .models import Post, Comment, Like, get_comment_preview_size
+from accounts.serializers import CustomUserProfileSerializer, UserFollowSerializer # To serialize author data
+from social_media_api.fieldsets import SparseFieldsetSerializerMixin
 
 # 1. Comment Serializer (Detailed)
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # Read-only field to display the comment author's username
     author_username = serializers.CharField(source='author.username', read_only=True)
 
@@ -16,25 +16,45 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'post'] # Post and Author are set automatically in the View
 
 # 2. Post Serializer (Detailed)
-class PostSerializer(serializers.ModelSerializer):
-    # Use the CustomUserProfileSerializer for a detailed author profile
-    author = CustomUserProfileSerializer(read_only=True)
-    
-    # Nested field to display the count and list of comments
-    comments = CommentSerializer(many=True, read_only=True)
-    comment_count = serializers.SerializerMethodField()
+class PostSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    # Compact author (id, username); ?expand=author swaps in the full profile
+    author = UserFollowSerializer(read_only=True)
+    expandable_fields = {'author': CustomUserProfileSerializer}
+
+    # Count plus a short preview of the newest comments; the full list is
+    # paginated by the nested /posts/{id}/comments/ endpoint
+    latest_comments = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
+
+    # Like count and whether the requesting user has liked the post
+    total_likes = serializers.IntegerField(read_only=True)
+    has_liked = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = [
-            'id', 'author', 'title', 'content', 'image', 
-            'created_at', 'updated_at', 'comments', 'comment_count'
+            'id', 'author', 'title', 'content', 'image',
+            'created_at', 'updated_at', 'latest_comments', 'comment_count',
+            'total_likes', 'has_liked'
         ]
         read_only_fields = ['author'] # Author is set automatically in the View
 
-    def get_comment_count(self, obj):
-        # Efficiently get the comment count
-        return obj.comments.count()
+    def get_latest_comments(self, obj):
+        # Use the bounded prefetch from PostQuerySet.with_comment_preview() when present
+        if hasattr(obj, 'latest_comments'):
+            comments = obj.latest_comments
+        else:
+            comments = obj.comments.select_related('author').order_by('-created_at', '-id')[:get_comment_preview_size()]
+        return CommentSerializer(comments, many=True, context=self.context).data
+
+    def get_has_liked(self, obj):
+        if hasattr(obj, 'has_liked'):
+            return obj.has_liked
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            # Check if a Like object exists for this user and this post
+            return obj.likes.filter(user=request.user).exists()
+        return False
 
 # 3. Post Creation/Update Serializer (Simplified for input)
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
@@ -43,6 +63,13 @@ class PostCreateUpdateSerializer(serializers.ModelSerializer):
         fields = ['title', 'content', 'image']
 
 
+# 4. Bulk Import Serializer (one item of POST /posts/bulk/, see posts/bulk.py)
+class PostImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        fields = ['title', 'content']
+
+
 class LikeSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
 
@@ -50,24 +77,3 @@ class LikeSerializer(serializers.ModelSerializer):
         model = Like
         fields = ['id', 'username', 'post', 'created_at']
         read_only_fields = ['user', 'post']
-
-# Update PostSerializer to include like count and status
-class PostSerializer(serializers.ModelSerializer):
-    # ... (Other fields)
-    total_likes = serializers.IntegerField(read_only=True)
-    # total_likes must be included in the fields list:
-    # fields = ['id', 'author', 'content', 'created_at', 'total_likes', ...]
-
-    # Optional: Check if the requesting user has liked the post
-    has_liked = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Post
-        fields = ['id', 'author', 'content', 'created_at', 'total_likes', 'has_liked'] # Add total_likes and has_liked
-
-    def get_has_liked(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            # Check if a Like object exists for this user and this post
-            return obj.likes.filter(user=user).exists()
-        return False
\ No newline at end of file
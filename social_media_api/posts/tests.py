@@ -1,3 +1,867 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipIf
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+try:
+    import fakeredis
+except ImportError:  # only needed for the Redis-protocol cache test
+    fakeredis = None
+
+from accounts.models import CustomUser, Follow
+from .models import AuthorAffinity, Comment, Like, Post, TimelineEntry
+from .cache import get_cache_stats, get_versions, invalidate_post, reset_cache_stats, version_key
+from .likes import counter_key, flush_like_counts, insert_like
+from .ranking import rank_feed
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostsAPITestCase(APITestCase):
+    """
+    Base class: starts every test with an empty post payload cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+
+
+class UserFeedTimelineTests(PostsAPITestCase):
+    """
+    Tests for the materialized home timeline behind UserFeedAPIView.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='author', password='pass12345')
+        self.reader = CustomUser.objects.create_user(username='reader', password='pass12345')
+        Follow.objects.create(follower=self.reader, followee=self.author)
+        self.author.followers_count = 1
+        self.author.save(update_fields=['followers_count'])
+        self.feed_url = reverse('user-feed')
+
+    def create_post(self, title='Hello'):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.post(reverse('post-list'), {'title': title, 'content': 'Body'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Post.objects.get(pk=response.data['id'])
+
+    def test_create_post_fans_out_to_followers(self):
+        post = self.create_post()
+
+        self.assertTrue(post.is_fanned_out)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.reader, post=post).exists())
+
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [post.id])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_high_follower_author_is_pulled_at_read_time(self):
+        post = self.create_post()
+
+        self.assertFalse(post.is_fanned_out)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(self.feed_url)
+        self.assertEqual([item['id'] for item in response.data['results']], [post.id])
+
+    def test_feed_merges_timeline_and_pulled_posts_across_pages(self):
+        celebrity = CustomUser.objects.create_user(username='celebrity', password='pass12345', followers_count=10)
+        Follow.objects.create(follower=self.reader, followee=celebrity)
+        base = timezone.now()
+        expected = []
+        for n in range(5):
+            pushed = self.create_post(f'Pushed {n}')
+            pulled = Post.objects.create(author=celebrity, title=f'Pulled {n}', content='Body')
+            # Interleave the two sources in time
+            for offset, post in enumerate((pushed, pulled)):
+                created_at = base - timedelta(minutes=2 * n + offset)
+                Post.objects.filter(pk=post.pk).update(created_at=created_at)
+                TimelineEntry.objects.filter(post=post).update(created_at=created_at)
+                expected.append(post.pk)
+
+        self.client.force_authenticate(user=self.reader)
+        ids, url = [], self.feed_url + '?page_size=3'
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url)
+                ids += [item['id'] for item in response.data['results']]
+                url = response.data['next']
+        self.assertEqual(ids, expected)
+
+        # The timeline is read on its own index, not OR-ed into the post query
+        timeline_reads = [query['sql'] for query in context.captured_queries if 'FROM "posts_timelineentry"' in query['sql']]
+        self.assertTrue(timeline_reads)
+        self.assertFalse([sql for sql in timeline_reads if 'posts_post' in sql or 'LIMIT 4' not in sql])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], expected[6:9])
+
+    def test_follow_backfills_and_unfollow_prunes_timeline(self):
+        newcomer = CustomUser.objects.create_user(username='newcomer', password='pass12345')
+        post = self.create_post()
+
+        self.client.force_authenticate(user=newcomer)
+        response = self.client.post(reverse('follow-user', args=[self.author.id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(TimelineEntry.objects.filter(owner=newcomer, post=post).exists())
+
+        response = self.client.delete(reverse('unfollow-user', args=[self.author.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(TimelineEntry.objects.filter(owner=newcomer).exists())
+
+
+class PostKeysetPaginationTests(PostsAPITestCase):
+    """
+    Tests for the (created_at, id) keyset pagination of the post list.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username='writer', password='pass12345')
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='Body') for i in range(5)]
+        self.client.force_authenticate(user=self.user)
+
+    def test_pages_follow_next_links_without_overlap(self):
+        seen = []
+        url = reverse('post-list') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        expected = [post.id for post in sorted(self.posts, key=lambda p: (p.created_at, p.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_the_earlier_page(self):
+        first = self.client.get(reverse('post-list') + '?page_size=2')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_new_posts_do_not_shift_later_pages(self):
+        first = self.client.get(reverse('post-list') + '?page_size=2')
+        Post.objects.create(author=self.user, title='Newest', content='Body')
+        second = self.client.get(first.data['next'])
+
+        first_ids = {item['id'] for item in first.data['results']}
+        self.assertFalse(first_ids & {item['id'] for item in second.data['results']})
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse('post-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_well_formed_cursor_with_bad_values_returns_404(self):
+        for values in ([123, 5], [[], 5], ['2024-01-01T00:00:00', 'x'], ['2024-02-30T00:00:00', 5], [True, 5],
+                       ['2024-01-01T00:00:00', 2 ** 70]):
+            payload = json.dumps({'r': 0, 'v': values}).encode()
+            cursor = base64.urlsafe_b64encode(payload).decode()
+            response = self.client.get(reverse('post-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, values)
+
+
+class PostEngagementAnnotationTests(PostsAPITestCase):
+    """
+    comment_count and total_likes come from counter columns, has_liked from an annotation.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username='viewer', password='pass12345')
+        self.other = CustomUser.objects.create_user(username='other', password='pass12345')
+        self.posts = [Post.objects.create(author=self.other, title=f'Post {i}', content='Body') for i in range(4)]
+        Comment.objects.create(post=self.posts[0], author=self.user, content='Nice')
+        Comment.objects.create(post=self.posts[0], author=self.other, content='Thanks')
+        Like.objects.create(post=self.posts[0], user=self.user)
+        Like.objects.create(post=self.posts[1], user=self.other)
+        # Rows were created directly, so bring the counter columns up to date
+        call_command('reconcile_counters', stdout=StringIO())
+        self.client.force_authenticate(user=self.user)
+
+    def test_annotated_values_match_the_data(self):
+        response = self.client.get(reverse('post-list'))
+        by_id = {item['id']: item for item in response.data['results']}
+
+        self.assertEqual(by_id[self.posts[0].id]['comment_count'], 2)
+        self.assertEqual(by_id[self.posts[0].id]['total_likes'], 1)
+        self.assertTrue(by_id[self.posts[0].id]['has_liked'])
+        self.assertEqual(by_id[self.posts[1].id]['total_likes'], 1)
+        self.assertFalse(by_id[self.posts[1].id]['has_liked'])
+        self.assertEqual(by_id[self.posts[2].id]['comment_count'], 0)
+
+    @override_settings(POST_COMMENT_PREVIEW_SIZE=1)
+    def test_comment_preview_is_bounded(self):
+        response = self.client.get(reverse('post-list'))
+        by_id = {item['id']: item for item in response.data['results']}
+
+        preview = by_id[self.posts[0].id]['latest_comments']
+        self.assertEqual([comment['content'] for comment in preview], ['Thanks'])
+        self.assertEqual(by_id[self.posts[0].id]['comment_count'], 2)
+
+    def test_likes_are_not_queried_per_post(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('post-list'))
+        like_queries = [query for query in context.captured_queries if 'posts_like' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+
+
+class CounterMaintenanceTests(PostsAPITestCase):
+    """
+    The like/comment/follow endpoints keep the counter columns in step.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='poster', password='pass12345')
+        self.fan = CustomUser.objects.create_user(username='fan', password='pass12345')
+        self.post = Post.objects.create(author=self.author, title='Counted', content='Body')
+        self.client.force_authenticate(user=self.fan)
+
+    @override_settings(LIKE_COUNTER_FLUSH='sync')
+    def test_like_and_unlike_update_like_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-like', args=[self.post.id]))
+        self.assertEqual(response.data['likes_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('post-unlike', args=[self.post.id]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_comment_create_and_delete_update_comment_count(self):
+        url = reverse('post-comments-list', kwargs={'post_pk': self.post.id})
+        response = self.client.post(url, {'content': 'First!'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+        self.client.delete(reverse('post-comments-detail', kwargs={'post_pk': self.post.id, 'pk': response.data['id']}))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_comment_list_is_page_numbered(self):
+        url = reverse('post-comments-list', kwargs={'post_pk': self.post.id})
+        for n in range(12):
+            Comment.objects.create(post=self.post, author=self.fan, content=f'Comment {n}')
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_follow_updates_both_users(self):
+        self.client.post(reverse('follow-user', args=[self.author.id]))
+        self.author.refresh_from_db()
+        self.fan.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.fan.following_count, 1)
+
+    def test_reconcile_counters_repairs_drift(self):
+        Like.objects.create(post=self.post, user=self.fan)
+        Follow.objects.create(follower=self.author, followee=self.fan)
+        call_command('reconcile_counters', stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.fan.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.fan.followers_count, 1)
+
+    def test_reconcile_counters_invalidates_fixed_posts(self):
+        untouched = Post.objects.create(author=self.author, title='Untouched', content='Body')
+        Like.objects.create(post=self.post, user=self.fan)
+        before = get_versions([self.post.id, untouched.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_counters', '--batch-size', '1', stdout=StringIO())
+        after = get_versions([self.post.id, untouched.id])
+
+        self.assertNotEqual(after[self.post.id], before[self.post.id])
+        self.assertEqual(after[untouched.id], before[untouched.id])
+
+    def test_migrations_backfill_the_counters(self):
+        Like.objects.create(post=self.post, user=self.fan)
+        Comment.objects.create(post=self.post, author=self.fan, content='Hi')
+        Follow.objects.create(follower=self.fan, followee=self.author)
+        for name, function in (
+            ('posts.migrations.0006_backfill_counters', 'backfill_counters'),
+            ('accounts.migrations.0006_backfill_follow_counts', 'backfill_follow_counts'),
+        ):
+            getattr(import_module(name), function)(django_apps, None)
+
+        self.post.refresh_from_db()
+        self.author.refresh_from_db()
+        self.fan.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+        self.assertEqual((self.author.followers_count, self.fan.following_count), (1, 1))
+
+
+class LikeWritePathTests(PostsAPITestCase):
+    """
+    Likes are single conflict-ignoring inserts; like_count is written behind in batches.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='viral', password='pass12345')
+        self.fans = [CustomUser.objects.create_user(username=f'fan{i}', password='pass12345') for i in range(3)]
+        self.post = Post.objects.create(author=self.author, title='Viral', content='Body')
+        self.url = reverse('post-like', args=[self.post.id])
+
+    def like_as(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.post(self.url)
+
+    def test_insert_like_ignores_the_duplicate(self):
+        self.assertTrue(insert_like(self.fans[0].pk, self.post.pk))
+        self.assertFalse(insert_like(self.fans[0].pk, self.post.pk))
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+
+    def test_like_of_a_concurrently_deleted_post_is_not_found(self):
+        # The post goes away after the view looked it up, so the insert fails its FK check
+        with mock.patch('posts.views.insert_like', side_effect=Post.DoesNotExist):
+            self.assertEqual(self.like_as(self.fans[0]).status_code, status.HTTP_404_NOT_FOUND)
+
+        Post.objects.filter(pk=self.post.pk).delete()
+        with mock.patch('posts.likes.Like.objects.create', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.assertRaises(Post.DoesNotExist):
+                insert_like(self.fans[0].pk, self.post.pk)
+
+    def test_double_tap_conflicts_without_counting_twice(self):
+        self.assertEqual(self.like_as(self.fans[0]).status_code, status.HTTP_201_CREATED)
+        response = self.like_as(self.fans[0])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.like_as(self.fans[1]).data['likes_count'], 2)
+
+    def test_like_returns_the_count_without_reading_it_back(self):
+        self.like_as(self.fans[0])
+        with CaptureQueriesContext(connection) as context:
+            response = self.like_as(self.fans[1])
+
+        self.assertEqual(response.data['likes_count'], 2)
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([query for query in sql if 'COUNT(' in query or query.startswith('UPDATE')])
+        self.assertEqual(len([query for query in sql if 'posts_post' in query]), 1)
+
+    @override_settings(LIKE_COUNTER_FLUSH='background')
+    def test_expired_counter_keeps_unflushed_likes(self):
+        with mock.patch('posts.likes.start_flusher'), self.captureOnCommitCallbacks(execute=True):
+            self.like_as(self.fans[0])
+            self.like_as(self.fans[1])
+            # Expires while both likes are still buffered (like_count is 0)
+            cache.delete(counter_key(self.post.pk))
+            self.assertEqual(self.like_as(self.fans[2]).data['likes_count'], 3)
+
+    @override_settings(LIKE_COUNTER_FLUSH='background')
+    def test_buffered_deltas_are_flushed_together(self):
+        with mock.patch('posts.likes.start_flusher'), self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                self.like_as(fan)
+            self.client.delete(reverse('post-unlike', args=[self.post.id]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(flush_like_counts(), 1)
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('UPDATE')]), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertEqual(flush_like_counts(), 0)
+
+
+class BulkPostImportTests(PostsAPITestCase):
+    """
+    POST /posts/bulk/ validates everything, inserts in batches and fans out per batch.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='importer', password='pass12345', followers_count=2)
+        self.readers = [CustomUser.objects.create_user(username=f'reader{i}', password='pass12345') for i in range(2)]
+        Follow.objects.bulk_create(Follow(follower=reader, followee=self.author) for reader in self.readers)
+        self.url = reverse('post-bulk')
+        self.client.force_authenticate(user=self.author)
+
+    def items(self, count):
+        return [{'title': f'Imported {n}', 'content': 'Body'} for n in range(count)]
+
+    @override_settings(POST_BULK_BATCH_SIZE=2)
+    def test_array_is_inserted_and_fanned_out_in_batches(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, self.items(5), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 5)
+        posts = Post.objects.filter(author=self.author).order_by('pk')
+        self.assertEqual(response.data['ids'], [post.pk for post in posts])
+        self.assertEqual([post.title for post in posts], [f'Imported {n}' for n in range(5)])
+        self.assertTrue(all(post.is_fanned_out for post in posts))
+        self.assertEqual(TimelineEntry.objects.filter(author=self.author).count(), 10)
+
+        # One post INSERT and one follower read per batch, no per-post UPDATE
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(len([query for query in sql if query.startswith('INSERT INTO "posts_post"')]), 3)
+        self.assertEqual(len([query for query in sql if 'accounts_follow' in query]), 3)
+        self.assertFalse([query for query in sql if query.startswith('UPDATE "posts_post"')])
+
+    @override_settings(POST_BULK_BATCH_SIZE=2)
+    def test_ids_are_read_back_when_the_insert_returns_none(self):
+        def interleaved_insert(posts, **kwargs):
+            # Like MySQL: no ids come back, and another post by the same
+            # author takes the id between each of the batch's rows
+            for post in posts:
+                post.save()
+                post.pk = None
+                Post.objects.create(author=self.author, title=post.title, content='Concurrent')
+            return posts
+
+        with mock.patch.object(Post.objects, 'bulk_create', interleaved_insert):
+            response = self.client.post(self.url, self.items(3), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        imported = Post.objects.filter(author=self.author, content='Body').order_by('pk')
+        self.assertEqual(response.data['ids'], [post.pk for post in imported])
+        ids = response.data['ids']
+        self.assertEqual([b - a for a, b in zip(ids, ids[1:])], [2, 2])
+        entries = TimelineEntry.objects.filter(author=self.author)
+        self.assertEqual(set(entries.values_list('post_id', flat=True)), set(response.data['ids']))
+
+    def test_ndjson_upload(self):
+        body = '{"title": "First", "content": "Body"}\n\n{"title": "Second", "content": "Body"}\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('title', flat=True)), ['First', 'Second'])
+
+    def test_malformed_ndjson_line_is_reported(self):
+        body = '{"title": "First", "content": "Body"}\n{"title": \n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line 2', response.data['detail'])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_BULK_BATCH_SIZE=2)
+    def test_invalid_item_rolls_back_the_whole_import(self):
+        items = self.items(5)
+        items[3] = {'title': 'No content'}
+        items[4] = {'content': 'No title'}
+        response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(response.data), [3, 4])
+        self.assertIn('content', response.data[3])
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(POST_BULK_MAX_ITEMS=3)
+    def test_item_limit(self):
+        response = self.client.post(self.url, self.items(4), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_a_single_object(self):
+        response = self.client.post(self.url, {'title': 'One', 'content': 'Body'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_high_follower_author_is_left_to_pull(self):
+        response = self.client.post(self.url, self.items(2), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Post.objects.filter(is_fanned_out=True).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+class UserExportTests(PostsAPITestCase):
+    """
+    The export streams a user's posts, comments and likes in constant-size chunks.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username='exporter', password='pass12345')
+        other = CustomUser.objects.create_user(username='other', password='pass12345')
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {n}', content='Body') for n in range(3)]
+        other_post = Post.objects.create(author=other, title='Not mine', content='Body')
+        Comment.objects.create(post=other_post, author=self.user, content='Nice, "quoted", post')
+        Comment.objects.create(post=self.posts[0], author=other, content='Not mine')
+        Like.objects.create(post=other_post, user=self.user)
+        Like.objects.create(post=self.posts[0], user=other)
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('user-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export_reads_in_chunks(self):
+        with CaptureQueriesContext(connection) as context:
+            response, body = self.export()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(
+            [(record['type'], record['id']) for record in records],
+            [('post', post.pk) for post in self.posts]
+            + [('comment', Comment.objects.get(author=self.user).pk), ('like', Like.objects.get(user=self.user).pk)],
+        )
+        self.assertEqual(records[0]['title'], 'Post 0')
+        # Two chunks of posts, then one each for comments and likes
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 4)
+        self.assertTrue(all('LIMIT 2' in query for query in selects))
+
+    def test_csv_export(self):
+        response, body = self.export(output='csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('exporter.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row['type'] for row in rows], ['post', 'post', 'post', 'comment', 'like'])
+        self.assertEqual(rows[3]['content'], 'Nice, "quoted", post')
+        self.assertEqual(rows[4]['title'], '')
+
+    def test_unknown_output_format(self):
+        response = self.client.get(reverse('user-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_writes_the_same_export(self):
+        _, body = self.export()
+        stdout = StringIO()
+        call_command('export_user_data', 'exporter', '--chunk-size', '1', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), body)
+
+        with self.assertRaises(CommandError):
+            call_command('export_user_data', 'nobody', stdout=StringIO())
+
+
+class SparseFieldsetTests(PostsAPITestCase):
+    """
+    ?fields= and ?expand= shape both the response and the SQL behind it.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username='mobile', password='pass12345', bio='Hi')
+        self.post = Post.objects.create(author=self.user, title='Sparse', content='Body')
+        Comment.objects.create(post=self.post, author=self.user, content='Note')
+        self.client.force_authenticate(user=self.user)
+
+    def test_fields_limits_response_and_skips_joins(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('post-list') + '?fields=id,title')
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('posts_comment', sql)
+        self.assertNotIn('posts_like', sql)
+
+    def test_author_is_compact_unless_expanded(self):
+        response = self.client.get(reverse('post-detail', args=[self.post.id]))
+        self.assertEqual(set(response.data['author']), {'id', 'username'})
+
+        response = self.client.get(reverse('post-detail', args=[self.post.id]) + '?fields=id,author&expand=author')
+        self.assertEqual(response.data['author']['bio'], 'Hi')
+        self.assertIn('followers_count', response.data['author'])
+
+    def test_comment_fields(self):
+        url = reverse('post-comments-list', kwargs={'post_pk': self.post.id}) + '?fields=id,content'
+        response = self.client.get(url)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'content'})
+
+
+class PostPayloadCacheTests(PostsAPITestCase):
+    """
+    Post detail/list payloads are cached and invalidated by write paths.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='hot', password='pass12345')
+        self.reader = CustomUser.objects.create_user(username='fan', password='pass12345')
+        self.post = Post.objects.create(author=self.author, title='Hot post', content='Body')
+        self.url = reverse('post-detail', args=[self.post.id])
+        self.client.force_authenticate(user=self.reader)
+
+    def test_second_read_is_a_cache_hit(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['title'], 'Hot post')
+        self.assertEqual(get_cache_stats()['hits'], 1)
+        self.assertFalse([query for query in context.captured_queries if 'posts_post' in query['sql']])
+
+    @override_settings(LIKE_COUNTER_FLUSH='sync')
+    def test_like_and_comment_invalidate_the_payload(self):
+        self.client.get(self.url)
+        # Invalidation runs on commit; TestCase wraps each test in a transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post-like', args=[self.post.id]))
+            self.client.post(reverse('post-comments-list', kwargs={'post_pk': self.post.id}), {'content': 'Hi'}, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['total_likes'], 1)
+        self.assertTrue(response.data['has_liked'])
+        self.assertEqual(response.data['comment_count'], 1)
+
+    @skipIf(fakeredis is None, 'fakeredis is not installed')
+    def test_versions_over_the_redis_protocol(self):
+        # RedisCache's incr/get_many/add differ from LocMemCache's: run them against a Redis stand-in
+        redis_caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://stand-in:6379/0',
+            'OPTIONS': {'connection_class': fakeredis.FakeConnection},
+        }}
+        with self.settings(CACHES=redis_caches):
+            caches['default'].clear()
+            version = get_versions([self.post.id])[self.post.id]
+            self.assertEqual(get_versions([self.post.id]), {self.post.id: version})
+
+            self.client.get(self.url)
+            self.client.get(self.url)
+            self.assertEqual(get_cache_stats()['hits'], 1)
+
+            invalidate_post(self.post.id)
+            self.assertEqual(get_versions([self.post.id]), {self.post.id: version + 1})
+            self.client.get(self.url)
+            self.assertEqual(get_cache_stats()['misses'], 2)
+
+            # An evicted version starts again from a fresh one
+            caches['default'].delete(version_key(self.post.id))
+            invalidate_post(self.post.id)
+            self.assertGreater(get_versions([self.post.id])[self.post.id], version + 1)
+
+    def test_missing_post_returns_404(self):
+        response = self.client.get(reverse('post-detail', args=[self.post.id + 100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RankedFeedTests(PostsAPITestCase):
+    """
+    ?mode=ranked orders the feed by recency, velocity and author affinity.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.reader = CustomUser.objects.create_user(username='reader', password='pass12345')
+        self.friend = CustomUser.objects.create_user(username='friend', password='pass12345')
+        self.stranger = CustomUser.objects.create_user(username='stranger', password='pass12345')
+        for author in (self.friend, self.stranger):
+            Follow.objects.create(follower=self.reader, followee=author)
+
+        self.old_friend_post = self.create_post(self.friend, 'Friend', hours_ago=6)
+        self.new_post = self.create_post(self.stranger, 'Newest', hours_ago=0)
+        self.hot_post = self.create_post(self.stranger, 'Hot', hours_ago=3)
+        self.client.force_authenticate(user=self.reader)
+
+    def create_post(self, author, title, hours_ago):
+        post = Post.objects.create(author=author, title=title, content='Body')
+        created_at = timezone.now() - timedelta(hours=hours_ago)
+        Post.objects.filter(pk=post.pk).update(created_at=created_at)
+        TimelineEntry.objects.create(owner=self.reader, post=post, author=author, created_at=created_at)
+        return post
+
+    def feed_ids(self, **params):
+        response = self.client.get(reverse('user-feed'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_latest_mode_is_unchanged(self):
+        self.assertEqual(self.feed_ids(), [self.new_post.id, self.hot_post.id, self.old_friend_post.id])
+
+    def test_velocity_and_affinity_reorder_the_feed(self):
+        fans = [CustomUser.objects.create_user(username=f'fan{i}', password='pass12345') for i in range(30)]
+        Like.objects.bulk_create([Like(user=fan, post=self.hot_post) for fan in fans])
+        for _ in range(3):
+            Comment.objects.create(post=self.old_friend_post, author=self.reader, content='Again')
+        with self.settings(FEED_RANKING_WEIGHTS={'affinity': 2.0}):
+            call_command('refresh_feed_features', stdout=StringIO())
+            self.assertEqual(AuthorAffinity.objects.get(user=self.reader).interactions, 3)
+            ids = self.feed_ids(mode='ranked')
+        self.assertEqual(ids, [self.old_friend_post.id, self.hot_post.id, self.new_post.id])
+
+    def test_velocity_decays_once_activity_stops(self):
+        Like.objects.create(user=self.reader, post=self.hot_post)
+        call_command('refresh_feed_features', stdout=StringIO())
+        self.hot_post.refresh_from_db()
+        self.assertGreater(self.hot_post.engagement_velocity, 0)
+
+        Like.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('refresh_feed_features', stdout=StringIO())
+        self.hot_post.refresh_from_db()
+        self.assertEqual(self.hot_post.engagement_velocity, 0)
+
+    @override_settings(CACHES_SINGLE_PROCESS=True)
+    def test_ranking_reads_candidates_in_four_queries(self):
+        # Warm the follow-graph cache the feed query reads followee ids from
+        self.reader.get_following()
+        with CaptureQueriesContext(connection) as context:
+            rank_feed(self.reader)
+        self.assertEqual(len(context.captured_queries), 4)
+
+    def test_ranked_pages_come_from_one_snapshot(self):
+        response = self.client.get(reverse('user-feed'), {'mode': 'ranked', 'page_size': 2})
+        first = [item['id'] for item in response.data['results']]
+        self.assertEqual(first, [self.new_post.id, self.hot_post.id])
+
+        # The scores change before the next page is read: the last post would now rank first
+        Post.objects.filter(pk=self.old_friend_post.pk).update(engagement_velocity=1000)
+        response = self.client.get(response.data['next'])
+        second = [item['id'] for item in response.data['results']]
+        self.assertEqual(second, [self.old_friend_post.id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], first)
+
+    @override_settings(FEED_SNAPSHOT_CACHE_ALIAS='snapshots', CACHES={
+        **settings.CACHES,
+        'snapshots': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'snapshots'},
+    })
+    def test_expired_ranked_cursor_is_rejected(self):
+        next_url = self.client.get(reverse('user-feed'), {'mode': 'ranked', 'page_size': 2}).data['next']
+        caches['snapshots'].clear()
+        self.assertEqual(self.client.get(next_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_affinity_is_refreshed_per_chunk_of_users(self):
+        Comment.objects.create(post=self.old_friend_post, author=self.reader, content='Hi')
+        Like.objects.create(user=self.friend, post=self.hot_post)
+        stale = AuthorAffinity.objects.create(user=self.stranger, author=self.friend, interactions=7, computed_at=timezone.now())
+        call_command('refresh_feed_features', '--batch-size', '1', stdout=StringIO())
+        kept = AuthorAffinity.objects.get(user=self.reader)
+
+        Comment.objects.create(post=self.old_friend_post, author=self.reader, content='Again')
+        call_command('refresh_feed_features', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(
+            set(AuthorAffinity.objects.values_list('user', 'author', 'interactions')),
+            {(self.reader.pk, self.friend.pk, 2), (self.friend.pk, self.stranger.pk, 1)}
+        )
+        # Updated in place rather than rebuilt
+        self.assertEqual(AuthorAffinity.objects.get(user=self.reader).pk, kept.pk)
+        self.assertFalse(AuthorAffinity.objects.filter(pk=stale.pk).exists())
+
+    def test_unknown_mode_is_rejected(self):
+        response = self.client.get(reverse('user-feed'), {'mode': 'random'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncReadViewTests(PostsAPITestCase):
+    """
+    The async feed/list/detail endpoints answer exactly like the sync views.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = CustomUser.objects.create_user(username='writer', password='pass12345')
+        self.reader = CustomUser.objects.create_user(username='reader', password='pass12345')
+        Follow.objects.create(follower=self.reader, followee=self.author)
+        self.posts = [Post.objects.create(author=self.author, title=f'Post {i}', content='Body') for i in range(5)]
+        Like.objects.create(user=self.reader, post=self.posts[1])
+        self.client.force_authenticate(user=self.reader)
+
+    def assert_same(self, sync_url, async_url, params=None):
+        expected = self.client.get(sync_url, params)
+        response = self.client.get(async_url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Same page and cursors; only the links' path differs
+        self.assertEqual(response.content.decode().replace(async_url, sync_url), expected.content.decode())
+        return response.json()
+
+    def test_feed_pages_match(self):
+        page = self.assert_same(reverse('user-feed'), reverse('user-feed-async'), {'page_size': 2})
+        self.assertEqual(len(page['results']), 2)
+        cursor = page['next'].split('cursor=')[1].split('&')[0]
+        self.assert_same(reverse('user-feed'), reverse('user-feed-async'), {'page_size': 2, 'cursor': cursor})
+
+    def test_post_list_and_detail_match(self):
+        page = self.assert_same(reverse('post-list'), reverse('post-list-async'))
+        self.assertEqual([post['has_liked'] for post in page['results']], [False, False, False, True, False])
+        self.assert_same(reverse('post-detail', args=[self.posts[1].id]), reverse('post-detail-async', args=[self.posts[1].id]))
+        self.assert_same(reverse('post-detail', args=[999]), reverse('post-detail-async', args=[999]))
+
+    def test_sparse_and_ranked_requests_are_delegated(self):
+        self.assert_same(reverse('post-list'), reverse('post-list-async'), {'fields': 'id,title'})
+        self.assert_same(reverse('user-feed'), reverse('user-feed-async'), {'mode': 'ranked'})
+
+    def test_anonymous_access_follows_the_sync_permissions(self):
+        self.client.force_authenticate(user=None)
+        self.assert_same(reverse('post-list'), reverse('post-list-async'))
+        response = self.client.get(reverse('user-feed-async'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    async def test_runs_in_the_event_loop(self):
+        key = (await Token.objects.acreate(user=self.reader)).key
+        response = await self.async_client.get(reverse('user-feed-async'), headers={'authorization': f'Token {key}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class GenerateDatasetTests(PostsAPITestCase):
+    """
+    The synthetic data generator produces a consistent dataset.
+    """
+
+    def test_generates_consistent_rows(self):
+        out = StringIO()
+        call_command(
+            'generate_dataset', '--users', '30', '--posts-per-user', '2', '--likes-per-post', '3',
+            '--timelines', '--seed', '7', stdout=out
+        )
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(CustomUser.objects.filter(username__startswith='synthetic_').count(), 30)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertTrue(Follow.objects.exists() and Like.objects.exists() and Comment.objects.exists())
+
+        # Timestamps are spread out rather than all "now", and timelines only hold followed authors
+        self.assertGreater(Post.objects.order_by('created_at').values_list('created_at', flat=True).distinct().count(), 1)
+        entry = TimelineEntry.objects.first()
+        self.assertTrue(Follow.objects.filter(follower_id=entry.owner_id, followee_id=entry.author_id).exists())
+
+        # Counters were reconciled as part of the run
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('0 post(s) and 0 user(s)', out.getvalue())
+
+    def test_posts_are_generated_in_time_order_across_batches(self):
+        call_command('generate_dataset', '--users', '10', '--posts-per-user', '5', '--batch-size', '7',
+                     '--seed', '3', stdout=StringIO())
+        timestamps = list(Post.objects.order_by('pk').values_list('created_at', flat=True))
+        self.assertEqual(len(timestamps), 50)
+        self.assertEqual(timestamps, sorted(timestamps))
+        # Spread over the whole --days range, not bunched in the first batches
+        self.assertGreater(timestamps[-1] - timestamps[0], timedelta(days=20))
+
+    def test_refuses_to_reuse_a_prefix(self):
+        CustomUser.objects.create_user(username='synthetic_0', password='pass12345')
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--users', '5', stdout=StringIO())
 
-# Create your tests here.
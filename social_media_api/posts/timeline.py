@@ -0,0 +1,155 @@
+# posts/timeline.py
+
+"""
+Materialized home timelines (hybrid fan-out).
+
+Regular authors: when a post is created it is written into every follower's
+timeline (fan-out-on-write), so reading a feed is one range scan over
+TimelineEntry(owner, created_at).
+
+High-follower authors (more than FEED_FANOUT_LIMIT followers): writing a row
+per follower would make posting too slow, so their posts are left with
+is_fanned_out=False and pulled into followers' feeds at read time
+(fan-out-on-read).
+"""
+
+import heapq
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from accounts.models import Follow
+from social_media_api.pagination import keyset_filter, reversed_ordering
+from .models import Post, TimelineEntry
+
+# Follow lists up to this size are inlined into the feed query
+FEED_INLINE_FOLLOWING_LIMIT = 1000
+
+
+def get_fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 5000)
+
+
+def get_batch_size():
+    return getattr(settings, 'FEED_FANOUT_BATCH_SIZE', 1000)
+
+
+def fan_out_post(post):
+    """
+    Push a newly created post into its author's followers' timelines.
+    Returns the number of timeline rows written (0 for pull-mode authors).
+    """
+    return fan_out_posts(post.author, [post])
+
+
+def fan_out_posts(author, posts):
+    """
+    fan_out_post() for several new posts by one author (bulk imports): the
+    follower ids are read once and the timeline rows written together.
+    Posts not already saved with is_fanned_out=True are marked in one UPDATE.
+    """
+    # Check the counter column first so celebrity follower lists are never loaded
+    if not posts or author.followers_count > get_fanout_limit():
+        # Too many followers: leave the posts to be pulled at read time
+        return 0
+
+    follower_ids = author.get_follower_ids()
+
+    entries = [
+        TimelineEntry(owner_id=follower_id, post_id=post.pk, author_id=author.pk, created_at=post.created_at)
+        for post in posts
+        for follower_id in follower_ids
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=get_batch_size(), ignore_conflicts=True)
+
+    unmarked = [post.pk for post in posts if not post.is_fanned_out]
+    if unmarked:
+        Post.objects.filter(pk__in=unmarked).update(is_fanned_out=True)
+    for post in posts:
+        post.is_fanned_out = True
+    return len(entries)
+
+
+def backfill_timeline(user, author_ids, limit=None):
+    """
+    Copy each author's most recent fanned-out posts into the user's timeline.
+    Called right after a follow so the feed isn't empty until the next post.
+    """
+    if limit is None:
+        limit = getattr(settings, 'FEED_BACKFILL_LIMIT', 100)
+
+    # Number each author's posts newest first and keep the first `limit`,
+    # so a bulk follow is one query instead of one per author
+    recent_posts = (
+        Post.objects.filter(author_id__in=author_ids, is_fanned_out=True)
+        .annotate(rank=Window(RowNumber(), partition_by=F('author_id'), order_by=F('created_at').desc()))
+        .filter(rank__lte=limit)
+        .values_list('pk', 'author_id', 'created_at')
+    )
+    entries = [
+        TimelineEntry(owner=user, post_id=post_id, author_id=author_id, created_at=created_at)
+        for post_id, author_id, created_at in recent_posts
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=get_batch_size(), ignore_conflicts=True)
+    return len(entries)
+
+
+def prune_timeline(user, author_ids):
+    """Remove the authors' posts from the user's timeline (after an unfollow)."""
+    deleted, _ = TimelineEntry.objects.filter(owner=user, author_id__in=author_ids).delete()
+    return deleted
+
+
+FeedRow = namedtuple('FeedRow', ['id', 'created_at'])
+
+FEED_ORDERING = ('-created_at', '-id')
+
+
+def get_feed_page(user, position=None, reverse=False, limit=10):
+    """
+    Up to `limit` FeedRows of the user's home feed, newest first (oldest
+    first if `reverse`), strictly after `position` ((created_at, post id),
+    or None for the start).
+
+    The materialized timeline is read with one range scan of
+    timeline_owner_created_idx, already in order. Posts of pull-mode authors
+    (is_fanned_out=False) come from a second keyset query, bounded the same
+    way, and the two sorted runs are merged.
+    """
+    timeline = _keyset_rows(
+        TimelineEntry.objects.filter(owner=user), ('-created_at', '-post_id'), position, reverse, limit,
+    ).values_list('post_id', 'created_at')
+
+    following = user.get_following()
+    if len(following) <= FEED_INLINE_FOLLOWING_LIMIT:
+        # Ids from the per-process follow-graph cache: no Follow join at all
+        followee_ids = list(following)
+    else:
+        # Very long follow lists stay a subquery rather than a huge IN (...)
+        followee_ids = Follow.objects.filter(follower=user).values('followee_id')
+    pulled = _keyset_rows(
+        Post.objects.filter(author_id__in=followee_ids, is_fanned_out=False), FEED_ORDERING, position, reverse, limit,
+    ).values_list('id', 'created_at')
+
+    rows = heapq.merge(
+        (FeedRow(*row) for row in timeline),
+        (FeedRow(*row) for row in pulled),
+        key=lambda row: (row.created_at, row.id),
+        reverse=not reverse,
+    )
+    page, seen = [], set()
+    for row in rows:
+        if row.id not in seen:
+            seen.add(row.id)
+            page.append(row)
+            if len(page) == limit:
+                break
+    return page
+
+
+def _keyset_rows(queryset, ordering, position, reverse, limit):
+    if position is not None:
+        queryset = queryset.filter(keyset_filter(ordering, position, reverse))
+    return queryset.order_by(*(reversed_ordering(ordering) if reverse else ordering))[:limit]
@@ -5,7 +5,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
-from .views import PostViewSet, CommentViewSet, UserFeedAPIView
+from .views import PostViewSet, CommentViewSet, UserFeedAPIView, UserExportAPIView
+from .async_views import AsyncPostDetailView, AsyncPostListView, AsyncUserFeedView
 
 # 1. Root Router for Posts
 router = DefaultRouter()
@@ -22,6 +23,14 @@ urlpatterns = [
     *posts_router.urls,
     # Feed Endpoint
     path('feed/', UserFeedAPIView.as_view(), name='user-feed'),
+
+    # Streaming export of the current user's posts, comments and likes
+    path('export/', UserExportAPIView.as_view(), name='user-export'),
+
+    # Async variants of the read endpoints for ASGI deployments (posts/async_views.py)
+    path('async/feed/', AsyncUserFeedView.as_view(), name='user-feed-async'),
+    path('async/posts/', AsyncPostListView.as_view(), name='post-list-async'),
+    path('async/posts/<int:pk>/', AsyncPostDetailView.as_view(), name='post-detail-async'),
     
     # Explicit URL patterns for liking and unliking posts
     path('<int:pk>/like/', PostViewSet.as_view({'post': 'like'}), name='post-like'),
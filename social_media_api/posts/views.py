@@ -1,99 +1,247 @@
 # posts/views.py
 
+import asyncio
+from types import GeneratorType
+
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.response import Response
 from rest_framework_nested import routers
 from rest_framework.decorators import action # Import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
+from rest_framework.views import APIView
 
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import F
 
-from django.contrib.contenttypes.models import ContentType # Import ContentType
-from notifications.models import Notification # Import Notification
+from notifications.pipeline import notify, retract
+from social_media_api.pagination import KeysetPagination, SnapshotPagination
+from social_media_api.fieldsets import SparseFieldsetViewMixin
+from social_media_api.parsers import NDJSONParser
+from accounts.serializers import CustomUserProfileSerializer, UserFollowSerializer
 
 from .models import Post, Comment, Like
 from .serializers import PostSerializer, CommentSerializer
 from .permissions import IsAuthorOrReadOnly # (from posts/permissions.py)
+from .timeline import fan_out_post, get_feed_page
+from .ranking import get_snapshot_timeout, rank_feed
+from .cache import get_post_payloads, invalidate_post
+from .likes import delete_like, insert_like, record_like
+from .bulk import import_posts
+from .export import FORMATS as EXPORT_FORMATS, export_user
+
+# --- Shared queryset shaping for post lists ---
+
+class PostQueryShapeMixin(SparseFieldsetViewMixin):
+    """
+    Builds the post queryset for the shape requested with ?fields= / ?expand=:
+    unrequested annotations, joins and prefetches are skipped and only the
+    needed columns are selected.
+    """
+    # Serializer fields that read a differently named column
+    column_for_field = {'total_likes': 'like_count'}
+    # Always loaded: the keyset paginator orders and builds cursors on these
+    required_columns = ('id', 'created_at')
+
+    def shape_post_queryset(self, queryset):
+        user = self.request.user
+        if self.wants_field('has_liked'):
+            queryset = queryset.with_engagement(user)
+        if self.wants_field('latest_comments'):
+            # Only the newest few comments are prefetched (see with_comment_preview)
+            queryset = queryset.with_comment_preview()
+        if self.wants_field('author'):
+            queryset = queryset.select_related('author')
+
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+
+        columns = {field.name for field in Post._meta.concrete_fields}
+        selected = set(self.required_columns)
+        for name in fields:
+            column = self.column_for_field.get(name, name)
+            if column in columns:
+                selected.add(column)
+        if 'author' in selected:
+            profile = CustomUserProfileSerializer if self.is_expanded('author') else UserFollowSerializer
+            selected.update(f'author__{name}' for name in profile.Meta.fields)
+        return queryset.only(*selected)
+
+
+async def collect_ids(queryset):
+    return {value async for value in queryset}
+
+
+def invalidate_post_on_commit(post_id):
+    # Bump the cached payload version only once the write is visible to readers
+    transaction.on_commit(lambda: invalidate_post(post_id))
+
+
+class PostPayloadCacheMixin:
+    """
+    Serves post lists from the payload cache (posts/cache.py) when the client
+    asks for the default shape; ?fields= and ?expand= requests bypass it.
+    Only the page of ids comes from the database; has_liked is per user and
+    is added with one query for the whole page.
+    """
+
+    def can_use_post_cache(self):
+        return self.get_sparse_fields() is None and not self.get_expand()
+
+    def load_post_payloads(self, post_ids):
+        posts = Post.objects.filter(pk__in=post_ids).select_related('author').with_comment_preview()
+        fields = [name for name in PostSerializer.Meta.fields if name != 'has_liked']
+        data = PostSerializer(posts, many=True, fields=fields, context=self.get_serializer_context()).data
+        return {item['id']: item for item in data}
+
+    def render_cached_posts(self, post_ids):
+        payloads = get_post_payloads(post_ids, self.load_post_payloads)
+
+        liked = set()
+        user = self.request.user
+        if user.is_authenticated and payloads:
+            liked = set(Like.objects.filter(user=user, post_id__in=list(payloads)).values_list('post_id', flat=True))
+
+        return [dict(payloads[post_id], has_liked=post_id in liked) for post_id in post_ids if post_id in payloads]
+
+    async def arender_cached_posts(self, post_ids):
+        """
+        render_cached_posts() for async views: the payloads (cache, then the
+        database for misses) and the has_liked ids are read concurrently.
+        """
+        user = self.request.user
+        load = sync_to_async(get_post_payloads)(post_ids, self.load_post_payloads)
+        if user.is_authenticated and post_ids:
+            liked_ids = Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+            payloads, liked = await asyncio.gather(load, collect_ids(liked_ids))
+        else:
+            payloads, liked = await load, set()
+
+        return [dict(payloads[post_id], has_liked=post_id in liked) for post_id in post_ids if post_id in payloads]
+
+    def list(self, request, *args, **kwargs):
+        if not self.can_use_post_cache():
+            return super().list(request, *args, **kwargs)
+
+        # Page through ids only; the rows themselves come from the cache
+        queryset = self.filter_queryset(self.get_base_queryset().only('id', 'created_at'))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.render_cached_posts([post.id for post in page]))
+
 
 # --- Post ViewSet ---
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(PostPayloadCacheMixin, PostQueryShapeMixin, viewsets.ModelViewSet):
     """
     Handles CRUD operations for Posts.
     Post.objects.all() is implemented via the optimized get_queryset method below.
     """
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    # Keyset pagination on (created_at, id): no COUNT(*), no OFFSET
+    pagination_class = KeysetPagination
+
+    def get_base_queryset(self):
+        return Post.objects.all()
 
     # Post.objects.all() is functionally implemented and optimized here:
     def get_queryset(self):
         """
-        Returns the optimized queryset for Posts.
+        Returns the optimized queryset for Posts, trimmed to the requested fields.
+        Counts come from counter columns and has_liked is annotated in the same query.
         """
-        return Post.objects.select_related('author').prefetch_related(
-            Prefetch(
-                'comments',
-                queryset=Comment.objects.select_related('author') # Optimizes comment author lookup
-            )
-        ).all()
+        return self.shape_post_queryset(self.get_base_queryset())
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.can_use_post_cache():
+            return super().retrieve(request, *args, **kwargs)
+
+        try:
+            post_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        data = self.render_cached_posts([post_id])
+        if not data:
+            raise Http404
+        return Response(data[0])
         
     def perform_create(self, serializer):
         # Automatically set the author to the currently logged-in user
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        # Push the new post into the followers' materialized timelines
+        fan_out_post(post)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        invalidate_post_on_commit(post.pk)
 
+    def perform_destroy(self, instance):
+        post_id = instance.pk
+        instance.delete()
+        invalidate_post_on_commit(post_id)
+
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        # A JSON array, or a generator over the lines of an NDJSON upload (see posts/bulk.py)
+        items = request.data
+        if not isinstance(items, (list, GeneratorType)):
+            raise ValidationError({'non_field_errors': ['Expected a list of posts.']})
+        ids = import_posts(request.user, items)
+        return Response({"created": len(ids), "ids": ids}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def like(self, request, pk=None):
-        post = generics.get_object_or_404(Post, pk=pk)
+        post = generics.get_object_or_404(Post.objects.select_related('author'), pk=pk)
         user = request.user
-        
-        # 1. Create Like
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        
+
+        # 1. A single insert in a savepoint, so a double-tap can't race past the
+        #    unique constraint; the count comes from the cached counter (see posts/likes.py)
+        try:
+            created = insert_like(user.pk, post.pk)
+        except Post.DoesNotExist:
+            # Deleted between the lookup above and the insert
+            raise Http404
         if not created:
             return Response({"detail": "Post already liked."}, status=status.HTTP_409_CONFLICT)
+        likes_count = record_like(post, 1)
 
-        # 2. Create Notification (Only if the user isn't liking their own post)
-        if post.author != user:
-            Notification.objects.create(
-                recipient=post.author,
-                actor=user,
-                verb="liked",
-                target=post
-            )
-        
-        return Response({"detail": "Post liked.", "likes_count": post.total_likes}, status=status.HTTP_201_CREATED)
+        # 2. Queue the notification; the pipeline skips self-likes and batches the writes
+        notify(post.author, user, "liked", post)
+
+        return Response({"detail": "Post liked.", "likes_count": likes_count}, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['delete'], permission_classes=[permissions.IsAuthenticated])
     def unlike(self, request, pk=None):
-        post = generics.get_object_or_404(Post, pk=pk)
+        post = generics.get_object_or_404(Post.objects.select_related('author'), pk=pk)
         user = request.user
-        
-        # 1. Delete Like
-        deleted_count, _ = Like.objects.filter(user=user, post=post).delete()
-        
-        if deleted_count == 0:
+
+        # 1. Delete the Like; like_count is written behind in batches
+        if not delete_like(user.pk, post.pk):
             return Response({"detail": "Post was not liked by this user."}, status=status.HTTP_404_NOT_FOUND)
+        likes_count = record_like(post, -1)
 
-        # 2. OPTIONAL: Delete the associated notification (often skipped, but cleaner)
-        Notification.objects.filter(
-            recipient=post.author,
-            actor=user,
-            verb="liked",
-            content_type=ContentType.objects.get_for_model(Post),
-            object_id=post.id
-        ).delete()
-        
-        return Response({"detail": "Post unliked.", "likes_count": post.total_likes}, status=status.HTTP_204_NO_CONTENT)
+        # 2. Withdraw the like notification (pending event or coalesced row)
+        retract(post.author, user, "liked", post)
+
+        return Response({"detail": "Post unliked.", "likes_count": likes_count}, status=status.HTTP_204_NO_CONTENT)
 
 # --- Comment ViewSet ---
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     Handles CRUD operations for Comments nested under a Post.
     Comment.objects.all() is implemented via the filtered get_queryset method below.
     """
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    # Explicit rather than inherited from REST_FRAMEWORK: comment lists are paged
+    pagination_class = PageNumberPagination
     
     # Comment.objects.all() is implemented here, filtered by the parent Post:
     def get_queryset(self):
@@ -101,37 +249,85 @@ class CommentViewSet(viewsets.ModelViewSet):
         Returns the queryset for Comments, filtered by the parent post_pk.
         """
         # filters comments by the ID from the URL and optimizes the author lookup
-        return Comment.objects.filter(post_id=self.kwargs['post_pk']).select_related('author')
+        queryset = Comment.objects.filter(post_id=self.kwargs['post_pk'])
+        if self.wants_field('author_username'):
+            queryset = queryset.select_related('author')
+        return queryset
 
     def perform_create(self, serializer):
         # 1. Get the parent Post object using the ID from the URL
         post = get_object_or_404(Post, pk=self.kwargs['post_pk'])
         # 2. Automatically set the author and the parent post
-        serializer.save(author=self.request.user, post=post)
+        with transaction.atomic():
+            serializer.save(author=self.request.user, post=post)
+            Post.objects.filter(pk=post.pk).update(comment_count=F('comment_count') + 1)
+            notify(post.author, self.request.user, "commented", post)
+            # The cached post embeds the comment count and newest comments
+            invalidate_post_on_commit(post.pk)
+
+    def perform_update(self, serializer):
+        comment = serializer.save()
+        invalidate_post_on_commit(comment.post_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+            invalidate_post_on_commit(instance.post_id)
 
 
-class UserFeedAPIView(generics.ListAPIView):
+class UserFeedAPIView(PostPayloadCacheMixin, PostQueryShapeMixin, generics.ListAPIView):
     """
     Generates a personalized feed of posts from users the current user follows.
     """
     serializer_class = PostSerializer # Use your existing optimized PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        # Get the IDs of all users the current user follows
-        following_users = self.request.user.following.all()
-        
-        # Get all posts from those users, ordered by creation date
-        # 
-        queryset = Post.objects.filter(author__in=following_users).order_by('-created_at')
-        
-        # Apply optimization using select_related and prefetch_related
-        return queryset.select_related('author').prefetch_related(
-            Prefetch(
-                'comments',
-                queryset=Comment.objects.select_related('author')
-            )
-        ).all()
+        # Pages are picked by get_feed_page(); this only shapes the posts on one
+        return self.shape_post_queryset(Post.objects.all())
+
+    def fetch_feed_page(self, position, reverse, limit):
+        # Timeline range scan merged with the pull-mode authors (see posts/timeline.py)
+        return get_feed_page(self.request.user, position, reverse, limit)
 
+    def render_posts(self, post_ids):
+        if self.can_use_post_cache():
+            return self.render_cached_posts(post_ids)
+        posts = {post.pk: post for post in self.get_queryset().filter(pk__in=post_ids)}
+        return self.get_serializer([posts[pk] for pk in post_ids if pk in posts], many=True).data
+
+    def list(self, request, *args, **kwargs):
+        mode = request.query_params.get('mode', 'latest')
+        if mode == 'latest':
+            paginator = self.paginator
+            page = paginator.paginate_keyset(self.fetch_feed_page, Post, request)
+            return paginator.get_paginated_response(self.render_posts([row.id for row in page]))
+        if mode != 'ranked':
+            raise ValidationError({'mode': ['Expected "latest" or "ranked".']})
+
+        # Scores drift between requests, so the ranking (at most
+        # FEED_RANKING_CANDIDATES ids) is computed once per scroll and paged from a snapshot
+        paginator = SnapshotPagination()
+        paginator.snapshot_timeout = get_snapshot_timeout()
+        page = paginator.paginate_snapshot(lambda: rank_feed(request.user), request.user.pk, request)
+        return paginator.get_paginated_response(self.render_posts(page))
+
+
+class UserExportAPIView(APIView):
+    """
+    Streams the current user's posts, comments and likes, ?output=ndjson
+    (default) or ?output=csv. See posts/export.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
+    def get(self, request):
+        output_format = request.query_params.get('output', 'ndjson')
+        if output_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': [f'Expected one of: {", ".join(EXPORT_FORMATS)}.']})
 
+        _, content_type = EXPORT_FORMATS[output_format]
+        response = StreamingHttpResponse(export_user(request.user, output_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{request.user.username}.{output_format}"'
+        return response
@@ -2,6 +2,10 @@
 ASGI config for social_media_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn social_media_api.asgi:application``)
+so the notification stream and long-poll views, and the async read endpoints
+(/api/async/feed/, /api/async/posts/, /notifications/async/), don't hold a
+worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -0,0 +1,82 @@
+# social_media_api/async_views.py
+
+"""
+Base class for the async read endpoints (posts/async_views.py,
+notifications/async_views.py).
+
+DRF's APIView is synchronous, so under ASGI each request to it holds a
+worker thread for its whole duration, waiting on the database included.
+AsyncAPIView is a plain Django async view that keeps the parts of the DRF
+request cycle these endpoints use: a DRF Request (query_params, the
+configured authentication classes), an authentication requirement, and
+JSON responses and errors shaped like DRF's.
+
+Requests the async path doesn't handle itself (e.g. ?fields= shapes) are
+passed to `sync_view`, the original DRF view, in a worker thread, so both
+paths always answer the same.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+class AsyncAPIView(View):
+    # Anonymous requests get 401 unless this is False
+    authentication_required = True
+    # DRF view serving what the async path delegates
+    sync_view = None
+
+    def get_authenticators(self):
+        return [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.django_request = request
+        self.request = Request(request, authenticators=self.get_authenticators())
+        self.args, self.kwargs = args, kwargs
+        if self.is_delegated():
+            # The sync view authenticates and checks permissions itself
+            return await self.delegate()
+        try:
+            # Authentication may hit the cache or the database; resolve it off the loop
+            user = await sync_to_async(lambda: self.request.user)()
+            if self.authentication_required and not user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            handler = getattr(self, request.method.lower(), None)
+            if handler is None or request.method.lower() not in self.http_method_names:
+                raise exceptions.MethodNotAllowed(request.method)
+            return await handler(request, *args, **kwargs)
+        except Http404:
+            return self.error_response(exceptions.NotFound())
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+
+    def is_delegated(self):
+        """True if this request should be answered by `sync_view`."""
+        return False
+
+    async def delegate(self):
+        """Answer with the synchronous DRF view."""
+        response = await sync_to_async(self.sync_view)(self.django_request, *self.args, **self.kwargs)
+        if hasattr(response, 'render'):
+            response = await sync_to_async(response.render)()
+        return response
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+    def error_response(self, exc):
+        detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.render(detail, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = self.request.authenticators
+            if authenticators and hasattr(authenticators[0], 'authenticate_header'):
+                response['WWW-Authenticate'] = authenticators[0].authenticate_header(self.request)
+        return response
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'format': None, 'view': self}
@@ -0,0 +1,237 @@
+# social_media_api/benchmarks.py
+
+"""
+Endpoint benchmarks with query-count and latency regression checks.
+
+Each scenario drives one API endpoint (or a write and its undo, so it can be
+repeated) through the test client against whatever data is in the database,
+typically a dataset from `python manage.py generate_dataset`. For every
+scenario the SQL query count and the latency percentiles are recorded.
+
+Query counts must not grow at all (an N+1 in a serializer shows up as soon as
+a page has more than one row). They don't depend on the machine, so they are
+committed, in benchmark_queries.json, and checked by the test suite too:
+
+    python manage.py benchmark_endpoints                        # check
+    python manage.py benchmark_endpoints --write-query-counts   # accept current counts
+
+Latency only means something on the machine and dataset it was measured on,
+so a latency baseline is a local file, compared only when one is given; p95
+may grow up to the tolerance:
+
+    python manage.py benchmark_endpoints --write-baseline before.json
+    python manage.py benchmark_endpoints --baseline before.json
+
+Every file records the row counts of the dataset it was measured against
+(describe_dataset), and a latency baseline from a different dataset is
+refused.
+
+Requests authenticate with a token header, like real clients. Each scenario
+runs in its own transaction (a savepoint when already in one) that is rolled
+back, so its writes are undone, and the on_commit callbacks of every request
+run when the request returns, as they would after a real commit.
+"""
+
+import json
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from accounts.authentication import invalidate_user
+from accounts.models import CustomUser, Follow
+from notifications.models import Notification
+from posts.models import Comment, Like, Post
+
+QUERY_COUNTS_PATH = Path(__file__).with_name('benchmark_queries.json')
+
+Scenario = namedtuple('Scenario', ['name', 'user', 'run'])
+Fixtures = namedtuple('Fixtures', ['viewer', 'recipient', 'post', 'target'])
+
+
+def pick_fixtures():
+    """
+    Representative rows from the current data: the user following the most
+    accounts, the user with the most notifications, the most commented post
+    the viewer hasn't liked, and an account the viewer doesn't follow.
+    """
+    viewer = CustomUser.objects.order_by('-following_count', 'pk').first()
+    if viewer is None:
+        raise ValueError('No users to benchmark with; run generate_dataset first.')
+
+    top_recipient = (
+        Notification.objects.order_by().values('recipient')
+        .annotate(total=Count('pk')).order_by('-total', 'recipient').first()
+    )
+    recipient = CustomUser.objects.get(pk=top_recipient['recipient']) if top_recipient else viewer
+    post = (
+        Post.objects.exclude(author=viewer).exclude(likes__user=viewer)
+        .order_by('-comment_count', '-like_count', 'pk').first()
+    )
+    target = (
+        CustomUser.objects.exclude(pk=viewer.pk).exclude(pk__in=list(viewer.get_following()))
+        .order_by('pk').first()
+    )
+    if post is None or target is None:
+        raise ValueError('The dataset is too small to benchmark every endpoint.')
+    return Fixtures(viewer, recipient, post, target)
+
+
+def expect(response, status_code):
+    if response.status_code != status_code:
+        raise AssertionError(f'{response.request["PATH_INFO"]}: expected {status_code}, got {response.status_code}')
+    return response
+
+
+def get_scenarios(fixtures):
+    viewer, recipient, post, target = fixtures
+
+    def get(url, **params):
+        return lambda client: expect(client.get(url, params, secure=True), 200)
+
+    def like_unlike(client):
+        expect(client.post(reverse('post-like', args=[post.pk]), secure=True), 201)
+        expect(client.delete(reverse('post-unlike', args=[post.pk]), secure=True), 204)
+
+    def follow_unfollow(client):
+        expect(client.post(reverse('follow-user', args=[target.pk]), secure=True), 201)
+        expect(client.delete(reverse('unfollow-user', args=[target.pk]), secure=True), 204)
+
+    return [
+        Scenario('feed', viewer, get(reverse('user-feed'))),
+        Scenario('feed_ranked', viewer, get(reverse('user-feed'), mode='ranked')),
+        Scenario('post_list', viewer, get(reverse('post-list'))),
+        Scenario('post_list_sparse', viewer, get(reverse('post-list'), fields='id,title,author,has_liked')),
+        Scenario('post_detail', viewer, get(reverse('post-detail', args=[post.pk]))),
+        Scenario('comments', viewer, get(reverse('post-comments-list', kwargs={'post_pk': post.pk}))),
+        Scenario('like_unlike', viewer, like_unlike),
+        Scenario('follow_unfollow', viewer, follow_unfollow),
+        Scenario('notifications', recipient, get(reverse('notification-list'))),
+        Scenario('recommendations', viewer, get(reverse('follow-recommendations'))),
+    ]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+@contextmanager
+def committing_callbacks():
+    """
+    Run the on_commit callbacks registered inside the block when it exits,
+    including ones registered by those callbacks, as a commit would (the
+    transaction itself stays open).
+    """
+    start = len(connection.run_on_commit)
+    yield
+    while start < len(connection.run_on_commit):
+        end = len(connection.run_on_commit)
+        for _, callback, _ in connection.run_on_commit[start:end]:
+            callback()
+        start = end
+
+
+def run_scenario(scenario, iterations, warmup=1):
+    with transaction.atomic():
+        try:
+            return measure(scenario, iterations, warmup)
+        finally:
+            transaction.set_rollback(True)
+            # The token below is rolled back; make whatever was cached for it stale
+            invalidate_user(scenario.user.pk)
+
+
+def measure(scenario, iterations, warmup):
+    token, _ = Token.objects.get_or_create(user=scenario.user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def request():
+        with committing_callbacks():
+            scenario.run(client)
+
+    # Warm-up runs fill the caches the endpoint relies on, so the numbers
+    # describe the steady state
+    for _ in range(warmup):
+        request()
+
+    timings, queries = [], 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(context.captured_queries))
+
+    timings.sort()
+    return {
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+    }
+
+
+def run_benchmarks(iterations=20, names=None):
+    """Return {scenario name: {'queries', 'p50_ms', 'p95_ms', 'p99_ms'}}."""
+    # Everything runs in this one process, so even a local-memory cache is
+    # shared and the counts describe a deployment with a shared cache
+    with override_settings(CACHES_SINGLE_PROCESS=True):
+        return {
+            scenario.name: run_scenario(scenario, iterations)
+            for scenario in get_scenarios(pick_fixtures())
+            if names is None or scenario.name in names
+        }
+
+
+def describe_dataset():
+    """Row counts of the data the benchmarks run against."""
+    return {
+        'users': CustomUser.objects.count(),
+        'follows': Follow.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'likes': Like.objects.count(),
+        'notifications': Notification.objects.count(),
+    }
+
+
+def load_baseline(path):
+    """(dataset, {scenario name: result}) stored in `path`; empty if there is no file."""
+    path = Path(path)
+    if not path.exists():
+        return {}, {}
+    stored = json.loads(path.read_text())
+    return stored['dataset'], stored['scenarios']
+
+
+def write_baseline(dataset, results, path):
+    stored = {'dataset': dataset, 'scenarios': results}
+    Path(path).write_text(json.dumps(stored, indent=2, sort_keys=True) + '\n')
+
+
+def find_regressions(results, baseline, latency_tolerance=None):
+    """
+    Messages for every scenario whose query count went up, or whose p95 grew
+    beyond `latency_tolerance` times the baseline (None skips latency).
+    Scenarios missing from the baseline are not regressions.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries (baseline {expected['queries']})")
+        if latency_tolerance is not None and result['p95_ms'] > expected['p95_ms'] * latency_tolerance:
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms (baseline {expected['p95_ms']}ms)")
+    return regressions
@@ -0,0 +1,25 @@
+# social_media_api/caching.py
+
+"""
+Which cache aliases every process of the deployment sees.
+
+Version keys, token snapshots and feed snapshots only stay coherent across
+workers when they live in a shared backend (Redis, Memcached, database or
+file). LocMemCache is private to its process and DummyCache keeps nothing,
+so both only count as shared when CACHES_SINGLE_PROCESS says the project
+runs in one process (runserver, a single worker, the test suite).
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias):
+    """True if writes to cache `alias` are visible to every process."""
+    if getattr(settings, 'CACHES_SINGLE_PROCESS', False):
+        return True
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
@@ -0,0 +1,78 @@
+# social_media_api/fieldsets.py
+
+"""
+Sparse fieldsets (?fields=) and relation expansion (?expand=) for the API.
+
+    GET /api/posts/?fields=id,title,author
+    GET /api/feed/?expand=author
+
+The view mixin reads the query parameters and hands them to the serializer,
+which drops unrequested fields and swaps compact nested serializers for their
+full versions. Views use wants_field()/is_expanded() to skip joins,
+annotations and prefetches that the response won't render.
+"""
+
+from rest_framework import permissions
+
+
+def parse_field_list(value):
+    """Turn 'id, title,author' into {'id', 'title', 'author'}."""
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Serializer mixin accepting `fields` and `expand` keyword arguments.
+
+    `expandable_fields` maps a field name to the serializer class used when the
+    client asks for ?expand=<name>; otherwise the compact declared field is kept.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expand = set(expand or ())
+
+        for name in self.expand & set(self.expandable_fields):
+            if name in self.fields:
+                self.fields[name] = self.expandable_fields[name](read_only=True)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    View mixin passing ?fields= and ?expand= to the serializer on read requests.
+    Writes keep the full serializer so every input field is still accepted.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_sparse_fields(self):
+        """Requested field names, or None when the client wants every field."""
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return parse_field_list(value)
+
+    def get_expand(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return set()
+        return parse_field_list(self.request.query_params.get(self.expand_query_param, ''))
+
+    def wants_field(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def is_expanded(self, name):
+        return self.wants_field(name) and name in self.get_expand()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method in permissions.SAFE_METHODS:
+            kwargs.setdefault('fields', self.get_sparse_fields())
+            kwargs.setdefault('expand', self.get_expand())
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,295 @@
+# social_media_api/pagination.py
+
+"""
+Keyset (seek) pagination shared by the posts and notifications apps.
+
+Instead of OFFSET + COUNT(*), each page is fetched with a WHERE clause on the
+ordering columns of the last row the client saw, e.g. for ('-created_at', '-id'):
+
+    WHERE created_at < :created_at OR (created_at = :created_at AND id < :id)
+
+so page 500 costs the same index range scan as page 1, and rows inserted while
+a client is scrolling never shift the pages it hasn't read yet.
+
+Orders with no stable key to seek on (a ranked feed, whose scores drift
+between requests) use SnapshotPagination instead: the ordered ids are
+computed once per scroll and kept in FEED_SNAPSHOT_CACHE_ALIAS, and cursors
+point into that list. The next page may be served by another worker, so the
+alias must be shared between processes (Redis or Memcached, not the
+local-memory default); with a process-local one, cursors answered by a
+different process look expired.
+"""
+
+import base64
+import binascii
+import json
+import secrets
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Build (a < x) OR (a = x AND b < y) ... for the ordering columns, flipping
+    the comparison for ascending fields and for backwards (previous) pages.
+    """
+    keyset = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        lookup = 'lt' if descending else 'gt'
+        keyset |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return keyset
+
+
+def reversed_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique, indexed ordering such as (created_at, id).
+    The last field of `ordering` must be unique (the primary key) so ties on the
+    earlier fields are broken deterministically.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, reading the page with the async ORM."""
+        return self.finish_page([row async for row in self.page_queryset(queryset, request)])
+
+    def paginate_keyset(self, fetch, model, request):
+        """
+        paginate_queryset() for pages that aren't read from a single queryset
+        (e.g. the merged home feed). fetch(values, reverse, limit) returns up
+        to `limit` rows strictly after the cursor position `values` (None on
+        the first page) in `ordering`, or in the reverse order if `reverse`;
+        rows have attributes named like the ordering fields of `model`.
+        """
+        values = self.start_page(model, request)
+        # One extra row tells whether there is another page
+        return self.finish_page(list(fetch(values, self.reverse, self.page_size + 1)))
+
+    def start_page(self, model, request):
+        """Read the page size and cursor; returns the cursor values, or None."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        self.reverse = False
+        if self.cursor is None:
+            return None
+        self.reverse, raw_values = self.cursor
+        return self.get_cursor_values(model, raw_values)
+
+    def page_queryset(self, queryset, request):
+        values = self.start_page(queryset.model, request)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(values, self.reverse))
+
+        ordering = self.get_reversed_ordering() if self.reverse else self.ordering
+        # Fetch one extra row to know whether there is another page, no COUNT(*) needed
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def finish_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.build_link(self.page[0], reverse=True)
+
+    def build_link(self, instance, reverse):
+        url = self.request.build_absolute_uri()
+        values = [self.get_field_value(instance, field) for field in self.get_field_names()]
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    # --- Cursor helpers ---
+
+    def get_field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_reversed_ordering(self):
+        return reversed_ordering(self.ordering)
+
+    def get_field_value(self, instance, name):
+        value = getattr(instance, name)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def get_keyset_filter(self, values, reverse):
+        return keyset_filter(self.ordering, values, reverse)
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'r': int(reverse), 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            reverse = bool(payload['r'])
+            raw_values = list(payload['v'])
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(raw_values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, raw_values
+
+    def get_cursor_values(self, model, raw_values):
+        # Cursors only ever hold ISO strings and integer ids; anything else
+        # (numbers for dates, lists, bools) was not made by build_link()
+        if any(isinstance(value, bool) or not isinstance(value, (str, int)) for value in raw_values):
+            raise NotFound(self.invalid_cursor_message)
+
+        # Convert the JSON values back to Python (e.g. ISO strings to datetimes),
+        # checked against the column's range
+        values = []
+        try:
+            for name, value in zip(self.get_field_names(), raw_values):
+                field = model._meta.get_field(name)
+                value = field.to_python(value)
+                field.run_validators(value)
+                values.append(value)
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if any(value is None for value in values):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+
+class NotificationKeysetPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class SnapshotPagination(KeysetPagination):
+    """
+    Pages over a list of ids computed on the first page and stored in
+    FEED_SNAPSHOT_CACHE_ALIAS for `snapshot_timeout` seconds. The cursor holds the snapshot's
+    token and an offset into it, so later pages neither repeat nor skip ids
+    however the order would come out if it were computed again. A cursor
+    whose snapshot has expired is answered with 404.
+    """
+    # The cursor's two values
+    ordering = ('snapshot', 'offset')
+    snapshot_timeout = 600
+    expired_cursor_message = 'This feed page has expired; start again from the first page.'
+
+    def get_cache(self):
+        return caches[getattr(settings, 'FEED_SNAPSHOT_CACHE_ALIAS', 'default')]
+
+    def paginate_snapshot(self, compute, scope, request):
+        """
+        The ids on the requested page. compute() returns the full ordered id
+        list; `scope` (e.g. the user id) keeps each user's snapshots apart.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = False
+
+        if self.cursor is None:
+            self.token, self.offset = secrets.token_urlsafe(12), 0
+            ids = list(compute())
+            self.get_cache().set(self.snapshot_key(scope), ids, timeout=self.snapshot_timeout)
+        else:
+            _, (self.token, self.offset) = self.cursor
+            if not isinstance(self.token, str) or isinstance(self.offset, bool) \
+                    or not isinstance(self.offset, int) or self.offset < 0:
+                raise NotFound(self.invalid_cursor_message)
+            ids = self.get_cache().get(self.snapshot_key(scope))
+            if ids is None:
+                raise NotFound(self.expired_cursor_message)
+
+        self.has_next = self.offset + self.page_size < len(ids)
+        self.has_previous = self.offset > 0
+        self.page = ids[self.offset:self.offset + self.page_size]
+        return self.page
+
+    def snapshot_key(self, scope):
+        return f'pagination:snapshot:{scope}:{self.token}'
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.build_offset_link(self.offset + self.page_size)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.build_offset_link(max(self.offset - self.page_size, 0))
+
+    def build_offset_link(self, offset):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor([self.token, offset], False))
@@ -0,0 +1,36 @@
+# social_media_api/parsers.py
+
+"""
+Newline-delimited JSON request bodies (application/x-ndjson), one JSON
+object per line, as written by most export tools.
+
+request.data is a generator over the objects rather than a list: each line
+is decoded as the view consumes it, so an upload is never held in memory
+as a whole. It can only be iterated once.
+"""
+
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return self.iter_objects(stream, encoding)
+
+    def iter_objects(self, stream, encoding):
+        if stream is None:
+            return
+        for number, line in enumerate(iter(stream.readline, b''), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode(encoding))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
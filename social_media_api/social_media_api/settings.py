@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,20 +61,62 @@ X_FRAME_OPTIONS = 'DENY'
 SECURE_BROWSER_XSS_FILTER = True
 
 # Config REST Framework settings
-REST_FREAMWORK = {
+# (Spelled REST_FREAMWORK, and so ignored, until the keyset pagination change.
+# Since then: token-only authentication, no session/basic auth; IsAuthenticated
+# for any view without its own permission_classes, every view sets its own
+# today; and PageNumberPagination for lists without a pagination_class.)
+REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication with a cached token -> user lookup (accounts/authentication.py)
+        'accounts.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     # Add Pagination Configuration
+    # Feed, post and notification lists override this with keyset pagination
+    # (social_media_api/pagination.py), which avoids COUNT(*) and OFFSET scans
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10, # Set a default page size
     
 }
+
+# Home feed fan-out settings (see posts/timeline.py)
+# Authors with more followers than this are read with fan-out-on-read instead
+FEED_FANOUT_LIMIT = 5000
+FEED_FANOUT_BATCH_SIZE = 1000
+# Number of recent posts copied into a timeline when a user follows someone
+FEED_BACKFILL_LIMIT = 100
+
+# Ranked feed, ?mode=ranked (see posts/ranking.py)
+FEED_RANKING_CANDIDATES = 500
+FEED_RANKING_SCORER = 'posts.ranking.DefaultScorer'
+FEED_RANKING_HALF_LIFE_HOURS = 12
+FEED_RANKING_WEIGHTS = {'recency': 1.0, 'velocity': 0.5, 'affinity': 0.3}
+# Seconds a ranking is kept for paging through it, in this alias; it must be
+# shared between processes, or a page served by another worker reads as expired
+FEED_RANKING_SNAPSHOT_TTL = 600
+FEED_SNAPSHOT_CACHE_ALIAS = 'default'
+# Windows used by `python manage.py refresh_feed_features`
+FEED_VELOCITY_WINDOW_HOURS = 24
+FEED_AFFINITY_WINDOW_DAYS = 30
+
+# Number of newest comments embedded in each serialized post
+POST_COMMENT_PREVIEW_SIZE = 3
+
+# Bulk import, POST /api/posts/bulk/ (see posts/bulk.py): posts per INSERT
+# and per request
+POST_BULK_BATCH_SIZE = 500
+POST_BULK_MAX_ITEMS = 10000
+
+# Rows read per query by the streaming export (see posts/export.py)
+EXPORT_CHUNK_SIZE = 2000
 MIDDLEWARE = [
+    # Outermost, so latency covers the whole stack (see observability/metrics.py)
+    'observability.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Sampled per-request SQL profiling (see observability/profiling.py)
+    'observability.profiling.SQLProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -116,6 +160,84 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set REDIS_URL (e.g. redis://127.0.0.1:6379/0) to use
+# Redis or any server speaking the Redis protocol
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'social-media-api',
+        }
+    }
+
+# The per-process caches below keep their invalidation versions in a cache
+# alias and are switched off unless that alias is shared between processes
+# (see social_media_api/caching.py). Set CACHES_SINGLE_PROCESS=1 when running
+# a single process, e.g. runserver, to let them use the local-memory cache.
+CACHES_SINGLE_PROCESS = os.environ.get('CACHES_SINGLE_PROCESS') == '1'
+
+# SQL profiling: fraction of requests profiled (0 turns it off), and how many
+# repeats of one query shape in a request are reported as a likely N+1
+SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('SQL_PROFILING_SAMPLE_RATE', 0))
+SQL_PROFILING_N_PLUS_ONE_THRESHOLD = 5
+SQL_PROFILING_LOGGER = 'social_media_api.sql'
+
+# Clients allowed to scrape /metrics/ (None allows everyone)
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Serialized post payloads (see posts/cache.py)
+POST_CACHE_ALIAS = 'default'
+POST_CACHE_TIMEOUT = 300
+
+# Like counts (see posts/likes.py): served from this alias and written to
+# Post.like_count in batches by a background thread ('background') or right
+# after each like ('sync')
+LIKE_COUNTER_ALIAS = 'default'
+LIKE_COUNTER_TIMEOUT = 300
+LIKE_COUNTER_FLUSH = 'background'
+LIKE_COUNTER_FLUSH_INTERVAL = 1.0
+
+# Per-process follow graph (see accounts/cache.py): versions live in this
+# alias, which must be shared for the local arrays to be used; each array is
+# kept at most FOLLOW_GRAPH_CACHE_TTL seconds
+FOLLOW_GRAPH_CACHE_ALIAS = 'default'
+FOLLOW_GRAPH_CACHE_SIZE = 10000
+FOLLOW_GRAPH_CACHE_TTL = 300
+
+# Token -> user snapshots for CachedTokenAuthentication: per-process LRU
+# entries live at most AUTH_TOKEN_CACHE_TTL seconds, shared ones in this alias.
+# With a process-local alias it behaves like plain TokenAuthentication
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_CACHE_SIZE = 10000
+
+# "Who to follow" candidates stored per user by `python manage.py compute_recommendations`
+RECOMMENDATION_TOP_K = 20
+
+# Notification pipeline (see notifications/pipeline.py): 'outbox' rows are
+# processed by `python manage.py process_notifications`
+NOTIFICATION_PIPELINE = 'outbox'
+NOTIFICATION_BATCH_SIZE = 500
+# Push channels (notifications/streams.py): how often a waiting connection
+# re-checks the database, how long one SSE response stays open, and how long
+# a ?ticket= from /notifications/stream/ticket/ is accepted
+NOTIFICATION_STREAM_POLL_INTERVAL = 15
+NOTIFICATION_STREAM_MAX_SECONDS = 300
+NOTIFICATION_STREAM_TICKET_MAX_AGE = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -135,6 +257,33 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing policy (see accounts/hashers.py): new hashes use
+# PASSWORD_HASH_ALGORITHM at the PASSWORD_HASH_COSTS cost (measure with
+# `python manage.py calibrate_password_hashers`); the other hashers only
+# verify old hashes, which are upgraded after login ('background', 'sync' or 'off')
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM') or ('argon2' if find_spec('argon2') else 'pbkdf2')
+PASSWORD_HASH_COSTS = {
+    'argon2': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8},
+    'bcrypt': {'rounds': 12},
+    'pbkdf2': {'iterations': 1_000_000},
+}
+_POLICY_HASHERS = {
+    'argon2': 'accounts.hashers.Argon2PasswordHasher',
+    'bcrypt': 'accounts.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'accounts.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _POLICY_HASHERS[PASSWORD_HASH_ALGORITHM],
+    *(path for name, path in _POLICY_HASHERS.items() if name != PASSWORD_HASH_ALGORITHM),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_REHASH = 'deferred'
+
+# Verifies without re-hashing inline; outdated hashes go to PASSWORD_REHASH
+AUTHENTICATION_BACKENDS = ['accounts.backends.RehashingModelBackend']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -0,0 +1,208 @@
+import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from accounts.cache import follow_graph
+from accounts.models import CustomUser
+from posts.likes import buffer as like_buffer
+from posts.models import Post
+from posts.cache import reset_cache_stats
+from observability.metrics import Histogram, registry, render_metrics
+from observability.profiling import QueryProfile, fingerprint
+
+from . import benchmarks
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EndpointQueryCountTests(APITestCase):
+    """
+    Every benchmark scenario stays within the query count recorded in
+    benchmark_queries.json, against this dataset. Run
+    `manage.py benchmark_endpoints --write-query-counts` on it after an
+    intentional change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_dataset', '--users', '40', '--posts-per-user', '3', '--likes-per-post', '4',
+            '--timelines', '--seed', '11', stdout=StringIO()
+        )
+        call_command('compute_recommendations', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        reset_cache_stats()
+
+    def test_query_counts_match_the_baseline(self):
+        dataset, baseline = benchmarks.load_baseline(benchmarks.QUERY_COUNTS_PATH)
+        # Requests run their on_commit callbacks; keep the like deltas in the buffer
+        with mock.patch('posts.likes.start_flusher'):
+            results = benchmarks.run_benchmarks(iterations=2)
+        like_buffer.take()
+
+        self.assertEqual(dataset, benchmarks.describe_dataset(), 'Query counts were recorded on another dataset')
+        self.assertEqual(set(results), set(baseline), 'Scenarios and baseline are out of sync')
+        self.assertEqual(benchmarks.find_regressions(results, baseline), [])
+
+    def test_latency_is_only_compared_with_a_given_baseline(self):
+        options = {'iterations': 1, 'scenario': ['post_detail'], 'stdout': StringIO()}
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'latency.json'
+            dataset = dict(benchmarks.describe_dataset(), users=1)
+            benchmarks.write_baseline(dataset, {'post_detail': {'queries': 99, 'p95_ms': 0.0}}, path)
+            # Without --baseline only the committed query counts are checked
+            call_command('benchmark_endpoints', **options)
+
+            with self.assertRaisesMessage(CommandError, 'different dataset'):
+                call_command('benchmark_endpoints', baseline=str(path), **options)
+            benchmarks.write_baseline(benchmarks.describe_dataset(), {'post_detail': {'queries': 99, 'p95_ms': 0.0}}, path)
+            with self.assertRaisesMessage(CommandError, 'post_detail: p95'):
+                call_command('benchmark_endpoints', baseline=str(path), **options)
+
+    def test_regressions_are_reported(self):
+        baseline = {'feed': {'queries': 2, 'p95_ms': 10.0}}
+        results = {
+            'feed': {'queries': 3, 'p50_ms': 5.0, 'p95_ms': 20.0, 'p99_ms': 25.0},
+            'new_scenario': {'queries': 9, 'p50_ms': 1.0, 'p95_ms': 1.0, 'p99_ms': 1.0},
+        }
+        self.assertEqual(benchmarks.find_regressions(results, baseline), ['feed: 3 queries (baseline 2)'])
+        self.assertEqual(len(benchmarks.find_regressions(results, baseline, latency_tolerance=1.5)), 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SQLProfilingMiddlewareTests(APITestCase):
+    """
+    Sampled requests get Server-Timing headers and N+1 warnings.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='profiled', password='pass12345')
+        Post.objects.create(author=self.user, title='One', content='Body')
+        self.client.force_authenticate(user=self.user)
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s) AND name = 'y' LIMIT 3"),
+        )
+
+    def test_repeated_shapes_are_flagged(self):
+        profile = QueryProfile()
+        for post_id in range(6):
+            profile.record(f'SELECT * FROM posts_post WHERE id = {post_id}', 0.001)
+        profile.record('SELECT 1', 0.001)
+
+        self.assertEqual(list(profile.n_plus_one(threshold=5).values()), [6])
+        self.assertEqual(profile.n_plus_one(threshold=7), {})
+        # The first instance was recorded together with the project frames issuing it
+        self.assertTrue(any('tests.py' in frame for frame in profile.stacks['SELECT * FROM posts_post WHERE id = ?']))
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=1.0, SQL_PROFILING_N_PLUS_ONE_THRESHOLD=1)
+    def test_sampled_request_reports_timing_and_logs(self):
+        with self.assertLogs('social_media_api.sql', level='INFO') as logs:
+            response = self.client.get(reverse('post-list'), {'fields': 'id,title'})
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        profile = logs.records[0].sql_profile
+        self.assertEqual(profile['view'], 'post-list')
+        self.assertGreater(profile['queries'], 0)
+        # With a threshold of 1 every shape is reported as a suspect
+        self.assertTrue(any(hasattr(record, 'sql_n_plus_one') for record in logs.records))
+
+    def test_unsampled_request_has_no_header(self):
+        response = self.client.get(reverse('post-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SQL_PROFILING_SAMPLE_RATE=1.0)
+    async def test_async_views_count_queries_from_worker_threads(self):
+        key = (await Token.objects.acreate(user=self.user)).key
+        response = await self.async_client.get(
+            reverse('notification-poll'), {'timeout': 0}, headers={'authorization': f'Token {key}'}
+        )
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MetricsTests(APITestCase):
+    """
+    Requests are counted per URL name and exposed at /metrics/.
+    """
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        registry.reset()
+        self.user = CustomUser.objects.create_user(username='measured', password='pass12345')
+        Post.objects.create(author=self.user, title='One', content='Body')
+        self.client.force_authenticate(user=self.user)
+
+    def test_histogram_buckets_are_cumulative_in_the_exposition(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 3, 3, 9):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2])
+        self.assertEqual((histogram.sum, histogram.count), (15, 4))
+
+        registry.shard().queries['post-list'] = histogram
+        body = render_metrics()
+        self.assertIn('db_queries_per_request_bucket{view="post-list",le="5"} 3', body)
+        self.assertIn('db_queries_per_request_bucket{view="post-list",le="+Inf"} 4', body)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse('post-list'))
+        self.client.get(reverse('post-list'))
+        self.client.get(reverse('user-feed'))
+        self.client.get('/api/does-not-exist/')
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_requests_total{view="post-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_requests_total{view="<unmatched>",method="GET",status="404"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{view="user-feed"} 1', body)
+        self.assertRegex(body, r'db_queries_per_request_sum\{view="post-list"\} [1-9]')
+        # The feed looked up the follow graph, and that lookup is charged to it
+        self.assertIn('cache_lookups_total{cache="follow_graph",view="user-feed",result="miss"} 1', body)
+        self.assertIn('cache_hit_ratio{cache="post_payload"}', body)
+
+    def test_threads_record_into_their_own_shards(self):
+        def work():
+            registry.shard().requests['post-list', 'GET', 200] += 1
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(registry.snapshot().requests['post-list', 'GET', 200], 4)
+
+    def test_finished_threads_are_folded_into_the_base_shard(self):
+        def work():
+            registry.shard().requests['post-list', 'GET', 200] += 1
+
+        for _ in range(20):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        registry.shard()
+
+        # Only this (live) thread keeps a shard; the finished ones' counts survive
+        self.assertEqual(len(registry._shards), 1)
+        self.assertEqual(registry.snapshot().requests['post-list', 'GET', 200], 20)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_scrapes_are_limited_to_allowed_clients(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
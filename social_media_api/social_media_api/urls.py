@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from observability.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Route all authentication requests to the accounts app
@@ -26,4 +28,7 @@ urlpatterns = [
 
     path('notifications/', include('notifications.urls')),
 
+    # Prometheus scrape target
+    path('metrics/', metrics_view, name='metrics'),
+
 ]